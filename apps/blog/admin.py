@@ -11,6 +11,7 @@ from .models import (
     PostLike,
     PostShare,
     PostView,
+    FlaggedInteraction,
 )
 
 
@@ -99,6 +100,16 @@ class PostInteractionAdmin(admin.ModelAdmin):
     post_title.short_description = 'Post Title'
 
 
+@admin.register(FlaggedInteraction)
+class FlaggedInteractionAdmin(admin.ModelAdmin):
+    list_display = ('post', 'user', 'ip_address', 'interaction_type', 'count', 'created_at', 'reviewed')
+    search_fields = ('user__username', 'post__title', 'ip_address')
+    list_filter = ('interaction_type', 'reviewed', 'created_at')
+    ordering = ('-created_at',)
+    readonly_fields = ('id', 'post', 'user', 'ip_address', 'interaction_type', 'count', 'window_seconds', 'created_at')
+    list_editable = ('reviewed',)
+
+
 admin.site.register(PostLike)
 admin.site.register(PostView)
 admin.site.register(PostShare)
@@ -0,0 +1,133 @@
+import time
+
+from django.conf import settings
+from core.redis_pool import get_redis_client
+
+
+redis_client = get_redis_client()
+
+# Interactions are counted per type, actor (user or ip) and post in ANOMALY_BUCKETS buckets
+# that together span ANOMALY_WINDOW seconds:
+#   anomaly:<type>:<actor>:<post>:<bucket> -> count
+# The window total is one MGET over a fixed number of keys, whatever the traffic. Each
+# interaction lands in the bucket of its own timestamp, however late it is ingested.
+ANOMALY_WINDOW = getattr(settings, 'BLOG_ANOMALY_WINDOW', 60 * 10)
+ANOMALY_BUCKETS = 10
+BUCKET_SECONDS = max(ANOMALY_WINDOW // ANOMALY_BUCKETS, 1)
+
+# Interactions allowed per actor and post within the window, None disables a type
+ANOMALY_THRESHOLDS = {
+    'view': 50,
+    'like': 10,
+    'comment': 30,
+    'share': 20,
+    **getattr(settings, 'BLOG_ANOMALY_THRESHOLDS', {}),
+}
+
+
+def _actors(user_id=None, ip_address=None):
+    actors = []
+    if user_id:
+        actors.append(f'user:{user_id}')
+    if ip_address:
+        actors.append(f'ip:{ip_address}')
+    return actors
+
+
+def _bucket(timestamp=None):
+    # Timestamps ahead of the clock count as now
+    now = time.time()
+    return int(min(timestamp.timestamp() if timestamp else now, now) // BUCKET_SECONDS)
+
+
+def _bucket_keys(interaction_type, actor, post_id, now_bucket):
+    prefix = f'anomaly:{interaction_type}:{actor}:{post_id}'
+    return [f'{prefix}:{bucket}' for bucket in range(now_bucket - ANOMALY_BUCKETS + 1, now_bucket + 1)]
+
+
+def track_interactions(interaction_type, interactions):
+    """
+    Counts interactions, given as [(post_id, user_id, ip_address, timestamp)], in
+    one round trip. Each is counted in the window ending at its own timestamp,
+    ones older than ANOMALY_WINDOW are ignored. Every actor that goes over the
+    threshold of the type is recorded once per window as a FlaggedInteraction.
+    Returns the new flags.
+    """
+    threshold = ANOMALY_THRESHOLDS.get(interaction_type)
+
+    if threshold is None or not interactions:
+        return []
+
+    oldest_bucket = _bucket() - ANOMALY_BUCKETS + 1
+    pipe = redis_client.pipeline(transaction=False)
+    checks = []
+
+    for post_id, user_id, ip_address, timestamp in interactions:
+        bucket = _bucket(timestamp)
+        if bucket < oldest_bucket:
+            continue
+
+        for actor in _actors(user_id, ip_address):
+            keys = _bucket_keys(interaction_type, actor, post_id, bucket)
+            pipe.incr(keys[-1])
+            # Until the bucket leaves the last window it is part of
+            pipe.expireat(keys[-1], (bucket + ANOMALY_BUCKETS + 1) * BUCKET_SECONDS)
+            pipe.mget(keys)
+            checks.append((post_id, user_id, ip_address, actor))
+
+    if not checks:
+        return []
+
+    results = pipe.execute()
+
+    over_threshold = []
+    for index, check in enumerate(checks):
+        total = sum(int(count) for count in results[index * 3 + 2] if count)
+        if total > threshold:
+            over_threshold.append((*check, total))
+
+    return _flag(interaction_type, over_threshold)
+
+
+def _flag(interaction_type, over_threshold):
+    from .models import FlaggedInteraction
+
+    if not over_threshold:
+        return []
+
+    # One flag per actor, post and type while the window lasts
+    pipe = redis_client.pipeline(transaction=False)
+    for post_id, _, _, actor, _ in over_threshold:
+        pipe.set(f'anomaly:flagged:{interaction_type}:{actor}:{post_id}', 1, nx=True, ex=ANOMALY_WINDOW)
+
+    flags = [
+        FlaggedInteraction(
+            post_id=post_id,
+            user_id=user_id if actor.startswith('user:') else None,
+            ip_address=ip_address if actor.startswith('ip:') else None,
+            interaction_type=interaction_type,
+            count=total,
+            window_seconds=ANOMALY_WINDOW,
+        )
+        for (post_id, user_id, ip_address, actor, total), is_new in zip(over_threshold, pipe.execute())
+        if is_new
+    ]
+
+    return FlaggedInteraction.objects.bulk_create(flags)
+
+
+def get_interaction_rate(interaction_type, post_id, user_id=None, ip_address=None):
+    """
+    The highest count within the window among the actors of one interaction.
+    """
+    now_bucket = _bucket()
+    actors = _actors(user_id, ip_address)
+
+    if not actors:
+        return 0
+
+    pipe = redis_client.pipeline(transaction=False)
+    for actor in actors:
+        pipe.mget(_bucket_keys(interaction_type, actor, post_id, now_bucket))
+
+    return max(sum(int(count) for count in counts if count) for counts in pipe.execute())
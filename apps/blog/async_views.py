@@ -0,0 +1,220 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from rest_framework.exceptions import NotFound, APIException
+
+from core.permissions import HasValidAPIKey
+from core.views import AsyncStandardAPIView
+
+from .models import Post, Category
+from .serializers import PostListSerializer, CategoryListSerializer, CommentSerializer, comment_list_queryset
+from .utils import get_client_ip
+from .pagination import KeysetPaginationMixin
+from .search import search_posts
+from .trending import trending_posts, TRENDING_CACHE_TIMEOUT
+from .impressions import arecord_post_impressions, arecord_category_impressions
+from .listing_cache import alisting_cache_key, aget_cached_listing, acache_listing, listing_response, LISTING_CACHE_TIMEOUT
+from .conditional import make_etag, set_validators, conditional_response
+from .tasks import refresh_post_detail_cache
+from .view_events import aemit_view_event
+from .detail_cache import (
+    aget_post_detail_version,
+    aget_cached_post_detail,
+    aclaim_post_detail_refresh,
+    aget_post_detail_counters,
+    apost_detail_overlay,
+    refresh_post_detail,
+)
+from .views import COMMENTS_ORDERING, filter_post_list, order_post_list, order_category_list
+
+
+# Coroutine versions of the read endpoints served under ASGI, see BLOG_ASYNC_VIEWS in urls.py.
+# Responses, caching and validators match the sync views; Redis goes through the asyncio client
+# and impressions and view events are recorded alongside the rest of the request.
+
+
+class AsyncPostListView(KeysetPaginationMixin, AsyncStandardAPIView):
+    permission_classes = [HasValidAPIKey]
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            search = request.query_params.get("search", "").strip()
+            sorting = request.query_params.get("sorting", None)
+            ordering = request.query_params.get("ordering", None)
+            author = request.query_params.get("author", None)
+            categories = request.query_params.getlist("category", [])
+
+            cache_key = await alisting_cache_key('post_list', request)
+            cached_listing = await aget_cached_listing(cache_key)
+
+            if cached_listing:
+                content, post_ids, built_at = cached_listing
+                await arecord_post_impressions(post_ids)
+                return listing_response(request, content, built_at)
+
+            posts = Post.postobjects.all().select_related("category", "post_analytics")
+
+            if not await posts.aexists():
+                raise NotFound(detail='No posts found.')
+
+            if search != "":
+                posts = await sync_to_async(search_posts)(posts, search)
+
+            if sorting == 'trending':
+                posts = await sync_to_async(trending_posts)(posts)
+
+            posts = filter_post_list(posts, author, categories)
+            posts, keyset_ordering = order_post_list(posts, search, sorting, ordering)
+
+            page = await self.akeyset_paginate(request, posts, PostListSerializer, keyset_ordering)
+            post_ids = [post['id'] for post in page['results']]
+
+            (content, _, built_at), _ = await asyncio.gather(
+                acache_listing(
+                    cache_key, self.paginated_response(page).data, post_ids,
+                    timeout=TRENDING_CACHE_TIMEOUT if sorting == 'trending' else LISTING_CACHE_TIMEOUT,
+                ),
+                arecord_post_impressions(post_ids),
+            )
+
+            return listing_response(request, content, built_at)
+
+        except Post.DoesNotExist:
+            raise NotFound(detail='No posts found.')
+        except NotFound:
+            raise
+        except Exception as e:
+            raise APIException(detail=f'An unexpected error ocurreed: {str(e)}')
+
+
+class AsyncPostDetailView(AsyncStandardAPIView):
+    permission_classes = [HasValidAPIKey]
+
+    async def get(self, request):
+        ip_address = get_client_ip(request)
+        slug = request.query_params.get('slug')
+        user = request.user if request.user.is_authenticated else None
+
+        if not slug:
+            raise NotFound(detail='A valid slug muest be provided.')
+
+        try:
+            version = await aget_post_detail_version(slug)
+            post_data, is_stale = await aget_cached_post_detail(slug)
+
+            if post_data is None:
+                post_data = await sync_to_async(refresh_post_detail)(slug)
+            elif is_stale and await aclaim_post_detail_refresh(slug):
+                await sync_to_async(refresh_post_detail_cache.delay)(slug)
+
+            if post_data is None:
+                raise NotFound(f"Post {slug} does not exist.")
+
+            # The view event is written while the counters the tag covers are read
+            counters, _ = await asyncio.gather(
+                aget_post_detail_counters(post_data['id']),
+                self._register_view_interaction(post_data['id'], ip_address, user),
+            )
+            etag = make_etag('post_detail', slug, version, user.id if user else '', *counters.values())
+
+            not_modified = conditional_response(request, etag)
+            if not_modified:
+                return not_modified
+
+            serialized_post = await apost_detail_overlay(post_data, request, user, counters)
+
+        except NotFound:
+            raise
+        except Exception as e:
+            raise APIException(detail=f'An unexpected error ocurreed: {str(e)}')
+
+        return set_validators(self.response(serialized_post), etag)
+
+    async def _register_view_interaction(self, post_id, ip_address, user):
+        await aemit_view_event(post_id, ip_address, user.id if user else None)
+
+
+class AsyncCategoryListView(AsyncStandardAPIView):
+    async def get(self, request):
+        try:
+            parent_slug = request.query_params.get("parent_slug", None)
+            search = request.query_params.get("search", "").strip()
+            ordering = request.query_params.get("ordering", None)
+            sorting = request.query_params.get("sorting", None)
+
+            cache_key = await alisting_cache_key('category_list', request)
+            cached_listing = await aget_cached_listing(cache_key)
+
+            if cached_listing:
+                content, category_ids, built_at = cached_listing
+                await arecord_category_impressions(category_ids)
+                return listing_response(request, content, built_at)
+
+            if parent_slug:
+                categories = Category.objects.filter(parent__slug=parent_slug)
+            else:
+                categories = Category.objects.filter(parent__isnull=True)
+
+            if not await categories.aexists():
+                raise NotFound(detail="No categories found.")
+
+            categories = [
+                category async for category in order_category_list(categories, search, sorting, ordering)
+            ]
+            category_ids = [str(category.id) for category in categories]
+
+            serialized_categories = CategoryListSerializer(categories, many=True).data
+
+            response = self.paginate(request, serialized_categories)
+            if response.status_code != 200:
+                return response
+
+            (content, _, built_at), _ = await asyncio.gather(
+                acache_listing(cache_key, response.data, category_ids),
+                arecord_category_impressions(category_ids),
+            )
+
+            return listing_response(request, content, built_at)
+
+        except Category.DoesNotExist:
+            raise NotFound(detail='No categories found.')
+        except Exception as e:
+            raise APIException(detail=f'An unexpected error ocurreed: {str(e)}')
+
+
+class AsyncListPostCommentsView(KeysetPaginationMixin, AsyncStandardAPIView):
+    permission_classes = [HasValidAPIKey]
+
+    async def get(self, request):
+        post_slug = request.query_params.get('slug', None)
+        cursor = request.query_params.get("cursor", None)
+        page_size = request.query_params.get("page_size", None)
+
+        if not post_slug:
+            raise NotFound(detail='A valid post slug must be provided.')
+
+        cache_key = f"post_comment:{post_slug}:{cursor}:{page_size}"
+        cached_page = await cache.aget(cache_key)
+
+        if cached_page:
+            return self.paginated_response(cached_page)
+
+        try:
+            post = await Post.objects.only('id').aget(slug=post_slug)
+        except Post.DoesNotExist:
+            raise ValueError(f"Post: {post_slug} does not exist")
+
+        comments = comment_list_queryset().filter(post=post)
+        page = await self.akeyset_paginate(request, comments, CommentSerializer, COMMENTS_ORDERING)
+
+        cache_index_key = f"post_comments_cache_keys:{post_slug}"
+        cache_keys = await cache.aget(cache_index_key, [])
+        cache_keys.append(cache_key)
+
+        await asyncio.gather(
+            cache.aset(cache_index_key, cache_keys, timeout=60*5),
+            cache.aset(cache_key, page, timeout=60*5),
+        )
+
+        return self.paginated_response(page)
@@ -0,0 +1,189 @@
+import math
+import statistics
+import time
+from urllib.parse import urlencode
+
+import redis
+import redis.asyncio
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(samples, p):
+    # Linear interpolation between the closest ranks, like numpy's default
+    if not samples:
+        return None
+
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * p / 100
+    lower, upper = math.floor(rank), math.ceil(rank)
+
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+class RedisCallCounter:
+    """
+    Counts the Redis commands sent by every client in the process while active,
+    the cache, the Celery broker and the module level clients alike, sync or
+    asyncio. A pipeline counts each of its commands and one round trip.
+    """
+
+    def __init__(self):
+        self.commands = 0
+        self.round_trips = 0
+
+    def __enter__(self):
+        counter = self
+        self._originals = [
+            (redis.Redis, 'execute_command', redis.Redis.execute_command),
+            (redis.client.Pipeline, 'execute', redis.client.Pipeline.execute),
+            (redis.asyncio.Redis, 'execute_command', redis.asyncio.Redis.execute_command),
+            (redis.asyncio.client.Pipeline, 'execute', redis.asyncio.client.Pipeline.execute),
+        ]
+        execute_command, pipeline_execute, async_execute_command, async_pipeline_execute = (
+            original for _, _, original in self._originals
+        )
+
+        def count_command():
+            counter.commands += 1
+            counter.round_trips += 1
+
+        def count_pipeline(pipe):
+            if pipe.command_stack:
+                counter.commands += len(pipe.command_stack)
+                counter.round_trips += 1
+
+        def counted_execute_command(client, *args, **options):
+            count_command()
+            return execute_command(client, *args, **options)
+
+        def counted_pipeline_execute(pipe, *args, **kwargs):
+            count_pipeline(pipe)
+            return pipeline_execute(pipe, *args, **kwargs)
+
+        async def counted_async_execute_command(client, *args, **options):
+            count_command()
+            return await async_execute_command(client, *args, **options)
+
+        async def counted_async_pipeline_execute(pipe, *args, **kwargs):
+            count_pipeline(pipe)
+            return await async_pipeline_execute(pipe, *args, **kwargs)
+
+        redis.Redis.execute_command = counted_execute_command
+        redis.client.Pipeline.execute = counted_pipeline_execute
+        redis.asyncio.Redis.execute_command = counted_async_execute_command
+        redis.asyncio.client.Pipeline.execute = counted_async_pipeline_execute
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for cls, name, original in self._originals:
+            setattr(cls, name, original)
+
+
+class Endpoint:
+    """
+    One benchmarked request. prepare(fixtures) runs before every request, outside
+    the measurement, and returns the params or body of that request, so
+    endpoints that consume state (unlike, delete) get a fresh target each time.
+    """
+
+    def __init__(self, name, method, path, prepare=None, authenticated=False, side_effects=False):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.prepare = prepare or (lambda fixtures: {})
+        self.authenticated = authenticated
+        # Writes outside the database (files, generated rows for every post) are opt in
+        self.side_effects = side_effects
+
+
+def measure(client, endpoint, fixtures, headers, iterations, warmup):
+    """
+    Runs the endpoint warmup + iterations times and returns its summary: latency
+    percentiles in milliseconds, plus SQL queries and Redis commands per request.
+    """
+    latencies, queries, redis_commands, redis_round_trips = [], [], [], []
+    statuses = set()
+
+    for iteration in range(warmup + iterations):
+        payload = endpoint.prepare(fixtures)
+
+        # Each request commits like it would in production, so its on_commit hooks run too
+        captured, redis_calls = CaptureQueriesContext(connection), RedisCallCounter()
+        started = time.perf_counter()
+        try:
+            with captured, redis_calls:
+                started = time.perf_counter()
+                status = _send(client, endpoint, payload, headers).status_code
+                elapsed = time.perf_counter() - started
+        except Exception:
+            status = 500
+            elapsed = time.perf_counter() - started
+
+        if iteration < warmup:
+            continue
+
+        statuses.add(status)
+        latencies.append(elapsed * 1000)
+        # Nothing was captured when entering the contexts failed
+        queries.append(len(captured.captured_queries) if hasattr(captured, 'initial_queries') else 0)
+        redis_commands.append(redis_calls.commands)
+        redis_round_trips.append(redis_calls.round_trips)
+
+    return {
+        'method': endpoint.method,
+        'path': endpoint.path,
+        'status': sorted(statuses),
+        'p50_ms': _round(percentile(latencies, 50)),
+        'p95_ms': _round(percentile(latencies, 95)),
+        'p99_ms': _round(percentile(latencies, 99)),
+        'mean_ms': _round(statistics.fmean(latencies)),
+        'queries': _spread(queries),
+        'redis_commands': _spread(redis_commands),
+        'redis_round_trips': _spread(redis_round_trips),
+    }
+
+
+def compare_reports(baseline, current):
+    """
+    Per endpoint changes between two reports, [(name, metric, before, after, change %)].
+    """
+    changes = []
+
+    for name, result in sorted(current['endpoints'].items()):
+        before = baseline.get('endpoints', {}).get(name)
+        if before is None:
+            continue
+
+        for metric, value, previous in (
+            ('p50_ms', result['p50_ms'], before['p50_ms']),
+            ('p95_ms', result['p95_ms'], before['p95_ms']),
+            ('p99_ms', result['p99_ms'], before['p99_ms']),
+            ('queries', result['queries']['p50'], before['queries']['p50']),
+            ('redis_commands', result['redis_commands']['p50'], before['redis_commands']['p50']),
+        ):
+            if value != previous:
+                change = (value - previous) / previous * 100 if previous else None
+                changes.append((name, metric, previous, value, change))
+
+    return changes
+
+
+def _send(client, endpoint, payload, headers):
+    # Reads and deletes take query params, everything else a JSON body
+    if endpoint.method == 'GET':
+        return client.get(endpoint.path, payload, **headers)
+
+    if endpoint.method == 'DELETE':
+        return client.delete(f'{endpoint.path}?{urlencode(payload)}', **headers)
+
+    return getattr(client, endpoint.method.lower())(endpoint.path, payload, format='json', **headers)
+
+
+def _round(value):
+    return round(value, 3) if value is not None else None
+
+
+def _spread(samples):
+    # p50 and max tell whether a request ever missed a cache
+    return {'p50': statistics.median_low(samples), 'max': max(samples)}
@@ -0,0 +1,54 @@
+from django.core.cache import cache
+
+
+CATEGORY_TREE_KEY = 'blog:category_tree'
+
+
+def build_category_tree():
+    """
+    Every category nested under its parent, from one query. Siblings are sorted by name.
+    """
+    from .models import Category
+
+    categories = Category.objects.order_by('depth', 'name').values('id', 'parent_id', 'name', 'title', 'slug', 'depth')
+
+    nodes = {}
+    roots = []
+
+    # Ordered by depth, a parent is always placed before its children
+    for category in categories:
+        parent_id = category.pop('parent_id')
+        node = {**category, 'id': str(category['id']), 'children': []}
+        nodes[category['id']] = node
+
+        if parent_id is None:
+            roots.append(node)
+        elif parent_id in nodes:
+            nodes[parent_id]['children'].append(node)
+
+    return roots
+
+
+def get_category_tree():
+    # Kept until a category changes, see invalidate_cached_category_tree
+    tree = cache.get(CATEGORY_TREE_KEY)
+
+    if tree is None:
+        tree = build_category_tree()
+        cache.set(CATEGORY_TREE_KEY, tree, timeout=None)
+
+    return tree
+
+
+def invalidate_category_tree():
+    cache.delete(CATEGORY_TREE_KEY)
+
+
+def find_category(nodes, slug):
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if node['slug'] == slug:
+            return node
+        stack.extend(node['children'])
+    return None
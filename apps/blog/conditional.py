@@ -0,0 +1,29 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts, weak=False):
+    etag = quote_etag(hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest())
+    return f'W/{etag}' if weak else etag
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(int(last_modified))
+    return response
+
+
+def conditional_response(request, etag, last_modified=None):
+    """
+    A 304 when If-None-Match (or If-Modified-Since) still matches, else None.
+    Called before the response body is serialized.
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified) if last_modified else None)
+
+    if response is not None:
+        set_validators(response, etag, last_modified)
+
+    return response
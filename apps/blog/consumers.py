@@ -0,0 +1,71 @@
+import asyncio
+
+import redis
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .models import Post
+from .live_counters import (
+    post_group,
+    add_watcher,
+    remove_watcher,
+    get_live_post_counters,
+    counters_message,
+    WATCHERS_HEARTBEAT,
+)
+
+
+class PostCountersConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Pushes the views, likes, comments and shares of one published post:
+    the current totals on connect, then at most one update per
+    BLOG_LIVE_COUNTERS_INTERVAL while they change.
+    """
+
+    post_id = None
+    heartbeat = None
+
+    async def connect(self):
+        slug = self.scope['url_route']['kwargs']['slug']
+
+        try:
+            post = await Post.postobjects.only('id').aget(slug=slug)
+        except Post.DoesNotExist:
+            await self.close(code=4404)
+            return
+
+        self.post_id = str(post.id)
+
+        await self.channel_layer.group_add(post_group(self.post_id), self.channel_name)
+        await add_watcher(self.post_id, self.channel_name)
+        self.heartbeat = asyncio.ensure_future(self.keep_watching())
+        await self.accept()
+
+        counters = await database_sync_to_async(get_live_post_counters)([self.post_id])
+        await self.post_counters(counters_message(self.post_id, counters[self.post_id]))
+
+    async def disconnect(self, code):
+        if self.post_id is None:
+            return
+
+        if self.heartbeat:
+            self.heartbeat.cancel()
+
+        await self.channel_layer.group_discard(post_group(self.post_id), self.channel_name)
+        await remove_watcher(self.post_id, self.channel_name)
+
+    async def keep_watching(self):
+        # Keeps this socket among the watchers of the post for as long as it is open
+        while True:
+            await asyncio.sleep(WATCHERS_HEARTBEAT)
+            try:
+                await add_watcher(self.post_id, self.channel_name)
+            except redis.RedisError:
+                continue
+
+    async def receive_json(self, content, **kwargs):
+        # Read only, clients have nothing to send
+        pass
+
+    async def post_counters(self, event):
+        await self.send_json({'post': event['post'], 'counters': event['counters']})
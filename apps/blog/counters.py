@@ -0,0 +1,221 @@
+import time
+import uuid
+from collections import defaultdict
+
+import redis
+from django.db import transaction
+from django.db.models import Case, ExpressionWrapper, F, FloatField, IntegerField, Value, When
+from core.redis_pool import get_redis_client
+
+
+redis_client = get_redis_client()
+
+# Pending deltas live in one hash per kind and metric: counters:<kind>:<metric> -> {id: delta}.
+# They are written to PostAnalytics/CategoryAnalytics by sync_counters_to_db.
+POST_COUNTERS = ('views', 'clicks', 'likes', 'comments', 'shares')
+CATEGORY_COUNTERS = ('views', 'clicks')
+
+CLAIM_TIMEOUT = 60 * 10
+FLUSH_SCAN_COUNT = 500
+FLUSH_BATCH_SIZE = 500
+
+# Flushes and exact resets of one counter hold counters:lock:<kind>:<metric>, so a claimed
+# hash is either applied and deleted before a reset or still waiting for a flush after one
+LOCK_TIMEOUT = 60 * 5
+LOCK_WAIT = 30
+
+
+def counter_key(kind, metric):
+    return f'counters:{kind}:{metric}'
+
+
+def counter_lock(kind, metric):
+    return redis_client.lock(f'counters:lock:{kind}:{metric}', timeout=LOCK_TIMEOUT, blocking_timeout=LOCK_WAIT)
+
+
+def _counters_changed(kind, ids, metric):
+    # Posts push their counters to open websockets, see live_counters
+    from .live_counters import counters_changed
+
+    if kind == 'post':
+        counters_changed(ids, metric)
+
+
+def increment_counter(kind, id, metric, amount=1):
+    redis_client.hincrby(counter_key(kind, metric), str(id), amount)
+    _counters_changed(kind, [id], metric)
+
+
+def increment_counters(kind, metric, amounts):
+    # {id: amount} in one pipelined round trip
+    pipe = redis_client.pipeline(transaction=False)
+    for id, amount in amounts.items():
+        pipe.hincrby(counter_key(kind, metric), str(id), amount)
+    pipe.execute()
+    _counters_changed(kind, list(amounts), metric)
+
+
+def increment_post_counter(post_id, metric, amount=1):
+    if metric not in POST_COUNTERS:
+        raise ValueError(f'Metric {metric} does not exist in PostAnalytics')
+    increment_counter('post', post_id, metric, amount)
+
+
+def increment_category_counter(category_id, metric, amount=1):
+    if metric not in CATEGORY_COUNTERS:
+        raise ValueError(f'Metric {metric} does not exist in CategoryAnalytics')
+    increment_counter('category', category_id, metric, amount)
+
+
+def get_pending_counters(kind, ids, metrics):
+    """
+    Returns {id: {metric: delta}} for the deltas not flushed yet, in one round trip.
+    """
+    ids = [str(id) for id in ids]
+
+    if not ids:
+        return {}
+
+    pipe = redis_client.pipeline(transaction=False)
+    for metric in metrics:
+        pipe.hmget(counter_key(kind, metric), ids)
+
+    pending = defaultdict(dict)
+    for metric, values in zip(metrics, pipe.execute()):
+        for id, value in zip(ids, values):
+            if value:
+                pending[id][metric] = int(value)
+
+    return pending
+
+
+def get_pending_post_counters(post_ids):
+    return get_pending_counters('post', post_ids, POST_COUNTERS)
+
+
+def get_pending_category_counters(category_ids):
+    return get_pending_counters('category', category_ids, CATEGORY_COUNTERS)
+
+
+def reset_counter(model, related_field, kind, id, metric, value):
+    # Stores an exact recount and drops the pending deltas it already accounts for, claimed ones included
+    with counter_lock(kind, metric):
+        model.objects.filter(**{f'{related_field}_id': id}).update(**{metric: value})
+
+        # No flush is between claiming and applying while the lock is held, claimed hashes left are from one that died
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hdel(counter_key(kind, metric), str(id))
+        for claimed_key in redis_client.scan_iter(match=f'counters:claimed:{kind}:{metric}:*', count=FLUSH_SCAN_COUNT):
+            pipe.hdel(claimed_key, str(id))
+        pipe.execute()
+
+    _counters_changed(kind, [id], metric)
+
+
+def claim_key(key, claimed_prefix):
+    claimed_key = f'{claimed_prefix}:{int(time.time())}:{uuid.uuid4().hex}'
+    try:
+        redis_client.rename(key, claimed_key)
+    except redis.ResponseError:
+        # Already claimed by another worker
+        return None
+    return claimed_key
+
+
+def claim_stale_keys(claimed_prefix):
+    # Claims left behind by a worker that died mid flush are picked up once they are old enough
+    stale_before = time.time() - CLAIM_TIMEOUT
+    for key in redis_client.scan_iter(match=f'{claimed_prefix}:*', count=FLUSH_SCAN_COUNT):
+        claimed_at = int(key.decode('utf-8')[len(claimed_prefix) + 1:].split(':')[0])
+        if claimed_at < stale_before:
+            claimed_key = claim_key(key, claimed_prefix)
+            if claimed_key:
+                yield claimed_key
+
+
+def ensure_analytics_rows(model, related_field, ids):
+    related_model = model._meta.get_field(related_field).related_model
+
+    existing = {
+        str(id) for id in
+        model.objects.filter(**{f'{related_field}_id__in': ids}).values_list(f'{related_field}_id', flat=True)
+    }
+    missing = [id for id in ids if id not in existing]
+
+    if missing:
+        model.objects.bulk_create(
+            [
+                model(**{f'{related_field}_id': id})
+                for id in related_model.objects.filter(id__in=missing).values_list('id', flat=True)
+            ],
+            ignore_conflicts=True,
+        )
+
+
+def _apply_deltas(model, related_field, metric, deltas):
+    lookup = f'{related_field}_id'
+    ids = list(deltas)
+
+    with transaction.atomic():
+        ensure_analytics_rows(model, related_field, ids)
+
+        updated = model.objects.filter(**{f'{lookup}__in': ids}).update(**{
+            metric: F(metric) + Case(
+                *[When(**{lookup: id}, then=Value(delta)) for id, delta in deltas.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        })
+
+        if metric == 'clicks':
+            model.objects.filter(**{f'{lookup}__in': ids}).update(
+                click_through_rate=Case(
+                    When(
+                        impressions__gt=0,
+                        then=ExpressionWrapper(F('clicks') * 100.0 / F('impressions'), output_field=FloatField()),
+                    ),
+                    default=Value(0.0),
+                    output_field=FloatField(),
+                )
+            )
+
+    return updated
+
+
+def flush_counters(kind, model, related_field, metrics):
+    """
+    Applies the pending deltas of every metric with one F() expression
+    UPDATE per batch. Each hash is claimed with RENAME first, so new
+    increments are never lost and concurrent flushes never overlap. Flushes
+    hold the lock of the counter that reset_counter takes.
+    """
+    flushed = 0
+
+    for metric in metrics:
+        claimed_prefix = f'counters:claimed:{kind}:{metric}'
+
+        with counter_lock(kind, metric):
+            claimed_keys = list(claim_stale_keys(claimed_prefix))
+
+            claimed_key = claim_key(counter_key(kind, metric), claimed_prefix)
+            if claimed_key:
+                claimed_keys.append(claimed_key)
+
+            for claimed_key in claimed_keys:
+                deltas = {}
+                for id, delta in redis_client.hgetall(claimed_key).items():
+                    try:
+                        id = str(uuid.UUID(id.decode('utf-8')))
+                        delta = int(delta)
+                    except ValueError:
+                        continue
+                    if delta:
+                        deltas[id] = deltas.get(id, 0) + delta
+
+                items = list(deltas.items())
+                for start in range(0, len(items), FLUSH_BATCH_SIZE):
+                    flushed += _apply_deltas(model, related_field, metric, dict(items[start:start + FLUSH_BATCH_SIZE]))
+
+                redis_client.delete(claimed_key)
+
+    return flushed
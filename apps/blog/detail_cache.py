@@ -0,0 +1,186 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+
+# Entries are {'data': shared body, 'fresh_until': epoch}. Past fresh_until they are still
+# served for up to DETAIL_STALE_FOR while a single worker rebuilds them.
+DETAIL_FRESH_FOR = getattr(settings, 'BLOG_POST_DETAIL_FRESH_FOR', 60 * 5)
+DETAIL_STALE_FOR = getattr(settings, 'BLOG_POST_DETAIL_STALE_FOR', 60 * 60)
+REFRESH_LOCK_TIMEOUT = 30
+
+# Body field -> PostAnalytics counter. They move without a version bump, so the cached body
+# only has them as of its build and post_detail_overlay replaces them with the live totals
+DETAIL_COUNTERS = {'view_count': 'views', 'likes_count': 'likes'}
+
+
+def post_detail_cache_key(slug):
+    return f'post_detail:{slug}'
+
+
+def _refresh_lock_key(slug):
+    return f'post_detail:refreshing:{slug}'
+
+
+def _version_key(slug):
+    return f'post_detail:version:{slug}'
+
+
+def build_post_detail(slug):
+    """
+    The user independent body of a published post: has_liked is left out and
+    file urls stay relative, post_detail_overlay adds both per request.
+    """
+    from .models import Post
+    from .serializers import PostSerializer, post_detail_queryset
+    from .related import get_related_posts
+
+    try:
+        post = post_detail_queryset().get(slug=slug)
+    except Post.DoesNotExist:
+        return None
+
+    data = dict(PostSerializer(post, context={'request': None}).data)
+    data.pop('has_liked', None)
+    data['related'] = get_related_posts(post.id)
+    return data
+
+
+def refresh_post_detail(slug):
+    version = cache.get(_version_key(slug))
+    data = build_post_detail(slug)
+
+    # An invalidation that landed while building means data may predate it, it is not stored
+    if data is not None and cache.get(_version_key(slug)) == version:
+        cache.set(
+            post_detail_cache_key(slug),
+            {'data': data, 'fresh_until': time.time() + DETAIL_FRESH_FOR},
+            timeout=DETAIL_FRESH_FOR + DETAIL_STALE_FOR,
+        )
+
+    cache.delete(_refresh_lock_key(slug))
+    return data
+
+
+def get_cached_post_detail(slug):
+    # Returns (data, is_stale), data is None on a miss
+    entry = cache.get(post_detail_cache_key(slug))
+
+    if entry is None:
+        return None, False
+
+    return entry['data'], entry['fresh_until'] < time.time()
+
+
+async def aget_cached_post_detail(slug):
+    entry = await cache.aget(post_detail_cache_key(slug))
+
+    if entry is None:
+        return None, False
+
+    return entry['data'], entry['fresh_until'] < time.time()
+
+
+def claim_post_detail_refresh(slug):
+    # Only the first caller to see a stale entry gets True
+    return cache.add(_refresh_lock_key(slug), 1, timeout=REFRESH_LOCK_TIMEOUT)
+
+
+async def aclaim_post_detail_refresh(slug):
+    return await cache.aadd(_refresh_lock_key(slug), 1, timeout=REFRESH_LOCK_TIMEOUT)
+
+
+def get_post_detail_version(slug):
+    """
+    Changes whenever the post body does. It is the time of the last
+    invalidation in milliseconds, so it doubles as Last-Modified.
+    """
+    version = cache.get(_version_key(slug))
+
+    if version is None:
+        cache.add(_version_key(slug), int(time.time() * 1000), timeout=None)
+        version = cache.get(_version_key(slug))
+
+    return version
+
+
+async def aget_post_detail_version(slug):
+    version = await cache.aget(_version_key(slug))
+
+    if version is None:
+        await cache.aadd(_version_key(slug), int(time.time() * 1000), timeout=None)
+        version = await cache.aget(_version_key(slug))
+
+    return version
+
+
+def invalidate_post_detail(slug):
+    version = cache.get(_version_key(slug)) or 0
+    cache.set(_version_key(slug), max(int(time.time() * 1000), version + 1), timeout=None)
+    cache.delete(post_detail_cache_key(slug))
+
+
+def _absolute_file_urls(data, request):
+    data = dict(data)
+
+    if data.get('thumbnail'):
+        data['thumbnail'] = request.build_absolute_uri(data['thumbnail'])
+
+    if data.get('category') and data['category'].get('thumbnail'):
+        data['category'] = {**data['category'], 'thumbnail': request.build_absolute_uri(data['category']['thumbnail'])}
+
+    return data
+
+
+def get_post_detail_counters(post_id):
+    """
+    {body field: total} of DETAIL_COUNTERS, the stored analytics plus the
+    deltas not flushed yet: one query and one Redis round trip.
+    """
+    from .models import PostAnalytics
+    from .counters import get_pending_counters
+
+    metrics = list(DETAIL_COUNTERS.values())
+    stored = PostAnalytics.objects.filter(post_id=post_id).values(*metrics).first() or {}
+    pending = get_pending_counters('post', [post_id], metrics).get(str(post_id), {})
+
+    return {
+        field: stored.get(metric, 0) + pending.get(metric, 0)
+        for field, metric in DETAIL_COUNTERS.items()
+    }
+
+
+async def aget_post_detail_counters(post_id):
+    return await sync_to_async(get_post_detail_counters)(post_id)
+
+
+def post_detail_overlay(data, request, user=None, counters=None):
+    """
+    Merges the per request parts into a cached body: absolute file urls, the
+    live counters (read unless given) and has_liked.
+    """
+    from .models import PostLike
+
+    data = _absolute_file_urls(data, request)
+    data.update(counters if counters is not None else get_post_detail_counters(data['id']))
+
+    data['has_liked'] = bool(
+        user and user.is_authenticated and PostLike.objects.filter(post_id=data['id'], user=user).exists()
+    )
+
+    return data
+
+
+async def apost_detail_overlay(data, request, user=None, counters=None):
+    from .models import PostLike
+
+    data = _absolute_file_urls(data, request)
+    data.update(counters if counters is not None else await aget_post_detail_counters(data['id']))
+
+    data['has_liked'] = bool(
+        user and user.is_authenticated and await PostLike.objects.filter(post_id=data['id'], user=user).aexists()
+    )
+
+    return data
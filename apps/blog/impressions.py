@@ -0,0 +1,166 @@
+import time
+import uuid
+import zlib
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from core.redis_pool import get_redis_client, get_async_redis_client
+
+from .counters import claim_key, claim_stale_keys, ensure_analytics_rows
+
+
+redis_client = get_redis_client()
+
+# Impressions are counted in hashes per kind, interval and shard:
+#   impressions:<kind>:<bucket>:<shard> -> {id: count}
+# A flusher claims a hash by renaming it to impressions:claimed:<kind>:<claimed_at>:<token>,
+# new increments then land in a fresh hash under the original name.
+IMPRESSIONS_INTERVAL = getattr(settings, 'BLOG_IMPRESSIONS_INTERVAL', 60)
+IMPRESSIONS_SHARDS = getattr(settings, 'BLOG_IMPRESSIONS_SHARDS', 8)
+IMPRESSIONS_KEY_TTL = 60 * 60 * 24 * 7
+
+FLUSH_SCAN_COUNT = 500
+FLUSH_BATCH_SIZE = 1000
+
+
+def current_bucket():
+    return int(time.time() // IMPRESSIONS_INTERVAL)
+
+
+def impressions_shard(id):
+    return zlib.crc32(str(id).encode('utf-8')) % IMPRESSIONS_SHARDS
+
+
+def impressions_key(kind, bucket, shard):
+    return f'impressions:{kind}:{bucket}:{shard}'
+
+
+def _queue_impressions(pipe, kind, ids):
+    # Returns False when there is nothing to record
+    counts = Counter(str(id) for id in ids)
+
+    if not counts:
+        return False
+
+    bucket = current_bucket()
+    keys = set()
+
+    for id, count in counts.items():
+        key = impressions_key(kind, bucket, impressions_shard(id))
+        keys.add(key)
+        pipe.hincrby(key, id, count)
+    for key in keys:
+        pipe.expire(key, IMPRESSIONS_KEY_TTL)
+
+    return True
+
+
+def record_impressions(kind, ids):
+    """
+    Counts one impression per id in a single pipelined round trip.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    if _queue_impressions(pipe, kind, ids):
+        pipe.execute()
+
+
+async def arecord_impressions(kind, ids):
+    pipe = get_async_redis_client().pipeline(transaction=False)
+    if _queue_impressions(pipe, kind, ids):
+        await pipe.execute()
+
+
+def record_post_impressions(post_ids):
+    record_impressions('post', post_ids)
+
+
+def record_category_impressions(category_ids):
+    record_impressions('category', category_ids)
+
+
+async def arecord_post_impressions(post_ids):
+    await arecord_impressions('post', post_ids)
+
+
+async def arecord_category_impressions(category_ids):
+    await arecord_impressions('category', category_ids)
+
+
+def _claim_keys(kind, shard):
+    claimed_prefix = f'impressions:claimed:{kind}'
+
+    yield from claim_stale_keys(claimed_prefix)
+
+    pattern = f'impressions:{kind}:*:{"*" if shard is None else shard}'
+    for key in redis_client.scan_iter(match=pattern, count=FLUSH_SCAN_COUNT):
+        claimed_key = claim_key(key, claimed_prefix)
+        if claimed_key:
+            yield claimed_key
+
+
+def _apply_impressions(model, related_field, counts):
+    related_column = model._meta.get_field(related_field).column
+    ids = list(counts)
+
+    with transaction.atomic():
+        ensure_analytics_rows(model, related_field, ids)
+
+        table = connection.ops.quote_name(model._meta.db_table)
+        values = ', '.join(['(%s::uuid, %s::integer)'] * len(ids))
+        params = [value for id in ids for value in (id, counts[id])]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {table} AS analytics
+                SET impressions = analytics.impressions + counts.delta,
+                    click_through_rate = CASE
+                        WHEN analytics.impressions + counts.delta > 0
+                        THEN analytics.clicks::float / (analytics.impressions + counts.delta) * 100
+                        ELSE 0
+                    END
+                FROM (VALUES {values}) AS counts (id, delta)
+                WHERE analytics.{connection.ops.quote_name(related_column)} = counts.id
+                """,
+                params,
+            )
+            return cursor.rowcount
+
+
+def flush_impressions(kind, model, related_field, shard=None):
+    """
+    Moves pending impressions from Redis into `model` with one
+    UPDATE ... FROM (VALUES ...) per batch. Hashes are claimed with
+    RENAME, so any number of workers can flush at the same time.
+    """
+    flushed = 0
+    pending = Counter()
+    claimed_keys = []
+
+    def apply_pending():
+        nonlocal flushed
+        if pending:
+            flushed += _apply_impressions(model, related_field, pending)
+        if claimed_keys:
+            redis_client.delete(*claimed_keys)
+        pending.clear()
+        claimed_keys.clear()
+
+    for claimed_key in _claim_keys(kind, shard):
+        for id, count in redis_client.hgetall(claimed_key).items():
+            try:
+                id = str(uuid.UUID(id.decode('utf-8')))
+                count = int(count)
+            except ValueError:
+                continue
+            if count:
+                pending[id] += count
+        claimed_keys.append(claimed_key)
+
+        if len(pending) >= FLUSH_BATCH_SIZE:
+            apply_pending()
+
+    apply_pending()
+
+    return flushed
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+from .search import normalize_search_query
+from .conditional import make_etag, set_validators, conditional_response
+
+
+LISTING_GENERATION_KEY = 'blog:listing_generation'
+LISTING_CACHE_TIMEOUT = 60 * 5
+# Part of every key, bumped when the shape of the entries changes so old ones are never read
+LISTING_ENTRY_VERSION = 2
+
+
+def get_listing_generation():
+    generation = cache.get(LISTING_GENERATION_KEY)
+
+    if generation is None:
+        cache.add(LISTING_GENERATION_KEY, 1, timeout=None)
+        generation = cache.get(LISTING_GENERATION_KEY, 1)
+
+    return generation
+
+
+async def aget_listing_generation():
+    generation = await cache.aget(LISTING_GENERATION_KEY)
+
+    if generation is None:
+        await cache.aadd(LISTING_GENERATION_KEY, 1, timeout=None)
+        generation = await cache.aget(LISTING_GENERATION_KEY, 1)
+
+    return generation
+
+
+def bump_listing_generation():
+    # Every cached listing is keyed by the generation, bumping it orphans them all at once
+    try:
+        return cache.incr(LISTING_GENERATION_KEY)
+    except ValueError:
+        cache.add(LISTING_GENERATION_KEY, 1, timeout=None)
+        return cache.incr(LISTING_GENERATION_KEY)
+
+
+def normalize_listing_params(request):
+    params = {}
+
+    for key, values in request.query_params.lists():
+        values = [value.strip() for value in values if value.strip()]
+
+        if not values:
+            continue
+
+        if key == 'search':
+            values = [normalize_search_query(value) for value in values]
+
+        params[key] = sorted(values)
+
+    # Pagination links are absolute, so the host is part of the response
+    params['_host'] = request.get_host()
+
+    return params
+
+
+def _params_hash(request):
+    params = json.dumps(normalize_listing_params(request), sort_keys=True, separators=(',', ':'))
+    return hashlib.md5(params.encode('utf-8')).hexdigest()
+
+
+def listing_cache_key(prefix, request):
+    return f'{prefix}:v{LISTING_ENTRY_VERSION}:{get_listing_generation()}:{_params_hash(request)}'
+
+
+async def alisting_cache_key(prefix, request):
+    return f'{prefix}:v{LISTING_ENTRY_VERSION}:{await aget_listing_generation()}:{_params_hash(request)}'
+
+
+def get_cached_listing(cache_key):
+    # Returns (content, ids, built_at) or None
+    return cache.get(cache_key)
+
+
+async def aget_cached_listing(cache_key):
+    return await cache.aget(cache_key)
+
+
+def cache_listing(cache_key, data, ids=(), timeout=LISTING_CACHE_TIMEOUT):
+    # Returns the entry it stored
+    entry = (JSONRenderer().render(data), list(ids), time.time())
+    cache.set(cache_key, entry, timeout=timeout)
+    return entry
+
+
+async def acache_listing(cache_key, data, ids=(), timeout=LISTING_CACHE_TIMEOUT):
+    entry = (JSONRenderer().render(data), list(ids), time.time())
+    await cache.aset(cache_key, entry, timeout=timeout)
+    return entry
+
+
+def listing_validators(content, built_at):
+    """
+    Validators of one cached entry. Listings carry pending counters and orders
+    that move without a generation bump (most_viewed, trending), so the tag is
+    the entry's own content and changes whenever it is rebuilt differently.
+    Weak, only the entry is vouched for, not the live data behind it.
+    """
+    return make_etag(hashlib.md5(content).hexdigest(), weak=True), built_at
+
+
+def listing_response(request, content, built_at):
+    # A 304 when the client already has this entry
+    etag, last_modified = listing_validators(content, built_at)
+
+    not_modified = conditional_response(request, etag, last_modified)
+    if not_modified:
+        return not_modified
+
+    return set_validators(HttpResponse(content, content_type='application/json'), etag, last_modified)
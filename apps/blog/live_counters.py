@@ -0,0 +1,113 @@
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from core.redis_pool import get_redis_client, get_async_redis_client
+
+
+redis_client = get_redis_client()
+
+# Open websockets per post are the members of live:watchers:<post id>, changes to posts nobody
+# watches stop at one EXISTS. The first change to a watched post sets live:throttle:<post id>
+# for LIVE_COUNTERS_INTERVAL and schedules one broadcast for when it expires, later changes in
+# that window find the key and are carried by the same broadcast, which reads the totals then.
+LIVE_COUNTERS = ('views', 'likes', 'comments', 'shares')
+LIVE_COUNTERS_INTERVAL = getattr(settings, 'BLOG_LIVE_COUNTERS_INTERVAL', 2)
+# Members are channel names scored by when they lapse. Every open socket re-adds itself each
+# heartbeat, which also recreates a key that was lost, and drops the lapsed members that a
+# worker dying without disconnecting its sockets left behind
+WATCHERS_HEARTBEAT = getattr(settings, 'BLOG_LIVE_WATCHERS_HEARTBEAT', 60 * 5)
+WATCHERS_TTL = WATCHERS_HEARTBEAT * 3
+
+
+def post_group(post_id):
+    return f'post.{post_id}'
+
+
+def watchers_key(post_id):
+    return f'live:watchers:{post_id}'
+
+
+def throttle_key(post_id):
+    return f'live:throttle:{post_id}'
+
+
+async def add_watcher(post_id, channel_name):
+    # Also the heartbeat of an open socket
+    now = time.time()
+    pipe = get_async_redis_client().pipeline(transaction=False)
+    pipe.zadd(watchers_key(post_id), {channel_name: now + WATCHERS_TTL})
+    pipe.zremrangebyscore(watchers_key(post_id), '-inf', now)
+    pipe.expire(watchers_key(post_id), WATCHERS_TTL)
+    await pipe.execute()
+
+
+async def remove_watcher(post_id, channel_name):
+    # The key goes with its last member
+    await get_async_redis_client().zrem(watchers_key(post_id), channel_name)
+
+
+def counters_changed(post_ids, metric=None):
+    """
+    Schedules a broadcast for every watched post in post_ids that has none
+    pending. Costs one round trip, two when some of the posts are watched.
+    """
+    from .tasks import broadcast_post_counters
+
+    if metric is not None and metric not in LIVE_COUNTERS:
+        return
+
+    post_ids = [str(post_id) for post_id in post_ids]
+
+    if not post_ids:
+        return
+
+    pipe = redis_client.pipeline(transaction=False)
+    for post_id in post_ids:
+        pipe.exists(watchers_key(post_id))
+    watched = [post_id for post_id, exists in zip(post_ids, pipe.execute()) if exists]
+
+    if not watched:
+        return
+
+    pipe = redis_client.pipeline(transaction=False)
+    for post_id in watched:
+        pipe.set(throttle_key(post_id), 1, nx=True, px=int(LIVE_COUNTERS_INTERVAL * 1000))
+
+    for post_id, claimed in zip(watched, pipe.execute()):
+        if claimed:
+            broadcast_post_counters.apply_async(args=[post_id], countdown=LIVE_COUNTERS_INTERVAL)
+
+
+def get_live_post_counters(post_ids):
+    """
+    {post id: {counter: total}}, the stored analytics plus the deltas not flushed yet.
+    """
+    from .models import PostAnalytics
+    from .counters import get_pending_post_counters
+
+    post_ids = [str(post_id) for post_id in post_ids]
+    stored = {
+        str(row['post_id']): row
+        for row in PostAnalytics.objects.filter(post_id__in=post_ids).values('post_id', *LIVE_COUNTERS)
+    }
+    pending = get_pending_post_counters(post_ids)
+
+    return {
+        post_id: {
+            counter: stored.get(post_id, {}).get(counter, 0) + pending.get(post_id, {}).get(counter, 0)
+            for counter in LIVE_COUNTERS
+        }
+        for post_id in post_ids
+    }
+
+
+def counters_message(post_id, counters):
+    return {'type': 'post.counters', 'post': str(post_id), 'counters': counters}
+
+
+def broadcast_counters(post_id):
+    counters = get_live_post_counters([post_id])[str(post_id)]
+    async_to_sync(get_channel_layer().group_send)(post_group(post_id), counters_message(post_id, counters))
+    return counters
@@ -0,0 +1,320 @@
+import itertools
+import json
+import subprocess
+from contextlib import contextmanager, nullcontext
+
+import pyotp
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import override_settings
+from django.urls import URLResolver, get_resolver
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.authentication.models import UserAccount
+from apps.blog.benchmarks import Endpoint, measure, compare_reports
+from apps.blog.models import Post, Category, Comment, PostLike
+from core.celery import app as celery_app
+from core.redis_pool import get_redis_client, configured_redis_dbs, use_redis_db
+
+
+BENCHMARKED_URLCONFS = ('apps.blog.urls', 'apps.authentication.urls', 'apps.userprofile.urls')
+
+
+def enable_otp(fixtures):
+    # The OTP views need a secret and a QR code on the user, the code sent is always valid
+    user = fixtures['user']
+    UserAccount.objects.filter(id=user.id).update(otp_base32=fixtures['otp_secret'], qr_code='qrcode/benchmark.png')
+    return pyotp.TOTP(fixtures['otp_secret']).now()
+
+
+def otp_enabled(fixtures):
+    enable_otp(fixtures)
+    return {}
+
+
+def ensure_fake_data_editor(fixtures):
+    if not UserAccount.objects.filter(username='testeditor').exists():
+        UserAccount.objects.create_user(
+            email='testeditor@example.com', password='password', username='testeditor',
+            first_name='Test', last_name='Editor', role='editor',
+        )
+    return {}
+
+
+def unliked(fixtures):
+    PostLike.objects.filter(post=fixtures['post'], user=fixtures['user']).delete()
+    return {'slug': fixtures['post'].slug}
+
+
+def liked(fixtures):
+    PostLike.objects.get_or_create(post=fixtures['post'], user=fixtures['user'])
+    return {'slug': fixtures['post'].slug}
+
+
+def new_comment(fixtures):
+    comment = Comment.objects.create(user=fixtures['user'], post=fixtures['post'], content='<p>Benchmark</p>')
+    return {'comment_id': str(comment.id)}
+
+
+def new_post_payload(fixtures):
+    slug = f'benchmark-post-{next(fixtures["sequence"])}'
+    return {
+        'title': 'Benchmark post',
+        'description': 'Written by benchmark_endpoints',
+        'content': '<p>Benchmark</p>',
+        'slug': slug,
+        'category': fixtures['category'].slug,
+        'headings': [{'title': 'Intro', 'slug': 'intro', 'level': 2, 'order': 1}],
+    }
+
+
+def new_draft(fixtures):
+    post = Post.objects.create(
+        user=fixtures['user'], title='Benchmark draft', description='', content='<p>Benchmark</p>',
+        keywords='', slug=f'benchmark-draft-{next(fixtures["sequence"])}', category=fixtures['category'],
+    )
+    return {'slug': post.slug}
+
+
+ENDPOINTS = [
+    # apps/blog/urls.py
+    Endpoint('posts-list', 'GET', '/api/blog/posts/'),
+    Endpoint('posts-list:most_viewed', 'GET', '/api/blog/posts/', lambda f: {'sorting': 'most_viewed'}),
+    Endpoint('posts-list:search', 'GET', '/api/blog/posts/', lambda f: {'search': f['search']}),
+    Endpoint('posts-list:category', 'GET', '/api/blog/posts/', lambda f: {'category': f['category'].slug}),
+    Endpoint('posts-detail', 'GET', '/api/blog/post/', lambda f: {'slug': f['post'].slug}),
+    Endpoint('posts-detail:authenticated', 'GET', '/api/blog/post/', lambda f: {'slug': f['post'].slug}, authenticated=True),
+    Endpoint('post-headings', 'GET', '/api/blog/post/headings/', lambda f: {'slug': f['post'].slug}),
+    Endpoint('increment-post-clicks', 'POST', '/api/blog/post/increment_click/', lambda f: {'slug': f['post'].slug}),
+    Endpoint('category-list', 'GET', '/api/blog/categories/'),
+    Endpoint('category-tree', 'GET', '/api/blog/categories/tree/'),
+    Endpoint('category-posts', 'GET', '/api/blog/category/posts/', lambda f: {'slug': f['category'].slug}),
+    Endpoint('category-posts:subcategories', 'GET', '/api/blog/category/posts/', lambda f: {'slug': f['category'].slug, 'subcategories': 'true'}),
+    Endpoint('increment-category-clicks', 'POST', '/api/blog/category/increment_click/', lambda f: {'slug': f['category'].slug}),
+    Endpoint('post-comment:create', 'POST', '/api/blog/post/comment/', lambda f: {'slug': f['post'].slug, 'content': '<p>Benchmark</p>'}, authenticated=True),
+    Endpoint('post-comment:update', 'PUT', '/api/blog/post/comment/', lambda f: {'comment_id': str(f['own_comment'].id), 'content': '<p>Edited</p>'}, authenticated=True),
+    Endpoint('post-comment:delete', 'DELETE', '/api/blog/post/comment/', new_comment, authenticated=True),
+    Endpoint('post-comments', 'GET', '/api/blog/post/comments/', lambda f: {'slug': f['post'].slug}),
+    Endpoint('comment-replies', 'GET', '/api/blog/post/comment/replies/', lambda f: {'comment_id': str(f['comment'].id)}),
+    Endpoint('post-comment-tree', 'GET', '/api/blog/post/comments/tree/', lambda f: {'slug': f['post'].slug}),
+    Endpoint('post-comment-tree:subtree', 'GET', '/api/blog/post/comments/tree/', lambda f: {'slug': f['post'].slug, 'comment_id': str(f['comment'].id), 'depth': 2}),
+    Endpoint('comment-reply', 'POST', '/api/blog/post/comment/reply/', lambda f: {'comment_id': str(f['comment'].id), 'content': '<p>Benchmark</p>'}, authenticated=True),
+    Endpoint('post-like:create', 'POST', '/api/blog/post/like/', unliked, authenticated=True),
+    Endpoint('post-like:delete', 'DELETE', '/api/blog/post/like/', liked, authenticated=True),
+    Endpoint('post-share', 'POST', '/api/blog/post/share/', lambda f: {'slug': f['post'].slug, 'platform': 'twitter'}, authenticated=True),
+    Endpoint('post-author:list', 'GET', '/api/blog/post/author/', authenticated=True),
+    Endpoint('post-author:create', 'POST', '/api/blog/post/author/', new_post_payload, authenticated=True),
+    Endpoint('post-author:update', 'PUT', '/api/blog/post/author/', lambda f: {'post_slug': f['post'].slug, 'title': f['post'].title, 'status': f['post'].status}, authenticated=True),
+    Endpoint('post-author:delete', 'DELETE', '/api/blog/post/author/', new_draft, authenticated=True),
+    Endpoint('post-interaction-stats', 'GET', '/api/blog/post/interactions/', lambda f: {'slug': f['post'].slug}, authenticated=True),
+    Endpoint('post-interaction-stats:hourly', 'GET', '/api/blog/post/interactions/', lambda f: {'slug': f['post'].slug, 'granularity': 'hourly', 'days': 2}, authenticated=True),
+    Endpoint('category-interaction-stats', 'GET', '/api/blog/category/interactions/', lambda f: {'slug': f['category'].slug}, authenticated=True),
+    Endpoint('generate-fake-posts', 'GET', '/api/blog/generate_posts/', ensure_fake_data_editor, side_effects=True),
+    Endpoint('generate-fake-analytics', 'GET', '/api/blog/generate_analytics/', side_effects=True),
+    # apps/authentication/urls.py
+    Endpoint('generate-qr-code', 'GET', '/api/authentication/generate_qr_code/', authenticated=True, side_effects=True),
+    Endpoint('otp-login-reset', 'POST', '/api/authentication/otp_login_reset/', otp_enabled, authenticated=True),
+    Endpoint('verify-otp', 'POST', '/api/authentication/verify_otp/', lambda f: {'otp': enable_otp(f)}, authenticated=True),
+    Endpoint('disable-otp', 'POST', '/api/authentication/disable_otp/', lambda f: {'otp': enable_otp(f)}, authenticated=True),
+    Endpoint('confirm-2fa', 'POST', '/api/authentication/confirm_2fa/', lambda f: {**otp_enabled(f), 'bool': True}, authenticated=True),
+    Endpoint('otp-login', 'POST', '/api/authentication/otp_login/', lambda f: {'email': f['user'].email, 'otp': enable_otp(f)}),
+    # apps/userprofile/urls.py
+    Endpoint('my-profile', 'GET', '/api/profile/my_profile/', authenticated=True),
+]
+
+
+@contextmanager
+def benchmark_database(keepdb=False):
+    # benchmark_<NAME>, created and migrated like a test database, dropped afterwards unless kept
+    test_settings = connection.settings_dict['TEST']
+    name, test_name = connection.settings_dict['NAME'], test_settings.get('NAME')
+    test_settings['NAME'] = f'benchmark_{name}'
+
+    try:
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=keepdb)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(name, verbosity=0, keepdb=keepdb)
+    finally:
+        test_settings['NAME'] = test_name
+
+
+@contextmanager
+def eager_tasks():
+    # Tasks queued by the requests run in process, against the benchmark database and Redis
+    always_eager = celery_app.conf.task_always_eager
+    celery_app.conf.task_always_eager = True
+    try:
+        yield
+    finally:
+        celery_app.conf.task_always_eager = always_eager
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks every blog, authentication and profile endpoint against a database of '
+        'its own (benchmark_<NAME>, seeded with seed_blog when empty) and a Redis database '
+        'of its own on the configured server, flushed afterwards. Every request commits. '
+        'Reports p50/p95/p99 latency, SQL queries and Redis commands per endpoint as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--only', action='append', default=[], help='Endpoint name prefix, can be repeated.')
+        parser.add_argument('--include-side-effects', action='store_true', help='Also run the endpoints that write files or regenerate data for every post.')
+        parser.add_argument('--output', help='Where to write the JSON report, stdout by default.')
+        parser.add_argument('--compare', help='A previous report to print the changes against.')
+        parser.add_argument('--redis-db', type=int, default=15, help='Redis database used while benchmarking, must not be the one in REDIS_URL or REDIS_DATA_URL.')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the benchmark database, and its seeded data, for the next run.')
+        parser.add_argument('--posts', type=int, help='Posts seed_blog creates in an empty benchmark database.')
+        parser.add_argument('--use-configured-database', action='store_true', help='Benchmark the configured database in place, when it is already disposable.')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1.')
+
+        if options['redis_db'] in configured_redis_dbs():
+            raise CommandError('--redis-db must not be the database in REDIS_URL or REDIS_DATA_URL.')
+
+        endpoints = [
+            endpoint for endpoint in ENDPOINTS
+            if (not options['only'] or any(endpoint.name.startswith(prefix) for prefix in options['only']))
+        ]
+        skipped = {endpoint.name: 'side effects, use --include-side-effects' for endpoint in endpoints if endpoint.side_effects and not options['include_side_effects']}
+        endpoints = [endpoint for endpoint in endpoints if endpoint.name not in skipped]
+
+        database = nullcontext() if options['use_configured_database'] else benchmark_database(options['keepdb'])
+
+        # The test client host is not in ALLOWED_HOSTS outside the test runner
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), use_redis_db(options['redis_db']), database, eager_tasks():
+            redis_client = get_redis_client()
+            redis_client.flushdb()
+
+            try:
+                if not Post.postobjects.exists():
+                    call_command('seed_blog', stdout=self.stderr, **({'posts': options['posts']} if options['posts'] else {}))
+
+                dataset, results = self.benchmark(endpoints, options)
+            finally:
+                # A local cache holds entries of the benchmark database too
+                cache.clear()
+                redis_client.flushdb()
+
+        report = {
+            'meta': {
+                'commit': self.current_commit(),
+                'iterations': options['iterations'],
+                'warmup': options['warmup'],
+                'dataset': dataset,
+                'cache_backend': settings.CACHES['default']['BACKEND'],
+            },
+            'endpoints': results,
+            'skipped': skipped,
+            'uncovered': self.uncovered_routes(),
+        }
+
+        for route in report['uncovered']:
+            self.stderr.write(self.style.WARNING(f'No benchmark for {route}'))
+
+        # Sorted and indented, so two reports diff line by line
+        content = json.dumps(report, indent=2, sort_keys=True)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(content + '\n')
+        else:
+            self.stdout.write(content)
+
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                self.print_changes(compare_reports(json.load(baseline), report))
+
+    def benchmark(self, endpoints, options):
+        dataset = {
+            'posts': Post.objects.count(),
+            'categories': Category.objects.count(),
+            'comments': Comment.objects.count(),
+            'users': UserAccount.objects.count(),
+        }
+        fixtures = self.fixtures()
+        client = APIClient()
+        headers = {'HTTP_API_KEY': settings.VALID_API_KEYS[0]}
+        access_token = RefreshToken.for_user(fixtures['user']).access_token
+        auth_headers = {**headers, 'HTTP_AUTHORIZATION': f'{jwt_settings.AUTH_HEADER_TYPES[0]} {access_token}'}
+        results = {}
+
+        for endpoint in endpoints:
+            self.stderr.write(f'{endpoint.name}...', ending='')
+            results[endpoint.name] = measure(
+                client, endpoint, fixtures, auth_headers if endpoint.authenticated else headers,
+                options['iterations'], options['warmup'],
+            )
+            self.stderr.write(f' p50 {results[endpoint.name]["p50_ms"]}ms')
+
+        return dataset, results
+
+    def fixtures(self):
+        # The most viewed published post is the hot path, its author signs the authenticated requests
+        post = Post.postobjects.select_related('user', 'category').order_by('-post_analytics__views', '-id').first()
+
+        if post is None:
+            raise CommandError('There are no published posts, run seed_blog first.')
+
+        comment = (
+            Comment.objects.filter(post=post, parent=None)
+            .annotate(replies_total=Count('replies'))
+            .order_by('-replies_total', '-id')
+            .first()
+        )
+        own_comment = Comment.objects.create(user=post.user, post=post, content='<p>Benchmark</p>')
+
+        return {
+            'post': post,
+            'user': post.user,
+            'category': post.category,
+            'comment': comment or own_comment,
+            'own_comment': own_comment,
+            'search': post.title.split()[0],
+            'otp_secret': pyotp.random_base32(),
+            'sequence': itertools.count(),
+        }
+
+    def current_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def uncovered_routes(self):
+        # Routes added to the benchmarked urlconfs without an endpoint here
+        covered = {endpoint.path for endpoint in ENDPOINTS}
+        routes = []
+
+        for resolver in get_resolver().url_patterns:
+            if isinstance(resolver, URLResolver) and resolver.urlconf_name in BENCHMARKED_URLCONFS:
+                for pattern in resolver.url_patterns:
+                    routes.append(f'/{resolver.pattern}{pattern.pattern}')
+
+        return sorted(route for route in routes if route not in covered)
+
+    def print_changes(self, changes):
+        if not changes:
+            self.stderr.write('No changes against the baseline.')
+            return
+
+        for name, metric, before, after, change in changes:
+            line = f'{name:<36} {metric:<16} {before} -> {after}'
+            if change is not None:
+                line += f' ({change:+.1f}%)'
+            style = self.style.ERROR if after > before else self.style.SUCCESS
+            self.stderr.write(style(line))
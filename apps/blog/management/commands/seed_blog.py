@@ -0,0 +1,465 @@
+import csv
+import io
+import ipaddress
+import itertools
+import random
+import uuid
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+from faker import Faker
+
+from apps.authentication.models import UserAccount
+from apps.userprofile.models import UserProfile
+from apps.blog.models import (
+    Category,
+    CategoryAnalytics,
+    Post,
+    PostAnalytics,
+    Heading,
+    Comment,
+    PostLike,
+    PostShare,
+    PostView,
+    PostInteraction,
+)
+from apps.blog.search import update_post_search_vector
+
+
+DEVICE_TYPES = ('desktop', 'mobile', 'tablet')
+DEVICE_WEIGHTS = (55, 38, 7)
+SHARE_PLATFORMS = ('facebook', 'twitter', 'linkedin', 'whatsapp', 'other')
+SEARCH_VECTOR_BATCH_SIZE = 2000
+
+# All that is kept of a post once its row was copied, events only need these
+SeededPost = namedtuple('SeededPost', ('id', 'created_at', 'category_id'))
+
+
+def column_default(field):
+    # Callable defaults such as uuid4 are called again for every row, the others only once
+    if field.has_default() and callable(field.default):
+        return field.get_default
+    value = field.get_default()
+    return lambda: value
+
+
+def copy_rows(model, rows, chunk_size):
+    """
+    Streams dicts keyed by field attname into the model table with COPY, chunk_size
+    rows at a time. Missing fields take the model default, like bulk_create would,
+    but timestamps are written as given. Returns the number of rows.
+    """
+    fields = [field for field in model._meta.concrete_fields]
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    sql = f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    defaults = {field.attname: column_default(field) for field in fields}
+
+    total = 0
+    rows = iter(rows)
+
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return total
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in chunk:
+            values = (row[field.attname] if field.attname in row else defaults[field.attname]() for field in fields)
+            writer.writerow(['\\N' if value is None else value for value in values])
+        buffer.seek(0)
+
+        with connection.cursor() as cursor:
+            raw_cursor = cursor.cursor
+            if hasattr(raw_cursor, 'copy_expert'):
+                raw_cursor.copy_expert(sql, buffer)
+            else:
+                with raw_cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+
+        total += len(chunk)
+
+
+class Command(BaseCommand):
+    help = 'Seeds the blog with a large, reproducible dataset with Zipfian post popularity.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--categories', type=int, default=24)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=None, help='Defaults to 3 per post.')
+        parser.add_argument('--likes', type=int, default=None, help='Defaults to 2 per post.')
+        parser.add_argument('--views', type=int, default=None, help='Defaults to 25 per post.')
+        parser.add_argument('--shares', type=int, default=None, help='Defaults to 1 per 2 posts.')
+        parser.add_argument('--days', type=int, default=365, help='Posts are spread over this many days.')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent of post popularity.')
+        parser.add_argument('--published-ratio', type=float, default=0.9)
+        parser.add_argument('--chunk-size', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        self.chunk_size = options['chunk_size']
+        self.prefix = f'seed{options["seed"]}'
+
+        if connection.vendor != 'postgresql':
+            raise CommandError('seed_blog writes with COPY and needs PostgreSQL.')
+
+        if UserAccount.objects.filter(username__startswith=f'{self.prefix}-').exists():
+            raise CommandError(f'Seed {options["seed"]} was already loaded, use another --seed.')
+
+        faker = Faker()
+        faker.seed_instance(options['seed'])
+        self.vocabulary = [faker.unique.word() for _ in range(min(900, len(faker.get_words_list())))]
+        self.names = [(faker.first_name(), faker.last_name()) for _ in range(500)]
+
+        posts = options['posts']
+        counts = {
+            'comments': options['comments'] if options['comments'] is not None else posts * 3,
+            'likes': options['likes'] if options['likes'] is not None else posts * 2,
+            'views': options['views'] if options['views'] is not None else posts * 25,
+            'shares': options['shares'] if options['shares'] is not None else posts // 2,
+        }
+
+        with transaction.atomic():
+            users = self.seed_users(options['users'])
+            categories = self.seed_categories(options['categories'])
+            seeded_posts = self.seed_posts(posts, users, categories, options['days'], options['published_ratio'])
+            self.seed_headings(seeded_posts)
+
+            # Every event picks its post by popularity rank, rank r weighs 1 / r^s
+            self.rng.shuffle(seeded_posts)
+            cum_weights = list(itertools.accumulate(1 / (rank ** options['zipf']) for rank in range(1, len(seeded_posts) + 1)))
+            self.pick_posts = lambda k: self.rng.choices(seeded_posts, cum_weights=cum_weights, k=k)
+
+            totals = defaultdict(lambda: defaultdict(int))
+            self.seed_comments(counts['comments'], users, totals)
+            self.seed_likes(counts['likes'], users, totals)
+            self.seed_views(counts['views'], users, totals)
+            self.seed_shares(counts['shares'], users, totals)
+            self.seed_analytics(seeded_posts, categories, totals)
+
+        self.stdout.write('Updating search vectors...')
+        post_ids = [post.id for post in seeded_posts]
+        for start in range(0, len(post_ids), SEARCH_VECTOR_BATCH_SIZE):
+            update_post_search_vector(post_ids[start:start + SEARCH_VECTOR_BATCH_SIZE])
+
+        # Likes and signed in views repeated by the same user were dropped, these are the totals kept
+        seeded = {metric: sum(post[metric] for post in totals.values()) for metric in ('likes', 'views', 'shares')}
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(users)} users, {len(categories)} categories, {len(seeded_posts)} posts, '
+            f'{counts["comments"]} comments, {seeded["likes"]} likes, {seeded["views"]} views '
+            f'and {seeded["shares"]} shares.'
+        ))
+
+    def uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def sentence(self, words):
+        return ' '.join(self.rng.choices(self.vocabulary, k=words)).capitalize() + '.'
+
+    def moment_after(self, start):
+        return start + (self.now - start) * self.rng.random()
+
+    def ip_address(self):
+        return str(ipaddress.IPv4Address(self.rng.randint(0x0B000000, 0xDEFFFFFF)))
+
+    def anonymous_ip_address(self, post_id, n):
+        # Spreads the n-th view of a post over the same range, never twice for one post
+        # (2654435761 shares no factor with the span)
+        span = 0xDEFFFFFF - 0x0B000000 + 1
+        return str(ipaddress.IPv4Address(0x0B000000 + (post_id.int + n * 2654435761) % span))
+
+    def copy(self, model, rows):
+        total = copy_rows(model, rows, self.chunk_size)
+        self.stdout.write(f'{model.__name__}: {total}')
+        return total
+
+    def copy_with_interactions(self, model, rows, interaction):
+        # Events and the PostInteraction rows made from them are copied chunk by chunk,
+        # so neither is ever held in memory whole
+        rows = iter(rows)
+        total = 0
+
+        while True:
+            chunk = list(itertools.islice(rows, self.chunk_size))
+            if not chunk:
+                break
+
+            copy_rows(model, chunk, self.chunk_size)
+            copy_rows(PostInteraction, (interaction(row) for row in chunk), self.chunk_size)
+            total += len(chunk)
+
+        self.stdout.write(f'{model.__name__}: {total}')
+        return total
+
+    def seed_users(self, total):
+        password = make_password('password')
+        users = []
+
+        for index in range(total):
+            first_name, last_name = self.rng.choice(self.names)
+            users.append({
+                'id': self.uuid(),
+                'email': f'{self.prefix}_{index}@example.com',
+                'username': f'{self.prefix}-{index}',
+                'first_name': first_name,
+                'last_name': last_name,
+                'password': password,
+                'role': 'editor' if index % 20 == 0 else 'customer',
+                'is_active': True,
+                'verified': True,
+                'created_at': self.now,
+                'updated_at': self.now,
+            })
+
+        self.copy(UserAccount, users)
+        # Profiles are normally created by a post_save receiver
+        self.copy(UserProfile, ({'id': self.uuid(), 'user_id': user['id'], 'biography': ''} for user in users))
+
+        # A fixed address per user, so a signed in viewer is (user, ip) unique by construction
+        for user in users:
+            user['ip_address'] = self.ip_address()
+
+        return users
+
+    def seed_categories(self, total):
+        categories = []
+
+        for index in range(total):
+            # A quarter are roots, the rest hang under an earlier category
+            parent = self.rng.choice(categories) if categories and index >= total // 4 else None
+            category_id = self.uuid()
+            name = f'{self.sentence(2)[:-1]} {index}'
+            categories.append({
+                'id': category_id,
+                'parent_id': parent['id'] if parent else None,
+                'name': name,
+                'title': name,
+                'description': self.sentence(12),
+                'slug': f'{slugify(name)}-{self.prefix}',
+                'path': f'{parent["path"] if parent else ""}{category_id.hex}/',
+                'depth': parent['depth'] + 1 if parent else 0,
+            })
+
+        self.copy(Category, categories)
+        self.copy(CategoryAnalytics, ({'id': self.uuid(), 'category_id': category['id']} for category in categories))
+
+        return categories
+
+    def seed_posts(self, total, users, categories, days, published_ratio):
+        authors = [user for user in users if user['role'] == 'editor'] or users
+        first_day = self.now - timedelta(days=days)
+        posts = []
+
+        def rows():
+            for index in range(total):
+                title = self.sentence(self.rng.randint(4, 9))
+                created_at = self.moment_after(first_day)
+                row = {
+                    'id': self.uuid(),
+                    'user_id': self.rng.choice(authors)['id'],
+                    'title': title[:128],
+                    'description': self.sentence(self.rng.randint(10, 20))[:256],
+                    'content': ''.join(f'<p>{self.sentence(self.rng.randint(12, 30))}</p>' for _ in range(self.rng.randint(3, 12))),
+                    'thumbnail': '',
+                    'keywords': ', '.join(self.rng.sample(self.vocabulary, 5))[:128],
+                    'slug': f'{slugify(title)[:100]}-{self.prefix}-{index}',
+                    'category_id': self.rng.choice(categories)['id'],
+                    'status': 'published' if self.rng.random() < published_ratio else 'draft',
+                    'created_at': created_at,
+                    'updated_at': self.moment_after(created_at),
+                }
+                posts.append(SeededPost(row['id'], row['created_at'], row['category_id']))
+                yield row
+
+        self.copy(Post, rows())
+        return posts
+
+    def seed_headings(self, posts):
+        def headings():
+            for post in posts:
+                for order in range(self.rng.randint(3, 6)):
+                    title = self.sentence(self.rng.randint(2, 6))[:-1]
+                    yield {
+                        'id': self.uuid(),
+                        'post_id': post.id,
+                        'title': title,
+                        'slug': slugify(title),
+                        'level': 2 if order == 0 or self.rng.random() < 0.6 else 3,
+                        'order': order,
+                    }
+
+        self.copy(Heading, headings())
+
+    def seed_comments(self, total, users, totals):
+        # Grouped by post, so replies can point at earlier comments of the same thread
+        per_post = defaultdict(int)
+        for post in self.pick_posts(total):
+            per_post[post.id] += 1
+
+        def comments():
+            for post_id, count in per_post.items():
+                thread = []
+                for _ in range(count):
+                    parent = self.rng.choice(thread) if thread and self.rng.random() < 0.35 else None
+                    comment_id = self.uuid()
+                    user = self.rng.choice(users)
+                    created_at = self.moment_after(parent['created_at'] if parent else self.now - timedelta(days=30))
+                    comment = {
+                        'id': comment_id,
+                        'user_id': user['id'],
+                        'post_id': post_id,
+                        'parent_id': parent['id'] if parent else None,
+                        'content': f'<p>{self.sentence(self.rng.randint(5, 40))}</p>',
+                        'created_at': created_at,
+                        'updated_at': created_at,
+                        'is_active': self.rng.random() > 0.02,
+                        'path': f'{parent["path"] if parent else ""}{comment_id.hex}/',
+                        'depth': parent['depth'] + 1 if parent else 0,
+                        'ip_address': user['ip_address'],
+                    }
+                    thread.append(comment)
+
+                    # Every active comment, replies too, as the comment views recount it
+                    if comment['is_active']:
+                        totals[post_id]['comments'] += 1
+
+                    yield comment
+
+        self.copy_with_interactions(Comment, comments(), lambda comment: self.interaction(
+            'comment', comment['post_id'], comment['user_id'], comment['ip_address'], comment['created_at'],
+            comment_id=comment['id'],
+        ))
+
+    def seed_likes(self, total, users, totals):
+        seen = set()
+
+        def likes():
+            for post in self.pick_posts(total):
+                user = self.rng.choice(users)
+                if (post.id, user['id']) in seen:
+                    continue
+                seen.add((post.id, user['id']))
+                totals[post.id]['likes'] += 1
+                yield {
+                    'id': self.uuid(),
+                    'post_id': post.id,
+                    'user_id': user['id'],
+                    'ip_address': user['ip_address'],
+                    'timestamp': self.moment_after(post.created_at),
+                }
+
+        self.copy_with_interactions(PostLike, likes(), lambda like: self.interaction(
+            'like', like['post_id'], like['user_id'], like['ip_address'], like['timestamp'],
+        ))
+
+    def seed_views(self, total, users, totals):
+        # Most readers are anonymous, each with an address of their own per post (blog_postview_anonymous_uniq)
+        seen = set()
+
+        def views():
+            for post in self.pick_posts(total):
+                user = self.rng.choice(users) if self.rng.random() < 0.2 else None
+                if user:
+                    if (post.id, user['id']) in seen:
+                        continue
+                    seen.add((post.id, user['id']))
+
+                ip_address = user['ip_address'] if user else self.anonymous_ip_address(post.id, totals[post.id]['views'])
+                totals[post.id]['views'] += 1
+                yield {
+                    'id': self.uuid(),
+                    'post_id': post.id,
+                    'user_id': user['id'] if user else None,
+                    'ip_address': ip_address,
+                    'timestamp': self.moment_after(post.created_at),
+                }
+
+        self.copy_with_interactions(PostView, views(), lambda view: self.interaction(
+            'view', view['post_id'], view['user_id'], view['ip_address'], view['timestamp'],
+        ))
+
+    def seed_shares(self, total, users, totals):
+        def shares():
+            for post in self.pick_posts(total):
+                user = self.rng.choice(users)
+                totals[post.id]['shares'] += 1
+                yield {
+                    'id': self.uuid(),
+                    'post_id': post.id,
+                    'user_id': user['id'],
+                    'platform': self.rng.choice(SHARE_PLATFORMS),
+                    'timestamp': self.moment_after(post.created_at),
+                    'ip_address': user['ip_address'],
+                }
+
+        self.copy_with_interactions(PostShare, shares(), lambda share: self.interaction(
+            'share', share['post_id'], share['user_id'], share['ip_address'], share['timestamp'],
+        ))
+
+    def interaction(self, interaction_type, post_id, user_id, ip_address, timestamp, comment_id=None):
+        return {
+            'id': self.uuid(),
+            'user_id': user_id,
+            'post_id': post_id,
+            'comment_id': comment_id,
+            'interaction_type': interaction_type,
+            'interaction_category': 'passive' if interaction_type == 'view' else 'active',
+            'weight': 1.0,
+            'timestamp': timestamp,
+            'device_type': self.rng.choices(DEVICE_TYPES, weights=DEVICE_WEIGHTS)[0],
+            'ip_address': ip_address,
+            'hour_of_day': timestamp.hour,
+            'day_of_week': timestamp.weekday(),
+        }
+
+    def seed_analytics(self, posts, categories, totals):
+        category_totals = defaultdict(lambda: defaultdict(int))
+
+        def post_analytics():
+            for post in posts:
+                counts = totals[post.id]
+                impressions = counts['views'] * self.rng.randint(3, 8) + self.rng.randint(0, 50)
+                clicks = int(counts['views'] * self.rng.uniform(0.6, 1.0))
+
+                category_totals[post.category_id]['views'] += counts['views']
+                category_totals[post.category_id]['impressions'] += impressions
+                category_totals[post.category_id]['clicks'] += clicks
+
+                yield {
+                    'id': self.uuid(),
+                    'post_id': post.id,
+                    'views': counts['views'],
+                    'impressions': impressions,
+                    'clicks': clicks,
+                    'click_through_rate': clicks / impressions * 100 if impressions else 0,
+                    'avg_time_on_page': round(self.rng.uniform(10, 300), 2),
+                    'likes': counts['likes'],
+                    'comments': counts['comments'],
+                    'shares': counts['shares'],
+                }
+
+        self.copy(PostAnalytics, post_analytics())
+
+        # The rows created in seed_categories are filled in with what their posts got
+        with connection.cursor() as cursor:
+            for category in categories:
+                counts = category_totals[category['id']]
+                cursor.execute(
+                    f"""
+                    UPDATE {connection.ops.quote_name(CategoryAnalytics._meta.db_table)}
+                    SET views = %s, impressions = %s, clicks = %s,
+                        click_through_rate = CASE WHEN %s > 0 THEN %s::float / %s * 100 ELSE 0 END
+                    WHERE category_id = %s
+                    """,
+                    [counts['views'], counts['impressions'], counts['clicks'],
+                     counts['impressions'], counts['clicks'], counts['impressions'], category['id']],
+                )
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.6 on 2026-10-16 22:34
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Func, Value
+
+
+def populate_search_vector(apps, schema_editor):
+    # A copy of apps.blog.search.post_search_vector as it was when this migration was written
+    config = getattr(settings, 'BLOG_SEARCH_CONFIG', 'english')
+    content = Func(
+        F('content'), Value('<[^>]+>'), Value(' '), Value('g'),
+        function='regexp_replace',
+        output_field=models.TextField(),
+    )
+    search_vector = (
+        django.contrib.postgres.search.SearchVector('title', weight='A', config=config) +
+        django.contrib.postgres.search.SearchVector('keywords', weight='A', config=config) +
+        django.contrib.postgres.search.SearchVector('description', weight='B', config=config) +
+        django.contrib.postgres.search.SearchVector(content, weight='C', config=config)
+    )
+
+    Post = apps.get_model('blog', 'Post')
+    Post.objects.update(search_vector=search_vector)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_alter_postinteraction_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='blog_post_search_vector_gin'),
+        ),
+        migrations.RunPython(populate_search_vector, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.1.6 on 2026-10-16 22:40
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_post_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupCheckpoint',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('high_water_mark', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CategoryDailyRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('bucket', models.DateTimeField()),
+                ('interaction_type', models.CharField(choices=[('view', 'View'), ('like', 'Like'), ('comment', 'Comment'), ('share', 'Share')], max_length=20)),
+                ('device_type', models.CharField(blank=True, default='', max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('weight', models.FloatField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='blog.category')),
+            ],
+            options={
+                'ordering': ['bucket'],
+                'abstract': False,
+                'unique_together': {('category', 'bucket', 'interaction_type', 'device_type')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CategoryHourlyRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('bucket', models.DateTimeField()),
+                ('interaction_type', models.CharField(choices=[('view', 'View'), ('like', 'Like'), ('comment', 'Comment'), ('share', 'Share')], max_length=20)),
+                ('device_type', models.CharField(blank=True, default='', max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('weight', models.FloatField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_rollups', to='blog.category')),
+            ],
+            options={
+                'ordering': ['bucket'],
+                'abstract': False,
+                'unique_together': {('category', 'bucket', 'interaction_type', 'device_type')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PostDailyRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('bucket', models.DateTimeField()),
+                ('interaction_type', models.CharField(choices=[('view', 'View'), ('like', 'Like'), ('comment', 'Comment'), ('share', 'Share')], max_length=20)),
+                ('device_type', models.CharField(blank=True, default='', max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('weight', models.FloatField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='blog.post')),
+            ],
+            options={
+                'ordering': ['bucket'],
+                'abstract': False,
+                'unique_together': {('post', 'bucket', 'interaction_type', 'device_type')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PostHourlyRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('bucket', models.DateTimeField()),
+                ('interaction_type', models.CharField(choices=[('view', 'View'), ('like', 'Like'), ('comment', 'Comment'), ('share', 'Share')], max_length=20)),
+                ('device_type', models.CharField(blank=True, default='', max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('weight', models.FloatField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_rollups', to='blog.post')),
+            ],
+            options={
+                'ordering': ['bucket'],
+                'abstract': False,
+                'unique_together': {('post', 'bucket', 'interaction_type', 'device_type')},
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.6 on 2026-10-16 22:43
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def populate_comment_paths(apps, schema_editor):
+    Comment = apps.get_model('blog', 'Comment')
+
+    parents = dict(Comment.objects.values_list('id', 'parent_id'))
+    children = defaultdict(list)
+    for comment_id, parent_id in parents.items():
+        children[parent_id].append(comment_id)
+
+    paths, depths, descendants = {}, {}, defaultdict(int)
+    stack = [(comment_id, '', 0) for comment_id in children[None]]
+    while stack:
+        comment_id, parent_path, depth = stack.pop()
+        paths[comment_id] = f'{parent_path}{comment_id.hex}/'
+        depths[comment_id] = depth
+        stack.extend((child_id, paths[comment_id], depth + 1) for child_id in children[comment_id])
+
+    for comment_id in paths:
+        parent_id = parents[comment_id]
+        while parent_id is not None:
+            descendants[parent_id] += 1
+            parent_id = parents[parent_id]
+
+    comments = [
+        Comment(id=comment_id, path=path, depth=depths[comment_id], descendants_count=descendants[comment_id])
+        for comment_id, path in paths.items()
+    ]
+    Comment.objects.bulk_update(comments, ['path', 'depth', 'descendants_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_interaction_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='descendants_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=2048),
+        ),
+        migrations.RunPython(populate_comment_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.6 on 2026-10-16 22:47
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_comment_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryUniqueViewSnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('registers', models.BinaryField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unique_view_snapshots', to='blog.category')),
+            ],
+            options={
+                'ordering': ['date'],
+                'abstract': False,
+                'unique_together': {('category', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PostUniqueViewSnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('registers', models.BinaryField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unique_view_snapshots', to='blog.post')),
+            ],
+            options={
+                'ordering': ['date'],
+                'abstract': False,
+                'unique_together': {('post', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.6 on 2026-10-16 22:51
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def populate_category_paths(apps, schema_editor):
+    Category = apps.get_model('blog', 'Category')
+
+    children = defaultdict(list)
+    for category_id, parent_id in Category.objects.values_list('id', 'parent_id'):
+        children[parent_id].append(category_id)
+
+    categories = []
+    stack = [(category_id, '', 0) for category_id in children[None]]
+    while stack:
+        category_id, parent_path, depth = stack.pop()
+        path = f'{parent_path}{category_id.hex}/'
+        categories.append(Category(id=category_id, path=path, depth=depth))
+        stack.extend((child_id, path, depth + 1) for child_id in children[category_id])
+
+    Category.objects.bulk_update(categories, ['path', 'depth'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_unique_view_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=2048),
+        ),
+        migrations.RunPython(populate_category_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.6 on 2026-10-16 22:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def dedupe_published_slugs(apps, schema_editor):
+    # The oldest published post keeps the slug, newer duplicates get a short id suffix
+    Post = apps.get_model('blog', 'Post')
+
+    duplicated = (
+        Post.objects.filter(status='published')
+        .values('slug')
+        .annotate(total=models.Count('id'))
+        .filter(total__gt=1)
+        .values_list('slug', flat=True)
+    )
+
+    for slug in duplicated:
+        posts = Post.objects.filter(status='published', slug=slug).order_by('created_at', 'id')
+        for post in list(posts)[1:]:
+            post.slug = f'{slug}-{post.id.hex[:8]}'
+            post.save(update_fields=['slug'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_category_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['slug'], name='blog_category_slug_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created_at', '-id'], name='blog_comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['slug'], name='blog_post_slug_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('status', 'published')), fields=['-created_at', '-id'], name='blog_post_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postinteraction',
+            index=models.Index(fields=['user', 'post', 'timestamp'], name='blog_interaction_user_post_ts'),
+        ),
+        migrations.RunPython(dedupe_published_slugs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='post',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'published')), fields=('slug',), name='blog_post_published_slug_uniq'),
+        ),
+    ]
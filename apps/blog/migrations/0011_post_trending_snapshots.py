@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-16 23:21
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_flagged_interactions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostTrendingSnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('taken_at', models.DateTimeField()),
+                ('rank', models.PositiveIntegerField()),
+                ('log_score', models.FloatField()),
+                ('score', models.FloatField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trending_snapshots', to='blog.post')),
+            ],
+            options={
+                'ordering': ['-taken_at', 'rank'],
+                'indexes': [models.Index(fields=['taken_at', 'rank'], name='blog_trending_taken_rank')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-16 23:24
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_post_trending_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedPosts',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('fingerprint', models.CharField(max_length=40)),
+                ('neighbours', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='related_posts', to='blog.post')),
+            ],
+        ),
+    ]
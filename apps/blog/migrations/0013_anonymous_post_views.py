@@ -0,0 +1,37 @@
+# Generated by Django 5.1.6 on 2026-10-16 23:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def dedupe_anonymous_views(apps, schema_editor):
+    # The oldest anonymous view of a post from one address is kept
+    PostView = apps.get_model('blog', 'PostView')
+
+    duplicated = (
+        PostView.objects.filter(user__isnull=True)
+        .values('post_id', 'ip_address')
+        .annotate(total=models.Count('id'))
+        .filter(total__gt=1)
+    )
+
+    for view in duplicated:
+        views = PostView.objects.filter(user__isnull=True, post_id=view['post_id'], ip_address=view['ip_address'])
+        keep = views.order_by('timestamp', 'id').values_list('id', flat=True).first()
+        views.exclude(id=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_related_posts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_anonymous_views, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='postview',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('post', 'ip_address'), name='blog_postview_anonymous_uniq'),
+        ),
+    ]
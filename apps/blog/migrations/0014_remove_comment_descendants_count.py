@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-17 00:48
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0013_anonymous_post_views'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='comment',
+            name='descendants_count',
+        ),
+    ]
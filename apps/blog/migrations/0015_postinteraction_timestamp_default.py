@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-17 00:51
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0014_remove_comment_descendants_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='postinteraction',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,13 +1,28 @@
 import uuid
 from django.db import models
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.text import slugify
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from ckeditor.fields import RichTextField
 
 from .utils import get_client_ip
+from .search import SEARCH_FIELDS, update_post_search_vector
+from .listing_cache import bump_listing_generation
+from .counters import increment_post_counter, increment_category_counter
+from .impressions import record_post_impressions, record_category_impressions
+from .threads import invalidate_comment_tree
+from .detail_cache import invalidate_post_detail
+from .category_tree import invalidate_category_tree
+from .anomalies import track_interactions
+from .trending import record_trending
+from .unique_views import hll_enabled, exact_views_enabled, add_unique_viewers, viewer_token
 
 
 User = settings.AUTH_USER_MODEL
@@ -32,8 +47,47 @@ class Category(models.Model):
     thumbnail = models.ImageField(upload_to=category_thumbnail_directory, blank=True, null=True)
     slug = models.CharField(max_length=128)
 
+    # Materialized path of ancestor ids ("<root>/<child>/.../<self>/"), a subtree is path__startswith
+    path = models.CharField(max_length=2048, db_index=True, editable=False, default='')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['slug'], name='blog_category_slug_idx'),
+        ]
+
     def __str__(self):
         return self.name
+
+    def get_descendants(self, include_self=False):
+        descendants = Category.objects.filter(path__startswith=self.path)
+        if not include_self:
+            descendants = descendants.exclude(id=self.id)
+        return descendants
+
+    def save(self, *args, **kwargs):
+        old_path, old_depth = self.path, self.depth
+
+        # Read from the database, the parent instance in memory may predate a move
+        parent_path, parent_depth = '', -1
+        if self.parent_id:
+            parent_path, parent_depth = Category.objects.filter(id=self.parent_id).values_list('path', 'depth').get()
+
+        if old_path and parent_path.startswith(old_path):
+            raise ValueError('A category cannot be moved under itself or one of its subcategories.')
+
+        self.path = f'{parent_path}{self.id.hex}/'
+        self.depth = parent_depth + 1
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            # A move rewrites the path prefix of the whole subtree in one UPDATE
+            if old_path and old_path != self.path:
+                Category.objects.filter(path__startswith=old_path).exclude(id=self.id).update(
+                    path=Concat(Value(self.path), Substr('path', len(old_path) + 1)),
+                    depth=models.F('depth') + (self.depth - old_depth),
+                )
     
 
 class CategoryView(models.Model):
@@ -63,21 +117,24 @@ class CategoryAnalytics(models.Model):
         self.save()
 
     def increment_click(self):
-        self.clicks += 1
-        self.save()
-        self._update_click_through_rate()
+        increment_category_counter(self.category_id, 'clicks')
 
     def increment_impressions(self):
-        self.impressions += 1
-        self.save()
-        self._update_click_through_rate()
+        record_category_impressions([self.category_id])
 
     def increment_view(self, ip_address):
+        if hll_enabled():
+            new_viewers = add_unique_viewers('category', [(self.category_id, viewer_token(ip_address))])
+            if exact_views_enabled():
+                CategoryView.objects.get_or_create(category=self.category, ip_address=ip_address)
+            if new_viewers.get(str(self.category_id)):
+                increment_category_counter(self.category_id, 'views', new_viewers[str(self.category_id)])
+            return
+
         if not CategoryView.objects.filter(category=self.category, ip_address=ip_address).exists():
             CategoryView.objects.create(category=self.category, ip_address=ip_address)
 
-            self.views += 1
-            self.save()
+            increment_category_counter(self.category_id, 'views')
 
 
 class Post(models.Model):
@@ -105,6 +162,8 @@ class Post(models.Model):
     status = models.CharField(max_length=10, choices=status_options, default='draft')
     views = models.IntegerField(default=0)
 
+    search_vector = SearchVectorField(null=True, editable=False)
+
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -113,6 +172,15 @@ class Post(models.Model):
 
     class Meta:
         ordering = ('status', '-created_at',)
+        indexes = [
+            GinIndex(fields=['search_vector'], name='blog_post_search_vector_gin'),
+            models.Index(fields=['slug'], name='blog_post_slug_idx'),
+            # Post.postobjects listings, newest first
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(status='published'), name='blog_post_published_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['slug'], condition=models.Q(status='published'), name='blog_post_published_slug_uniq'),
+        ]
 
     def __str__(self):
         return self.title
@@ -131,14 +199,31 @@ class Comment(models.Model):
 
     is_active = models.BooleanField(default=True)
 
+    # Materialized path of ancestor ids ("<root>/<child>/.../<self>/"), a subtree is path__startswith
+    path = models.CharField(max_length=2048, db_index=True, editable=False, default='')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['post', '-created_at', '-id'], name='blog_comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return f'Comment by {self.user.username} on {self.post.title}'
     
     def get_replies(self):
         return self.replies.filter(is_active=True)
+
+    def get_ancestor_ids(self):
+        return self.path.split('/')[:-2]
+
+    def save(self, *args, **kwargs):
+        if not self.path:
+            parent_path = self.parent.path if self.parent else ''
+            self.path = f'{parent_path}{self.id.hex}/'
+            self.depth = self.parent.depth + 1 if self.parent else 0
+        super().save(*args, **kwargs)
     
 
 class PostLike(models.Model):
@@ -200,7 +285,7 @@ class PostInteraction(models.Model):
     interaction_type = models.CharField(max_length=20, choices=INTERACTION_CHOICES)
     interaction_category = models.CharField(max_length=50, choices=INTERACTION_TYPE_CATEGORIES, default='passive')
     weight = models.FloatField(default=1.0)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
     device_type = models.CharField(max_length=50, blank=True, null=True, choices=(('desktop', 'Desktop'), ('mobile', 'Mobile'), ('tablet', 'Tablet')))
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     hour_of_day = models.IntegerField(null=True, blank=True)
@@ -209,6 +294,9 @@ class PostInteraction(models.Model):
     class Meta:
         unique_together = ('user', 'post', 'interaction_type', 'comment')
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['user', 'post', 'timestamp'], name='blog_interaction_user_post_ts'),
+        ]
 
     def __str__(self):
         username = self.user.username if self.user else 'Anonymous'
@@ -245,6 +333,26 @@ class PostInteraction(models.Model):
         super().save(*args, **kwargs)
 
 
+class FlaggedInteraction(models.Model):
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='flagged_interactions')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='flagged_interactions', null=True, blank=True)
+    ip_address = models.GenericIPAddressField(blank=True, null=True)
+    interaction_type = models.CharField(max_length=20, choices=PostInteraction.INTERACTION_CHOICES)
+    count = models.PositiveIntegerField()
+    window_seconds = models.PositiveIntegerField()
+    reviewed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        actor = self.user.username if self.user else self.ip_address
+        return f"{actor} {self.interaction_type} x{self.count} on {self.post.title}"
+
+
 class PostView(models.Model):
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -256,6 +364,10 @@ class PostView(models.Model):
     class Meta:
         unique_together = ('post', 'user', 'ip_address')
         ordering = ['-timestamp']
+        constraints = [
+            # unique_together never matches a NULL user, anonymous viewers need their own
+            models.UniqueConstraint(fields=['post', 'ip_address'], condition=models.Q(user__isnull=True), name='blog_postview_anonymous_uniq'),
+        ]
 
     def __str__(self):
         return f"View by {self.user.username if self.user else 'Anonymous'} on {self.post.title}"
@@ -284,23 +396,142 @@ class PostAnalytics(models.Model):
         self.save()
 
     def increment_metric(self, metric_name):
-        if hasattr(self, metric_name):
-            setattr(self, metric_name, getattr(self, metric_name) + 1)
-            self.save()
-        else:
-            raise ValueError(f'Metric {metric_name} does not exist in PostAnalytics')
+        increment_post_counter(self.post_id, metric_name)
+
+    def increment_click(self):
+        increment_post_counter(self.post_id, 'clicks')
+
+    def increment_impressions(self):
+        record_post_impressions([self.post_id])
 
     def increment_like(self):
-        self.likes += 1
-        self.save()
+        increment_post_counter(self.post_id, 'likes')
 
     def increment_comment(self):
-        self.comments += 1
-        self.save()
+        increment_post_counter(self.post_id, 'comments')
 
     def increment_share(self):
-        self.shares += 1
-        self.save()
+        increment_post_counter(self.post_id, 'shares')
+
+
+class InteractionRollup(models.Model):
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    bucket = models.DateTimeField()
+    interaction_type = models.CharField(max_length=20, choices=PostInteraction.INTERACTION_CHOICES)
+    device_type = models.CharField(max_length=50, blank=True, default='')
+    count = models.PositiveIntegerField(default=0)
+    weight = models.FloatField(default=0)
+
+    class Meta:
+        abstract = True
+        ordering = ['bucket']
+
+
+class PostHourlyRollup(InteractionRollup):
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='hourly_rollups')
+
+    class Meta(InteractionRollup.Meta):
+        unique_together = ('post', 'bucket', 'interaction_type', 'device_type')
+
+
+class PostDailyRollup(InteractionRollup):
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='daily_rollups')
+
+    class Meta(InteractionRollup.Meta):
+        unique_together = ('post', 'bucket', 'interaction_type', 'device_type')
+
+
+class CategoryHourlyRollup(InteractionRollup):
+
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='hourly_rollups')
+
+    class Meta(InteractionRollup.Meta):
+        unique_together = ('category', 'bucket', 'interaction_type', 'device_type')
+
+
+class CategoryDailyRollup(InteractionRollup):
+
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_rollups')
+
+    class Meta(InteractionRollup.Meta):
+        unique_together = ('category', 'bucket', 'interaction_type', 'device_type')
+
+
+class RollupCheckpoint(models.Model):
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=64, unique=True)
+    high_water_mark = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.name} @ {self.high_water_mark}'
+
+
+class UniqueViewSnapshot(models.Model):
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    date = models.DateField()
+    # Raw HyperLogLog registers as returned by GET, they can be loaded back into Redis and merged
+    registers = models.BinaryField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        ordering = ['date']
+
+
+class PostUniqueViewSnapshot(UniqueViewSnapshot):
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='unique_view_snapshots')
+
+    class Meta(UniqueViewSnapshot.Meta):
+        unique_together = ('post', 'date')
+
+
+class CategoryUniqueViewSnapshot(UniqueViewSnapshot):
+
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='unique_view_snapshots')
+
+    class Meta(UniqueViewSnapshot.Meta):
+        unique_together = ('category', 'date')
+
+
+class PostTrendingSnapshot(models.Model):
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='trending_snapshots')
+    taken_at = models.DateTimeField()
+    rank = models.PositiveIntegerField()
+    # The sorted set score, it can be loaded back into Redis as is, see trending.restore_trending
+    log_score = models.FloatField()
+    # Weighted interactions decayed to taken_at
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['-taken_at', 'rank']
+        indexes = [
+            models.Index(fields=['taken_at', 'rank'], name='blog_trending_taken_rank'),
+        ]
+
+    def __str__(self):
+        return f'#{self.rank} {self.post_id} @ {self.taken_at}'
+
+
+class RelatedPosts(models.Model):
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, related_name='related_posts')
+    # Of the text the neighbours were computed from, see related.update_related_posts
+    fingerprint = models.CharField(max_length=40)
+    # [[post id, cosine similarity]], best first
+    neighbours = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Related to {self.post_id}'
 
 
 class Heading(models.Model):
@@ -337,7 +568,79 @@ def create_post_analytics(sender, instance, created, **kwargs):
         PostAnalytics.objects.create(post=instance)
 
 
+@receiver(post_save, sender=Post)
+def sync_post_search_vector(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & set(SEARCH_FIELDS):
+        return
+    update_post_search_vector([instance.id])
+
+
 @receiver(post_save, sender=Category)
 def create_category_analytics(sender, instance, created, **kwargs):
     if created:
-        CategoryAnalytics.objects.create(category=instance)
\ No newline at end of file
+        CategoryAnalytics.objects.create(category=instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_listing_cache(sender, instance, **kwargs):
+    transaction.on_commit(bump_listing_generation)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_thread(sender, instance, **kwargs):
+    post_slug = Post.objects.filter(id=instance.post_id).values_list('slug', flat=True).first()
+    if post_slug:
+        transaction.on_commit(lambda: invalidate_comment_tree(post_slug))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_detail_cache(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_post_detail(instance.slug))
+
+
+@receiver(post_save, sender=Heading)
+@receiver(post_delete, sender=Heading)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=PostLike)
+@receiver(post_delete, sender=PostLike)
+def invalidate_parent_post_detail_cache(sender, instance, **kwargs):
+    post_slug = Post.objects.filter(id=instance.post_id).values_list('slug', flat=True).first()
+    if post_slug:
+        transaction.on_commit(lambda: invalidate_post_detail(post_slug))
+
+
+@receiver(post_save, sender=Category)
+def invalidate_category_post_details(sender, instance, created, **kwargs):
+    # The category is nested in every post body
+    if not created:
+        post_slugs = list(Post.objects.filter(category=instance).values_list('slug', flat=True))
+
+        def invalidate():
+            for slug in post_slugs:
+                invalidate_post_detail(slug)
+
+        transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_cached_category_tree(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_category_tree)
+
+
+@receiver(post_save, sender=PostInteraction)
+def track_interaction_rate(sender, instance, created, **kwargs):
+    if created:
+        track_interactions(instance.interaction_type, [(instance.post_id, instance.user_id, instance.ip_address, instance.timestamp)])
+
+
+@receiver(post_save, sender=PostInteraction)
+def update_trending_score(sender, instance, created, **kwargs):
+    if created:
+        record_trending([(instance.post_id, instance.interaction_type, instance.weight, instance.timestamp)])
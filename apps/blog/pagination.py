@@ -0,0 +1,232 @@
+import base64
+import datetime
+import json
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework_api.serializers import APIResponseSerializer
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+class KeysetPagination:
+    """
+    Seek based pagination. The page is selected in SQL with a
+    `(field, ..., id) > cursor` predicate plus LIMIT, so only the rows
+    of the requested page are fetched and serialized. The total is
+    counted on the first page and carried in the cursors of the next ones.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering, page_size=6):
+        # ordering: tuple of model fields/annotations, last one must be unique (usually 'id')
+        self.ordering = tuple(ordering)
+        self.page_size = page_size
+        self.max_page_size = getattr(settings, 'MAX_PAGE_SIZE', 100)
+        self.count = None
+        self.next_position = None
+        self.previous_position = None
+
+    def paginate_queryset(self, queryset, request):
+        position, reverse = self._start(queryset, request)
+
+        if self.count is None:
+            self.count = queryset.count()
+        results = list(self._page_queryset(queryset, position, reverse))
+
+        return self._finish(results, position, reverse)
+
+    async def apaginate_queryset(self, queryset, request):
+        position, reverse = self._start(queryset, request)
+
+        if self.count is None:
+            self.count = await queryset.acount()
+        results = [instance async for instance in self._page_queryset(queryset, position, reverse)]
+
+        return self._finish(results, position, reverse)
+
+    def _start(self, queryset, request):
+        self.request = request
+        self.page_size = self._get_page_size(request)
+        position, reverse, self.count = self._decode_cursor(request)
+
+        if position is not None:
+            position = self._coerce_position(queryset, position)
+
+        return position, reverse
+
+    def _page_queryset(self, queryset, position, reverse):
+        # One row more than the page, to know whether there is a next one
+        ordering = self._reversed_ordering() if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+
+        if position is not None:
+            queryset = queryset.filter(self._seek_predicate(position, reverse))
+
+        return queryset[:self.page_size + 1]
+
+    def _finish(self, results, position, reverse):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            has_next = position is not None
+            has_previous = has_more
+        else:
+            has_next = has_more
+            has_previous = position is not None
+
+        self.next_position = self._get_position(results[-1]) if has_next and results else None
+        self.previous_position = self._get_position(results[0]) if has_previous and results else None
+
+        return results
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self._encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self._encode_cursor(self.previous_position, reverse=True)
+
+    def get_paginated_data(self, data):
+        return {
+            'results': data,
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        }
+
+    def _get_page_size(self, request):
+        page_size = self.page_size
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            pass
+
+        if page_size < 1:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def _reversed_ordering(self):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering)
+
+    def _seek_predicate(self, position, reverse):
+        # (a, b, c) after (x, y, z)  =>  a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        predicate = Q()
+        equal = {}
+
+        for field, value in zip(self.ordering, position):
+            descending = field.startswith('-')
+            name = field.lstrip('-')
+            lookup = 'lt' if descending != reverse else 'gt'
+
+            predicate |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+
+        return predicate
+
+    def _get_position(self, instance):
+        return [_encode_value(getattr(instance, field.lstrip('-'))) for field in self.ordering]
+
+    def _encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': int(reverse), 'c': self.count}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def _decode_cursor(self, request):
+        # Returns (position, reverse, count), count is None when it has to be counted
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False, None
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position = payload['p']
+            reverse = bool(payload.get('r', 0))
+            count = payload.get('c')
+        except (TypeError, ValueError, KeyError, UnicodeError, AttributeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(count, int) or isinstance(count, bool) or count < 0:
+            count = None
+
+        return position, reverse, count
+
+    def _coerce_position(self, queryset, position):
+        # Cursors come from the client, every value is parsed by the field it is compared with
+        coerced = []
+
+        for field, value in zip(self.ordering, position):
+            if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+                raise NotFound(self.invalid_cursor_message)
+
+            name = field.lstrip('-')
+            try:
+                output_field = queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                output_field = queryset.query.annotations[name].output_field
+
+            try:
+                value = output_field.to_python(value)
+                # Integer range, so an out of range value never reaches the database
+                output_field.run_validators(value)
+            except (ValidationError, ValueError, TypeError, OverflowError):
+                raise NotFound(self.invalid_cursor_message)
+
+            coerced.append(value)
+
+        return coerced
+
+
+class KeysetPaginationMixin:
+    """
+    Adds queryset level pagination to a StandardAPIView, keeping the
+    same response envelope as `StandardAPIView.paginate`.
+    """
+
+    def keyset_paginate(self, request, queryset, serializer_class, ordering, context=None):
+        paginator = KeysetPagination(ordering)
+        page = paginator.paginate_queryset(queryset, request)
+        serialized = serializer_class(page, many=True, context=context or {}).data
+        return paginator.get_paginated_data(serialized)
+
+    async def akeyset_paginate(self, request, queryset, serializer_class, ordering, context=None):
+        paginator = KeysetPagination(ordering)
+        page = await paginator.apaginate_queryset(queryset, request)
+        # Serializers read pending counters with the sync Redis client, so they run on a thread
+        serialized = await sync_to_async(lambda: serializer_class(page, many=True, context=context or {}).data)()
+        return paginator.get_paginated_data(serialized)
+
+    def paginated_response(self, data):
+        serializer = APIResponseSerializer(
+            {
+                'success': True,
+                'status': status.HTTP_200_OK,
+                **data,
+            }
+        )
+        return Response(serializer.data)
@@ -0,0 +1,272 @@
+import hashlib
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.db import transaction
+from django.utils.html import strip_tags
+
+
+# Related posts are the nearest published posts by cosine similarity of TF-IDF vectors built
+# from keywords, category, title, description and content. update_related_posts stores the
+# top RELATED_POSTS_COUNT per post in RelatedPosts, the post detail body (cached) carries them.
+RELATED_POSTS_COUNT = getattr(settings, 'BLOG_RELATED_POSTS_COUNT', 5)
+# Rows of the similarity matrix computed at once, the dense block is BLOCK_SIZE x posts floats
+RELATED_BLOCK_SIZE = getattr(settings, 'BLOG_RELATED_BLOCK_SIZE', 256)
+
+# Term counts are multiplied by these, the category is also a term of its own
+FIELD_WEIGHTS = {
+    'keywords': 3,
+    'category': 3,
+    'title': 2,
+    'description': 1,
+    'content': 1,
+}
+
+_token_re = re.compile(r'[^\W_]{2,}')
+
+
+def _tokens(text):
+    return _token_re.findall(text.lower())
+
+
+def _document(post):
+    return {
+        'keywords': post.keywords.replace(',', ' '),
+        'category': f'{post.category.name} {post.category.title}',
+        'title': post.title,
+        'description': post.description,
+        'content': strip_tags(post.content or ''),
+    }
+
+
+def _term_counts(post, document):
+    counts = Counter()
+
+    for field, text in document.items():
+        for token in _tokens(text):
+            counts[token] += FIELD_WEIGHTS[field]
+
+    counts[f'category:{post.category_id}'] += FIELD_WEIGHTS['category']
+    return counts
+
+
+def _fingerprint(post, document):
+    # Changes whenever anything the vector is built from does
+    text = '\x1f'.join([str(post.category_id), *document.values()])
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def tfidf_matrix(term_counts):
+    """
+    L2 normalised TF-IDF rows, one per Counter in term_counts, as a CSR matrix:
+    sublinear tf (1 + log tf) times smoothed idf (1 + log((1 + n) / (1 + df))).
+    """
+    vocabulary = {}
+    rows, columns, values = [], [], []
+
+    for row, counts in enumerate(term_counts):
+        for term, count in counts.items():
+            rows.append(row)
+            columns.append(vocabulary.setdefault(term, len(vocabulary)))
+            values.append(count)
+
+    matrix = sparse.csr_matrix(
+        (np.array(values, dtype=np.float32), (rows, columns)),
+        shape=(len(term_counts), len(vocabulary)),
+    )
+
+    document_frequency = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    idf = np.log((1 + matrix.shape[0]) / (1 + document_frequency)) + 1
+
+    matrix.data = 1 + np.log(matrix.data)
+    matrix = matrix @ sparse.diags(idf.astype(np.float32))
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix, dtype=np.float32)
+
+
+def top_neighbours(matrix, rows, k=RELATED_POSTS_COUNT, block_size=RELATED_BLOCK_SIZE):
+    """
+    Yields (row, [(column, similarity)]) for every row in rows, the k most
+    similar other rows of matrix, best first. Similarities are computed
+    block_size rows at a time and only positive ones are kept.
+    """
+    transposed = matrix.T.tocsc()
+    k = min(k, matrix.shape[0] - 1)
+
+    if k <= 0:
+        for row in rows:
+            yield row, []
+        return
+
+    for start in range(0, len(rows), block_size):
+        block = np.asarray(rows[start:start + block_size])
+        similarities = (matrix[block] @ transposed).toarray()
+        similarities[np.arange(len(block)), block] = 0
+
+        # argpartition finds the k best of each row in O(posts), only those k are sorted
+        best = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        best_similarities = np.take_along_axis(similarities, best, axis=1)
+        order = np.argsort(-best_similarities, axis=1)
+
+        for row, columns, values in zip(
+            block,
+            np.take_along_axis(best, order, axis=1),
+            np.take_along_axis(best_similarities, order, axis=1),
+        ):
+            yield row, [(column, float(value)) for column, value in zip(columns, values) if value > 0]
+
+
+def similar_pairs(matrix, rows, block_size=RELATED_BLOCK_SIZE):
+    """
+    Yields (row, column, similarity) for every positive similarity of a row in
+    rows with another row of matrix, computed block_size rows at a time.
+    """
+    transposed = matrix.T.tocsc()
+
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        similarities = (matrix[block] @ transposed).tocoo()
+
+        for index, column, value in zip(similarities.row, similarities.col, similarities.data):
+            if value > 0 and column != block[index]:
+                yield block[index], column, float(value)
+
+
+def _merge(neighbours, candidates, dropped, k):
+    kept = [entry for entry in neighbours if entry[0] not in dropped]
+    merged = sorted(kept + candidates, key=lambda entry: entry[1], reverse=True)
+    return merged[:k]
+
+
+def update_related_posts(full=False):
+    """
+    Recomputes related posts and returns the number of posts rescored.
+
+    Only posts whose fingerprint changed (new or edited) are rescored unless
+    full is True. Their similarities are symmetric, so the same rows also
+    place them in, or take them out of, the lists of every other post. A full
+    list that loses a neighbour this way may have been missing the next best
+    post, that post is rescored too. Unchanged pairs keep the scores of the
+    run that computed them, the idf of the whole corpus only moves on full runs.
+    """
+    from .models import Post, RelatedPosts
+    from .detail_cache import invalidate_post_detail
+
+    posts = list(
+        Post.postobjects.select_related('category').only(
+            'id', 'slug', 'title', 'description', 'content', 'keywords', 'category__name', 'category__title',
+        ).order_by('id')
+    )
+    stored = {related.post_id: related for related in RelatedPosts.objects.all()}
+
+    documents = [_document(post) for post in posts]
+    fingerprints = [_fingerprint(post, document) for post, document in zip(posts, documents)]
+
+    ids = [post.id for post in posts]
+    published = set(ids)
+    removed = {post_id for post_id in stored if post_id not in published}
+
+    if full:
+        changed_rows = list(range(len(posts)))
+    else:
+        changed_rows = [
+            row for row, post in enumerate(posts)
+            if post.id not in stored or stored[post.id].fingerprint != fingerprints[row]
+        ]
+
+    if not changed_rows and not removed:
+        return 0
+
+    # The first run, or an edit touching every post, rescores everything anyway
+    full = full or len(changed_rows) == len(posts)
+    k = RELATED_POSTS_COUNT
+    matrix = tfidf_matrix([_term_counts(post, document) for post, document in zip(posts, documents)])
+    lists = {}
+
+    def rescore(rows):
+        for row, neighbours in top_neighbours(matrix, rows, k=k):
+            lists[ids[row]] = [[str(ids[column]), round(score, 6)] for column, score in neighbours]
+
+    rescore(changed_rows)
+    rescored = len(changed_rows)
+
+    if not full:
+        # Every other post can gain a changed post or lose a changed or removed one
+        dropped = {str(ids[row]) for row in changed_rows} | {str(post_id) for post_id in removed}
+        candidates = defaultdict(list)
+
+        for row, column, score in similar_pairs(matrix, changed_rows):
+            if ids[column] not in lists:
+                candidates[ids[column]].append([str(ids[row]), round(score, 6)])
+
+        rows = {post_id: row for row, post_id in enumerate(ids)}
+        backfill = []
+
+        for post_id, related in stored.items():
+            if post_id in lists or post_id in removed:
+                continue
+
+            lost = any(entry[0] in dropped for entry in related.neighbours)
+
+            if lost and len(related.neighbours) >= k:
+                backfill.append(rows[post_id])
+            elif lost or post_id in candidates:
+                lists[post_id] = _merge(related.neighbours, candidates[post_id], dropped, k)
+
+        rescore(backfill)
+        rescored += len(backfill)
+
+    fingerprints = dict(zip(ids, fingerprints))
+    slugs = {post.id: post.slug for post in posts}
+    updated = []
+
+    with transaction.atomic():
+        RelatedPosts.objects.filter(post_id__in=removed).delete()
+
+        for post_id, neighbours in lists.items():
+            related = stored.get(post_id)
+            fingerprint = fingerprints[post_id]
+
+            if related is not None and related.neighbours == neighbours and related.fingerprint == fingerprint:
+                continue
+
+            RelatedPosts.objects.update_or_create(
+                post_id=post_id, defaults={'fingerprint': fingerprint, 'neighbours': neighbours},
+            )
+            updated.append(slugs[post_id])
+
+    for slug in updated:
+        invalidate_post_detail(slug)
+
+    return rescored
+
+
+def get_related_posts(post_id):
+    """
+    The stored neighbours of a post that are still published, best first, as
+    [{'id', 'title', 'slug', 'description', 'score'}].
+    """
+    from .models import Post, RelatedPosts
+
+    neighbours = RelatedPosts.objects.filter(post_id=post_id).values_list('neighbours', flat=True).first()
+
+    if not neighbours:
+        return []
+
+    posts = {
+        str(post['id']): post
+        for post in Post.postobjects.filter(id__in=[post_id for post_id, _ in neighbours]).values(
+            'id', 'title', 'slug', 'description',
+        )
+    }
+
+    return [
+        {**posts[post_id], 'id': post_id, 'score': score}
+        for post_id, score in neighbours
+        if post_id in posts
+    ]
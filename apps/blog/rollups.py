@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import (
+    PostInteraction,
+    PostHourlyRollup,
+    PostDailyRollup,
+    CategoryHourlyRollup,
+    CategoryDailyRollup,
+    RollupCheckpoint,
+)
+
+
+CHECKPOINT_NAME = 'post_interactions'
+
+# Interactions younger than the lag may still be in flight in open transactions,
+# they are picked up on the next run.
+ROLLUP_LAG = timedelta(minutes=5)
+ROLLUP_WINDOW = timedelta(days=1)
+
+# (rollup model, entity column in the rollup, entity expression over the interaction, date_trunc unit)
+ROLLUPS = (
+    (PostHourlyRollup, 'post_id', 'interaction.post_id', 'hour'),
+    (PostDailyRollup, 'post_id', 'interaction.post_id', 'day'),
+    (CategoryHourlyRollup, 'category_id', 'post.category_id', 'hour'),
+    (CategoryDailyRollup, 'category_id', 'post.category_id', 'day'),
+)
+
+GRANULARITIES = {
+    'hourly': (PostHourlyRollup, CategoryHourlyRollup),
+    'daily': (PostDailyRollup, CategoryDailyRollup),
+}
+
+
+def _rollup_window(rollup_model, entity_column, entity_expression, unit, start, end):
+    quote = connection.ops.quote_name
+    table = quote(rollup_model._meta.db_table)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (id, {entity_column}, bucket, interaction_type, device_type, count, weight)
+            SELECT
+                gen_random_uuid(),
+                {entity_expression},
+                date_trunc('{unit}', interaction.timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+                interaction.interaction_type,
+                COALESCE(interaction.device_type, ''),
+                COUNT(*),
+                SUM(interaction.weight)
+            FROM {quote(PostInteraction._meta.db_table)} AS interaction
+            JOIN {quote(PostInteraction._meta.get_field('post').related_model._meta.db_table)} AS post
+                ON post.id = interaction.post_id
+            WHERE interaction.timestamp >= %s AND interaction.timestamp < %s
+            GROUP BY 2, 3, 4, 5
+            ON CONFLICT ({entity_column}, bucket, interaction_type, device_type) DO UPDATE
+            SET count = {table}.count + EXCLUDED.count,
+                weight = {table}.weight + EXCLUDED.weight
+            """,
+            [start, end],
+        )
+
+
+def update_rollups():
+    """
+    Adds every PostInteraction recorded since the high-water mark to the
+    hourly and daily rollups, one window per transaction.
+    """
+    end = timezone.now() - ROLLUP_LAG
+    windows = 0
+
+    while True:
+        with transaction.atomic():
+            checkpoint, _ = RollupCheckpoint.objects.select_for_update().get_or_create(
+                name=CHECKPOINT_NAME,
+                defaults={'high_water_mark': _first_interaction_time() or end},
+            )
+
+            start = checkpoint.high_water_mark
+            if start >= end:
+                return windows
+
+            window_end = min(start + ROLLUP_WINDOW, end)
+
+            for rollup_model, entity_column, entity_expression, unit in ROLLUPS:
+                _rollup_window(rollup_model, entity_column, entity_expression, unit, start, window_end)
+
+            checkpoint.high_water_mark = window_end
+            checkpoint.save(update_fields=['high_water_mark'])
+
+        windows += 1
+
+
+def _first_interaction_time():
+    first = PostInteraction.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+    if first is None:
+        return None
+    # Start on an hour boundary so the first window lines up with the hourly buckets
+    return first.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def get_rollup_series(rollup_model, since, **filters):
+    """
+    Returns [{bucket, interaction_type, device_type, count, weight}] summed per bucket.
+    """
+    return list(
+        rollup_model.objects.filter(bucket__gte=since, **filters)
+        .values('bucket', 'interaction_type', 'device_type')
+        .annotate(total=Sum('count'), total_weight=Sum('weight'))
+        .order_by('bucket', 'interaction_type', 'device_type')
+    )
+
+
+def get_post_series(post, granularity='daily', since=None):
+    post_model, _ = GRANULARITIES[granularity]
+    return get_rollup_series(post_model, since or datetime.min.replace(tzinfo=dt_timezone.utc), post=post)
+
+
+def get_category_series(category, granularity='daily', since=None):
+    _, category_model = GRANULARITIES[granularity]
+    return get_rollup_series(category_model, since or datetime.min.replace(tzinfo=dt_timezone.utc), category=category)
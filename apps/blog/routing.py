@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .consumers import PostCountersConsumer
+
+
+websocket_urlpatterns = [
+    path('ws/blog/post/<slug:slug>/', PostCountersConsumer.as_asgi()),
+]
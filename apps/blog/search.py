@@ -0,0 +1,64 @@
+import re
+
+from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import models
+from django.db.models import F, FloatField, Func, Value
+from django.db.models.functions import Cast
+
+
+SEARCH_CONFIG = getattr(settings, 'BLOG_SEARCH_CONFIG', 'english')
+
+# Fields that feed Post.search_vector, saving any other field leaves the vector untouched.
+SEARCH_FIELDS = ('title', 'keywords', 'description', 'content')
+
+
+def post_search_vector():
+    # Title and keywords rank above the description, the body (stripped of html tags) ranks last
+    content = Func(
+        F('content'), Value('<[^>]+>'), Value(' '), Value('g'),
+        function='regexp_replace',
+        output_field=models.TextField(),
+    )
+
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG) +
+        SearchVector('keywords', weight='A', config=SEARCH_CONFIG) +
+        SearchVector('description', weight='B', config=SEARCH_CONFIG) +
+        SearchVector(content, weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_post_search_vector(post_ids):
+    from .models import Post
+
+    Post.objects.filter(id__in=post_ids).update(search_vector=post_search_vector())
+
+
+def normalize_search_query(search):
+    return re.sub(r'\s+', ' ', search).strip().lower()
+
+
+def ranked_position(ranked_ids):
+    # The 1-based position of the row id in ranked_ids, to keyset paginate a ranking computed elsewhere
+    return Func(
+        Value(list(ranked_ids), output_field=ArrayField(models.UUIDField())),
+        F('id'),
+        function='array_position',
+        output_field=models.IntegerField(),
+    )
+
+
+def search_posts(queryset, search):
+    """
+    Restricts `queryset` to posts matching `search` and annotates
+    `search_rank`, their relevance. Listings page by (-search_rank, id) in
+    SQL, so every match is reachable, and whole pages are cached by the
+    listing cache under the listing generation.
+    """
+    query = SearchQuery(normalize_search_query(search), search_type='websearch', config=SEARCH_CONFIG)
+    # ts_rank is a real, as a double it compares equal to the value a cursor carries back
+    rank = Cast(SearchRank(F('search_vector'), query), output_field=FloatField())
+
+    return queryset.filter(search_vector=query).annotate(search_rank=rank)
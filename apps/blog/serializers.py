@@ -1,4 +1,6 @@
 from rest_framework import serializers
+from django.db.models import Count, Exists, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
 
 from .models import (
     Post, 
@@ -12,6 +14,25 @@ from .models import (
     CategoryAnalytics,
     PostAnalytics,
 )
+from .counters import get_pending_post_counters
+
+
+class PendingCountersListSerializer(serializers.ListSerializer):
+    # Fetches the unflushed counter deltas of the whole list in one Redis round trip
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        self.pending_counters = get_pending_post_counters([item.id for item in items])
+        return super().to_representation(items)
+
+
+class PendingCountersMixin:
+    def get_pending_counter(self, obj, metric):
+        pending = getattr(self.parent, 'pending_counters', None)
+
+        if pending is None:
+            pending = get_pending_post_counters([obj.id])
+
+        return pending.get(str(obj.id), {}).get(metric, 0)
 
 
 class CategorySerializer(serializers.ModelSerializer):    
@@ -65,7 +86,37 @@ class PostViewSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class PostSerializer(serializers.ModelSerializer):    
+def post_detail_queryset(user=None):
+    """
+    Published posts with everything PostSerializer reads: category and
+    analytics joined, headings prefetched, comment count and has_liked
+    annotated. Rendering a post from it costs two queries.
+    """
+    comments_count = (
+        Comment.objects.filter(post=OuterRef('pk'), parent=None, is_active=True)
+        .order_by()
+        .values('post')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+
+    if user is not None and user.is_authenticated:
+        has_liked = Exists(PostLike.objects.filter(post=OuterRef('pk'), user=user))
+    else:
+        has_liked = Value(False)
+
+    return (
+        Post.postobjects
+        .select_related('category', 'post_analytics')
+        .prefetch_related('headings')
+        .annotate(
+            annotated_comments_count=Coalesce(Subquery(comments_count), 0),
+            annotated_has_liked=has_liked,
+        )
+    )
+
+
+class PostSerializer(PendingCountersMixin, serializers.ModelSerializer):    
     category = CategorySerializer() 
     headings = HeadingSerializer(many=True) 
     comments_count = serializers.SerializerMethodField()
@@ -75,18 +126,26 @@ class PostSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Post
-        fields = '__all__'
+        exclude = ['search_vector']
+        list_serializer_class = PendingCountersListSerializer
 
     def get_view_count(self, obj):
-        return obj.post_analytics.views if obj.post_analytics else 0
+        views = obj.post_analytics.views if obj.post_analytics else 0
+        return views + self.get_pending_counter(obj, 'views')
     
     def get_comments_count(self, obj):
+        if hasattr(obj, 'annotated_comments_count'):
+            return obj.annotated_comments_count
         return obj.post_comments.filter(parent=None, is_active=True).count()
     
     def get_likes_count(self, obj):
-        return obj.likes.filter().count()
+        likes = obj.post_analytics.likes if obj.post_analytics else 0
+        return likes + self.get_pending_counter(obj, 'likes')
     
     def get_has_liked(self, obj):
+        if hasattr(obj, 'annotated_has_liked'):
+            return obj.annotated_has_liked
+
         user = self.context.get('request').user
 
         if user and user.is_authenticated:
@@ -95,7 +154,7 @@ class PostSerializer(serializers.ModelSerializer):
         return False
     
 
-class PostListSerializer(serializers.ModelSerializer):
+class PostListSerializer(PendingCountersMixin, serializers.ModelSerializer):
     category = CategorySerializer() 
     view_count = serializers.SerializerMethodField()
     
@@ -110,9 +169,11 @@ class PostListSerializer(serializers.ModelSerializer):
             'category',
             'view_count'
         ]
+        list_serializer_class = PendingCountersListSerializer
 
     def get_view_count(self, obj):
-        return obj.post_analytics.views if obj.post_analytics else 0
+        views = obj.post_analytics.views if obj.post_analytics else 0
+        return views + self.get_pending_counter(obj, 'views')
 
 
 class PostAnalyticsSerializer(serializers.Serializer):
@@ -167,6 +228,19 @@ class PostInteractionSerializer(serializers.Serializer):
         ]
 
 
+def comment_list_queryset():
+    """
+    Comments with the user and post joined (without the post body) and
+    the active replies counted, so listing them is a single query.
+    """
+    return (
+        Comment.objects
+        .select_related('user', 'post')
+        .defer('post__content', 'post__description', 'post__keywords', 'post__search_vector')
+        .annotate(annotated_replies_count=Count('replies', filter=Q(replies__is_active=True)))
+    )
+
+
 class CommentSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField()
     post_title = serializers.SerializerMethodField()
@@ -191,9 +265,28 @@ class CommentSerializer(serializers.ModelSerializer):
         return obj.post.title
     
     def get_replies_count(self, obj):
+        if hasattr(obj, 'annotated_replies_count'):
+            return obj.annotated_replies_count
         return obj.replies.filter(is_active=True).count()
 
 
+class CommentTreeSerializer(serializers.ModelSerializer):
+    """ One node of a nested thread, replies are filled in by apps.blog.threads """
+    user = serializers.StringRelatedField()
+
+    class Meta:
+        model = Comment
+        fields = [
+            'id',
+            'user',
+            'parent',
+            'content',
+            'created_at',
+            'updated_at',
+            'depth',
+        ]
+
+
 class PostLikeSerializer(serializers.Serializer):
     user = serializers.StringRelatedField()
     
@@ -1,16 +1,20 @@
 from celery import shared_task
 
 import logging
-import redis
-from django.conf import settings
 
-from .models import PostAnalytics, Post, CategoryAnalytics, Category
+from .models import PostAnalytics, Post, CategoryAnalytics, PostUniqueViewSnapshot, CategoryUniqueViewSnapshot
+from .impressions import flush_impressions
+from .counters import flush_counters, POST_COUNTERS, CATEGORY_COUNTERS
+from .rollups import update_rollups
+from .view_events import ingest_view_events
+from .unique_views import snapshot_unique_views
+from .detail_cache import refresh_post_detail
+from .live_counters import broadcast_counters
+from .trending import snapshot_trending
+from .related import update_related_posts
 
 logger = logging.getLogger(__name__)
 
-redis_client = redis.StrictRedis(host=settings.REDIS_HOST, port=6379, db=0)
-
-
 @shared_task
 def increment_post_impressions(post_id):
     try:
@@ -31,62 +35,95 @@ def increment_post_views_tasks(slug, ip_address):
 
 
 @shared_task
-def sync_impressions_to_db():
-    keys = redis_client.keys('post:impressions:*')
-    for key in keys:
-        try:
-            post_id = key.decode('utf-8').split(":")[-1]
+def refresh_post_detail_cache(slug):
+    try:
+        refresh_post_detail(slug)
+    except Exception as e:
+        logger.info(f'Error refreshing detail cache for Post slug {slug}: {str(e)}')
+
 
-            try:
-                post = Post.objects.get(id=post_id)
-            except Post.DoesNotExist:
-                logger.info(f"Post with ID {post_id} does not exist. Skipping.")
-                continue
+@shared_task
+def sync_impressions_to_db(shard=None):
+    try:
+        flushed = flush_impressions('post', PostAnalytics, 'post', shard=shard)
+        logger.info(f'Synced impressions for {flushed} posts')
+    except Exception as e:
+        logger.info(f'Error syncing post impressions: {str(e)}')
+
+
+@shared_task
+def sync_category_impressions_to_db(shard=None):
+    try:
+        flushed = flush_impressions('category', CategoryAnalytics, 'category', shard=shard)
+        logger.info(f'Synced impressions for {flushed} categories')
+    except Exception as e:
+        logger.info(f'Error syncing category impressions: {str(e)}')
 
-            impressions = int(redis_client.get(key))
-            if impressions == 0:
-                redis_client.delete(key)
-                continue
 
-            analytics, _ = PostAnalytics.objects.get_or_create(post=post)
-            analytics.impressions += impressions
-            analytics.save()
+@shared_task
+def sync_counters_to_db():
+    try:
+        flushed = flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
+        logger.info(f'Synced {flushed} post counters')
+    except Exception as e:
+        logger.info(f'Error syncing post counters: {str(e)}')
 
-            analytics._update_click_through_rate()
+    try:
+        flushed = flush_counters('category', CategoryAnalytics, 'category', CATEGORY_COUNTERS)
+        logger.info(f'Synced {flushed} category counters')
+    except Exception as e:
+        logger.info(f'Error syncing category counters: {str(e)}')
 
-            redis_client.delete(key)
 
-        except Exception as e:
-            logger.info(f'Error syncing impressions for {key}: {str(e)}')
+@shared_task
+def rollup_post_interactions():
+    try:
+        windows = update_rollups()
+        logger.info(f'Rolled up {windows} interaction windows')
+    except Exception as e:
+        logger.info(f'Error rolling up post interactions: {str(e)}')
 
 
 @shared_task
-def sync_category_impressions_to_db():
-    keys = redis_client.keys('category:impressions:*')
-    for key in keys:
-        try:
-            category_id = key.decode('utf-8').split(":")[-1]
-
-            try:
-                category = Category.objects.get(id=category_id)
-            except Category.DoesNotExist:
-                logger.info(f"Category with ID {category_id} does not exist. Skipping.")
-                continue
-
-            impressions = int(redis_client.get(key) or 0)
-
-            if impressions == 0:
-                redis_client.delete(key)
-                continue
-                
-            analytics, _ = CategoryAnalytics.objects.get_or_create(category=category)
-            
-            analytics.impressions += impressions
-            analytics.save()
-            
-            analytics._update_click_through_rate()
-            
-            redis_client.delete(key)
-                
-        except Exception as e:
-            logger.info(f'Error syncing impressions for {key}: {str(e)}')
\ No newline at end of file
+def ingest_post_view_events(max_batches=None):
+    try:
+        ingested = ingest_view_events(consumer=ingest_post_view_events.request.hostname or 'worker', max_batches=max_batches)
+        logger.info(f'Ingested {ingested} post views')
+    except Exception as e:
+        logger.info(f'Error ingesting post view events: {str(e)}')
+
+
+@shared_task
+def snapshot_unique_views_to_db():
+    try:
+        posts = snapshot_unique_views('post', PostUniqueViewSnapshot, 'post')
+        categories = snapshot_unique_views('category', CategoryUniqueViewSnapshot, 'category')
+        logger.info(f'Snapshot unique views for {posts} posts and {categories} categories')
+    except Exception as e:
+        logger.info(f'Error snapshotting unique views: {str(e)}')
+
+
+@shared_task
+def broadcast_post_counters(post_id):
+    try:
+        broadcast_counters(post_id)
+    except Exception as e:
+        logger.info(f'Error broadcasting counters for Post ID {post_id}: {str(e)}')
+
+
+@shared_task
+def snapshot_trending_posts():
+    try:
+        snapshotted = snapshot_trending()
+        logger.info(f'Snapshot {snapshotted} trending posts')
+    except Exception as e:
+        logger.info(f'Error snapshotting trending posts: {str(e)}')
+
+
+@shared_task
+def update_related_posts_index(full=False):
+    try:
+        rescored = update_related_posts(full=full)
+        logger.info(f'Rescored related posts for {rescored} posts')
+    except Exception as e:
+        logger.info(f'Error updating related posts: {str(e)}')
@@ -1,11 +1,76 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
 from django.conf import settings
 from django.core.cache import cache
-from rest_framework.test import APIClient
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.test import APIClient, APIRequestFactory
+from django.utils import timezone
 from unittest.mock import patch
+from io import StringIO
+import asyncio
+import base64
+import json
+import random
+import redis
+from collections import Counter
+from datetime import timedelta
 
-from .models import Category, Post, PostAnalytics, Heading
+from apps.authentication.models import UserAccount
+from core.cache import InstrumentedCacheMixin
+from core.redis_pool import InstrumentedBlockingConnectionPool, SharedConnectionFactory, get_redis_client, get_redis_pool, use_redis_db
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.core.cache import caches
+from django.urls import resolve
+from rest_framework_simplejwt.tokens import RefreshToken
+from django.db import connection, transaction, IntegrityError
+from django.db.models import F, Sum
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from .models import (
+    Category,
+    Post,
+    PostAnalytics,
+    Heading,
+    Comment,
+    PostLike,
+    PostShare,
+    PostInteraction,
+    PostView,
+    CategoryAnalytics,
+    CategoryView,
+    PostUniqueViewSnapshot,
+    FlaggedInteraction,
+    PostHourlyRollup,
+    CategoryDailyRollup,
+    PostTrendingSnapshot,
+    RelatedPosts,
+)
+from .serializers import PostSerializer, post_detail_queryset
+from .rollups import update_rollups
+from .impressions import impressions_key, record_post_impressions, flush_impressions, redis_client as impressions_redis
+from .counters import claim_key, counter_key, flush_counters, increment_post_counter, reset_counter, POST_COUNTERS
+from .unique_views import add_unique_viewers, count_unique_viewers, hll_key, merge_snapshots, snapshot_unique_views, redis_client as unique_views_redis
+from .anomalies import get_interaction_rate, redis_client as anomalies_redis
+from .view_events import ingest_events, ingest_view_events, redis_client as view_events_redis, VIEW_EVENTS_STREAM
+from .views import PostListView, CategoryListView, ListPostCommentsView
+from .async_views import AsyncPostListView, AsyncPostDetailView, AsyncCategoryListView, AsyncListPostCommentsView
+from .live_counters import broadcast_counters, watchers_key, throttle_key, LIVE_COUNTERS_INTERVAL, WATCHERS_TTL, redis_client as live_redis
+from .trending import (
+    TRENDING_KEY,
+    TRENDING_HALF_LIFE,
+    TRENDING_CACHE_TIMEOUT,
+    decayed_score,
+    get_trending_post_ids,
+    record_trending,
+    snapshot_trending,
+    redis_client as trending_redis,
+)
+from .listing_cache import cache_listing, acache_listing
+from .related import similar_pairs, tfidf_matrix, top_neighbours, update_related_posts
+from .management.commands.seed_blog import copy_rows
 
 # -------------- MODELS TESTS --------------
 
@@ -87,6 +152,8 @@ class PostAnalyticsModelTest(TestCase):
     def test_click_through_rate(self):
         self.analytics.increment_impressions()
         self.analytics.increment_click()
+        flush_impressions('post', PostAnalytics, 'post')
+        flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
         self.analytics.refresh_from_db()
         self.assertEqual(self.analytics.click_through_rate, 100.0)
 
@@ -176,4 +243,2104 @@ class PostListViewTest(TestCase):
 
         post_data = results[0]
         self.assertEqual(post_data['id'], str(self.post.id))
-        self.assertEqual(post_data['title'], str(self.post.title))
\ No newline at end of file
+        self.assertEqual(post_data['title'], str(self.post.title))
+
+class PostListKeysetPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.api_key = settings.VALID_API_KEYS[0]
+
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com',
+            password='password',
+            username='editor',
+            first_name='Test',
+            last_name='Editor',
+        )
+
+        self.category = Category.objects.create(
+            name='Tech',
+            title='Technology',
+            slug='tech'
+        )
+
+        now = timezone.now()
+        self.posts = [
+            Post.objects.create(
+                user=self.user,
+                title=f'Post {i}',
+                description='A test post',
+                content='Content for the post',
+                thumbnail=None,
+                keywords='test',
+                slug=f'post-{i}',
+                category=self.category,
+                status='published',
+                created_at=now - timedelta(minutes=i // 2),
+            )
+            for i in range(8)
+        ]
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_cursor_walks_every_post_once(self):
+        url = f"{reverse('posts-list')}?page_size=3"
+        seen = []
+
+        while url:
+            data = self.client.get(url, HTTP_API_KEY=self.api_key).json()
+            self.assertEqual(data['count'], 8)
+            seen.extend(post['id'] for post in data['results'])
+            url = data['next']
+
+        expected = sorted(self.posts, key=lambda post: (post.created_at, post.id), reverse=True)
+        self.assertEqual(seen, [str(post.id) for post in expected])
+
+    def test_previous_cursor_returns_previous_page(self):
+        url = f"{reverse('posts-list')}?page_size=3&ordering=az"
+        first = self.client.get(url, HTTP_API_KEY=self.api_key).json()
+        second = self.client.get(first['next'], HTTP_API_KEY=self.api_key).json()
+        back = self.client.get(second['previous'], HTTP_API_KEY=self.api_key).json()
+
+        self.assertIsNone(first['previous'])
+        self.assertEqual(
+            [post['title'] for post in second['results']],
+            ['Post 3', 'Post 4', 'Post 5'],
+        )
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(back['previous'])
+
+    def test_total_is_counted_on_the_first_page_only(self):
+        first = self.client.get(f"{reverse('posts-list')}?page_size=3", HTTP_API_KEY=self.api_key).json()
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(first['next'], HTTP_API_KEY=self.api_key).json()
+
+        self.assertEqual(second['count'], 8)
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+
+    def test_tampered_cursor_is_not_found(self):
+        for position in (
+            ['yesterday', str(self.posts[0].id)],
+            [self.posts[0].created_at.isoformat(), 'not-a-uuid'],
+            [{'created_at': 1}, None],
+            [True, 1],
+        ):
+            cursor = base64.urlsafe_b64encode(json.dumps({'p': position, 'r': 0}).encode('utf-8')).decode('ascii')
+            response = self.client.get(f"{reverse('posts-list')}?cursor={cursor}", HTTP_API_KEY=self.api_key)
+            self.assertEqual(response.status_code, 404, position)
+
+
+class PostSearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.api_key = settings.VALID_API_KEYS[0]
+
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com',
+            password='password',
+            username='editor',
+            first_name='Test',
+            last_name='Editor',
+        )
+
+        self.category = Category.objects.create(
+            name='Tech',
+            title='Technology',
+            slug='tech'
+        )
+
+        self.body_match = Post.objects.create(
+            user=self.user,
+            title='Weekly notes',
+            description='Assorted notes',
+            content='<p>Some thoughts on <strong>databases</strong> and indexes.</p>',
+            thumbnail=None,
+            keywords='notes',
+            slug='weekly-notes',
+            category=self.category,
+            status='published',
+        )
+
+        self.title_match = Post.objects.create(
+            user=self.user,
+            title='Databases in depth',
+            description='A long read',
+            content='<p>Storage engines.</p>',
+            thumbnail=None,
+            keywords='storage',
+            slug='databases-in-depth',
+            category=self.category,
+            status='published',
+        )
+
+        Post.objects.create(
+            user=self.user,
+            title='Cooking',
+            description='Recipes',
+            content='<p>Pasta.</p>',
+            thumbnail=None,
+            keywords='food',
+            slug='cooking',
+            category=self.category,
+            status='published',
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_search_is_ranked_by_relevance(self):
+        url = f"{reverse('posts-list')}?search=Database"
+        data = self.client.get(url, HTTP_API_KEY=self.api_key).json()
+
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(
+            [post['id'] for post in data['results']],
+            [str(self.title_match.id), str(self.body_match.id)],
+        )
+
+    def test_search_vector_follows_updates(self):
+        self.body_match.content = '<p>Nothing relevant.</p>'
+        self.body_match.save()
+
+        url = f"{reverse('posts-list')}?search=databases"
+        data = self.client.get(url, HTTP_API_KEY=self.api_key).json()
+
+        self.assertEqual([post['id'] for post in data['results']], [str(self.title_match.id)])
+
+    def test_every_match_is_paged_in_rank_order(self):
+        url = f"{reverse('posts-list')}?search=Database&page_size=1"
+        seen = []
+
+        while url:
+            data = self.client.get(url, HTTP_API_KEY=self.api_key).json()
+            seen.extend(post['id'] for post in data['results'])
+            url = data['next']
+
+        self.assertEqual(seen, [str(self.title_match.id), str(self.body_match.id)])
+
+    def test_results_follow_the_listing_generation(self):
+        url = f"{reverse('posts-list')}?search=databases"
+        self.client.get(url, HTTP_API_KEY=self.api_key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cooking = Post.objects.get(slug='cooking')
+            cooking.content = '<p>Databases in the kitchen.</p>'
+            cooking.save()
+
+        data = self.client.get(url, HTTP_API_KEY=self.api_key).json()
+        self.assertIn(str(cooking.id), [post['id'] for post in data['results']])
+
+
+class ListingCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.api_key = settings.VALID_API_KEYS[0]
+
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com',
+            password='password',
+            username='editor',
+            first_name='Test',
+            last_name='Editor',
+        )
+
+        self.category = Category.objects.create(
+            name='Tech',
+            title='Technology',
+            slug='tech'
+        )
+
+        self.post = Post.objects.create(
+            user=self.user,
+            title='Post 1',
+            description='A test post',
+            content='Content for the post',
+            thumbnail=None,
+            keywords='test',
+            slug='post-1',
+            category=self.category,
+            status='published',
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_cache_hit_runs_no_sql(self):
+        url = reverse('posts-list')
+        first = self.client.get(url, HTTP_API_KEY=self.api_key)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(url, HTTP_API_KEY=self.api_key)
+
+        self.assertEqual(first.content, second.content)
+
+    def test_category_list_is_cached(self):
+        url = reverse('category-list')
+        first = self.client.get(url)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+
+        self.assertEqual(second.json()['results'], [{'name': 'Tech', 'slug': 'tech'}])
+        self.assertEqual(first.content, second.content)
+
+    def test_post_save_invalidates_listings(self):
+        url = reverse('posts-list')
+        self.client.get(url, HTTP_API_KEY=self.api_key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.title = 'Renamed'
+            self.post.save()
+
+        data = self.client.get(url, HTTP_API_KEY=self.api_key).json()
+        self.assertEqual(data['results'][0]['title'], 'Renamed')
+
+
+class ImpressionRecordingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.api_key = settings.VALID_API_KEYS[0]
+
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com',
+            password='password',
+            username='editor',
+            first_name='Test',
+            last_name='Editor',
+        )
+
+        self.category = Category.objects.create(
+            name='Tech',
+            title='Technology',
+            slug='tech'
+        )
+
+        self.posts = [
+            Post.objects.create(
+                user=self.user,
+                title=f'Post {i}',
+                description='A test post',
+                content='Content for the post',
+                thumbnail=None,
+                keywords='test',
+                slug=f'post-{i}',
+                category=self.category,
+                status='published',
+            )
+            for i in range(3)
+        ]
+
+    def tearDown(self):
+        cache.clear()
+
+    @patch('apps.blog.impressions.IMPRESSIONS_SHARDS', 1)
+    @patch('apps.blog.impressions.current_bucket', return_value=1)
+    def test_only_page_posts_are_counted_in_one_hash(self, current_bucket):
+        key = impressions_key('post', 1, 0)
+        impressions_redis.delete(key)
+
+        url = f"{reverse('posts-list')}?page_size=2"
+        data = self.client.get(url, HTTP_API_KEY=self.api_key).json()
+        self.client.get(url, HTTP_API_KEY=self.api_key)
+
+        counts = {
+            post_id.decode('utf-8'): int(count)
+            for post_id, count in impressions_redis.hgetall(key).items()
+        }
+        self.assertEqual(counts, {post['id']: 2 for post in data['results']})
+
+        impressions_redis.delete(key)
+
+    def test_flush_applies_counts_and_click_through_rate(self):
+        flush_impressions('post', PostAnalytics, 'post')
+
+        post = self.posts[0]
+        PostAnalytics.objects.filter(post=post).update(clicks=1)
+
+        record_post_impressions([post.id, post.id, self.posts[1].id])
+        record_post_impressions([post.id])
+
+        self.assertEqual(flush_impressions('post', PostAnalytics, 'post'), 2)
+        self.assertEqual(flush_impressions('post', PostAnalytics, 'post'), 0)
+
+        analytics = PostAnalytics.objects.get(post=post)
+        self.assertEqual(analytics.impressions, 3)
+        self.assertAlmostEqual(analytics.click_through_rate, 100 / 3)
+        self.assertEqual(PostAnalytics.objects.get(post=self.posts[1]).impressions, 1)
+
+
+class WriteBehindCounterTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.api_key = settings.VALID_API_KEYS[0]
+
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com',
+            password='password',
+            username='editor',
+            first_name='Test',
+            last_name='Editor',
+        )
+
+        self.category = Category.objects.create(
+            name='Tech',
+            title='Technology',
+            slug='tech'
+        )
+
+        self.post = Post.objects.create(
+            user=self.user,
+            title='Post 1',
+            description='A test post',
+            content='Content for the post',
+            thumbnail=None,
+            keywords='test',
+            slug='post-1',
+            category=self.category,
+            status='published',
+        )
+
+        flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
+
+    def tearDown(self):
+        cache.clear()
+        flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
+
+    def test_pending_views_are_merged_into_listing(self):
+        increment_post_counter(self.post.id, 'views', 3)
+
+        data = self.client.get(reverse('posts-list'), HTTP_API_KEY=self.api_key).json()
+
+        self.assertEqual(data['results'][0]['view_count'], 3)
+        self.assertEqual(PostAnalytics.objects.get(post=self.post).views, 0)
+
+    def test_flush_applies_deltas(self):
+        increment_post_counter(self.post.id, 'views', 2)
+        increment_post_counter(self.post.id, 'likes')
+        increment_post_counter(self.post.id, 'views')
+
+        flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
+
+        analytics = PostAnalytics.objects.get(post=self.post)
+        self.assertEqual((analytics.views, analytics.likes), (3, 1))
+        self.assertEqual(flush_counters('post', PostAnalytics, 'post', POST_COUNTERS), 0)
+
+    def test_reset_drops_deltas_claimed_before_it(self):
+        increment_post_counter(self.post.id, 'likes', 2)
+
+        # A flush claimed the hash and died before applying it
+        claim_key(counter_key('post', 'likes'), 'counters:claimed:post:likes')
+        reset_counter(PostAnalytics, 'post', 'post', self.post.id, 'likes', 2)
+        increment_post_counter(self.post.id, 'likes')
+
+        with patch('apps.blog.counters.CLAIM_TIMEOUT', -1):
+            flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
+
+        # The recount already held the two claimed likes, only the later one is added
+        self.assertEqual(PostAnalytics.objects.get(post=self.post).likes, 3)
+
+
+class InteractionRollupTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com',
+            password='password',
+            username='editor',
+            first_name='Test',
+            last_name='Editor',
+        )
+
+        self.category = Category.objects.create(
+            name='Tech',
+            title='Technology',
+            slug='tech'
+        )
+
+        self.post = Post.objects.create(
+            user=self.user,
+            title='Post 1',
+            description='A test post',
+            content='Content for the post',
+            thumbnail=None,
+            keywords='test',
+            slug='post-1',
+            category=self.category,
+            status='published',
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def _interaction(self, interaction_type, timestamp, device_type=None):
+        interaction = PostInteraction.objects.create(
+            post=self.post,
+            interaction_type=interaction_type,
+            device_type=device_type,
+        )
+        PostInteraction.objects.filter(id=interaction.id).update(timestamp=timestamp)
+
+    def test_rollups_are_incremental(self):
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=3)
+
+        self._interaction('view', hour + timedelta(minutes=5), 'mobile')
+        self._interaction('like', hour + timedelta(minutes=10), 'mobile')
+        with patch('apps.blog.rollups.timezone.now', return_value=hour + timedelta(minutes=60)):
+            update_rollups()
+
+        self._interaction('share', hour + timedelta(minutes=90))
+        update_rollups()
+        update_rollups()
+
+        hourly = {
+            (row.bucket, row.interaction_type, row.device_type): row.count
+            for row in PostHourlyRollup.objects.filter(post=self.post)
+        }
+        self.assertEqual(hourly, {
+            (hour, 'view', 'mobile'): 1,
+            (hour, 'like', 'mobile'): 1,
+            (hour + timedelta(hours=1), 'share', ''): 1,
+        })
+        self.assertEqual(
+            CategoryDailyRollup.objects.filter(category=self.category).aggregate(total=Sum('count'))['total'],
+            3,
+        )
+
+    def test_series_days_are_bounded(self):
+        self.user.role = 'editor'
+        self.user.save(update_fields=['role'])
+        client = APIClient()
+        client.force_authenticate(self.user)
+        api_key = settings.VALID_API_KEYS[0]
+
+        for url, slug in (('/api/blog/post/interactions/', 'post-1'), ('/api/blog/category/interactions/', 'tech')):
+            for days in ('0', '366', str(10 ** 9), 'many'):
+                response = client.get(url, {'slug': slug, 'days': days}, HTTP_API_KEY=api_key)
+                self.assertEqual(response.status_code, 400)
+
+            response = client.get(url, {'slug': slug, 'days': '365'}, HTTP_API_KEY=api_key)
+            self.assertEqual(response.status_code, 200)
+
+
+class PostDetailQueryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com',
+            password='password',
+            username='editor',
+            first_name='Test',
+            last_name='Editor',
+        )
+
+        self.category = Category.objects.create(
+            name='Tech',
+            title='Technology',
+            slug='tech'
+        )
+
+        self.post = Post.objects.create(
+            user=self.user,
+            title='Post 1',
+            description='A test post',
+            content='Content for the post',
+            thumbnail=None,
+            keywords='test',
+            slug='post-1',
+            category=self.category,
+            status='published',
+        )
+
+        for order in range(5):
+            Heading.objects.create(post=self.post, title=f'Heading {order}', level=2, order=order)
+
+        for _ in range(3):
+            Comment.objects.create(user=self.user, post=self.post, content='Nice post')
+
+        PostLike.objects.create(post=self.post, user=self.user)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_detail_renders_in_two_queries(self):
+        request = APIRequestFactory().get('/')
+        request.user = self.user
+
+        with self.assertNumQueries(2):
+            post = post_detail_queryset(self.user).get(slug='post-1')
+            data = PostSerializer(post, context={'request': request}).data
+
+        self.assertEqual(data['comments_count'], 3)
+        self.assertTrue(data['has_liked'])
+        self.assertEqual(len(data['headings']), 5)
+        self.assertEqual(data['category']['slug'], 'tech')
+        self.assertNotIn('search_vector', data)
+
+
+class CommentListQueryCountTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.api_key = settings.VALID_API_KEYS[0]
+
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com',
+            password='password',
+            username='editor',
+            first_name='Test',
+            last_name='Editor',
+        )
+
+        self.category = Category.objects.create(
+            name='Tech',
+            title='Technology',
+            slug='tech'
+        )
+
+        self.post = Post.objects.create(
+            user=self.user,
+            title='Post 1',
+            description='A test post',
+            content='Content for the post',
+            thumbnail=None,
+            keywords='test',
+            slug='post-1',
+            category=self.category,
+            status='published',
+        )
+
+        self.parent = Comment.objects.create(user=self.user, post=self.post, content='First')
+        for i in range(20):
+            comment = Comment.objects.create(user=self.user, post=self.post, parent=self.parent, content=f'Reply {i}')
+            Comment.objects.create(user=self.user, post=self.post, parent=comment, content='Nested')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_post_comments_query_count(self):
+        # post lookup, count, page
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                '/api/blog/post/comments/?slug=post-1&page_size=50', HTTP_API_KEY=self.api_key
+            )
+
+        results = response.json()['results']
+        self.assertEqual(len(results), 41)
+        self.assertEqual(results[-1]['replies_count'], 20)
+        self.assertEqual(results[-1]['post_title'], 'Post 1')
+        self.assertEqual(results[-1]['user'], 'editor')
+
+    def test_comment_replies_query_count(self):
+        # parent lookup, count, page
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                f'/api/blog/post/comment/replies/?comment_id={self.parent.id}&page_size=50', HTTP_API_KEY=self.api_key
+            )
+
+        results = response.json()['results']
+        self.assertEqual(len(results), 20)
+        self.assertTrue(all(reply['replies_count'] == 1 for reply in results))
+
+
+class CommentThreadTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.api_key = settings.VALID_API_KEYS[0]
+
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com',
+            password='password',
+            username='editor',
+            first_name='Test',
+            last_name='Editor',
+        )
+
+        self.category = Category.objects.create(
+            name='Tech',
+            title='Technology',
+            slug='tech'
+        )
+
+        self.post = Post.objects.create(
+            user=self.user,
+            title='Post 1',
+            description='A test post',
+            content='Content for the post',
+            thumbnail=None,
+            keywords='test',
+            slug='post-1',
+            category=self.category,
+            status='published',
+        )
+
+        self.root = Comment.objects.create(user=self.user, post=self.post, content='Root')
+        self.child = Comment.objects.create(user=self.user, post=self.post, parent=self.root, content='Child')
+        self.grandchild = Comment.objects.create(user=self.user, post=self.post, parent=self.child, content='Grandchild')
+        self.other_root = Comment.objects.create(user=self.user, post=self.post, content='Other root')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_path_and_descendants_count(self):
+        self.grandchild.refresh_from_db()
+
+        self.assertEqual(self.grandchild.path, f'{self.root.id.hex}/{self.child.id.hex}/{self.grandchild.id.hex}/')
+        self.assertEqual(self.grandchild.depth, 2)
+
+        # Counted from the thread itself, comment writes update no ancestor
+        with CaptureQueriesContext(connection) as queries:
+            self.grandchild.delete()
+        self.assertFalse([query for query in queries.captured_queries if query['sql'].startswith('UPDATE "blog_comment"')])
+
+        tree = self.client.get('/api/blog/post/comments/tree/?slug=post-1', HTTP_API_KEY=self.api_key).json()['results']
+        self.assertEqual(tree[1]['descendants_count'], 1)
+
+    def test_whole_thread_in_one_query(self):
+        # post lookup, thread
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/blog/post/comments/tree/?slug=post-1', HTTP_API_KEY=self.api_key)
+
+        tree = response.json()['results']
+        self.assertEqual([node['content'] for node in tree], ['Other root', 'Root'])
+        self.assertEqual(tree[1]['descendants_count'], 2)
+        self.assertEqual(tree[1]['replies'][0]['replies'][0]['content'], 'Grandchild')
+
+        # The thread is cached as one object per post
+        with self.assertNumQueries(1):
+            self.client.get('/api/blog/post/comments/tree/?slug=post-1', HTTP_API_KEY=self.api_key)
+
+    def test_subtree_with_depth_limit(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                f'/api/blog/post/comments/tree/?slug=post-1&comment_id={self.root.id}&depth=1', HTTP_API_KEY=self.api_key
+            )
+
+        tree = response.json()['results']
+        self.assertEqual(len(tree), 1)
+        self.assertEqual(tree[0]['replies'][0]['content'], 'Child')
+        self.assertEqual(tree[0]['replies'][0]['replies'], [])
+
+    def test_inactive_comments_hide_their_replies(self):
+        Comment.objects.filter(id=self.child.id).update(is_active=False)
+
+        tree = self.client.get('/api/blog/post/comments/tree/?slug=post-1', HTTP_API_KEY=self.api_key).json()['results']
+        self.assertEqual([node['content'] for node in tree], ['Other root', 'Root'])
+        self.assertEqual(tree[1]['replies'], [])
+        self.assertEqual(tree[1]['descendants_count'], 0)
+
+        # Neither from the cached thread nor from the database
+        for _ in range(2):
+            response = self.client.get(
+                f'/api/blog/post/comments/tree/?slug=post-1&comment_id={self.grandchild.id}', HTTP_API_KEY=self.api_key
+            )
+            self.assertEqual(response.status_code, 404)
+            cache.clear()
+
+        # Replies of a hidden root are not promoted to roots
+        Comment.objects.filter(id=self.root.id).update(is_active=False)
+        Comment.objects.filter(id=self.child.id).update(is_active=True)
+        tree = self.client.get('/api/blog/post/comments/tree/?slug=post-1', HTTP_API_KEY=self.api_key).json()['results']
+        self.assertEqual([node['content'] for node in tree], ['Other root'])
+
+    def test_depth_limited_subtree_counts_every_active_descendant(self):
+        Comment.objects.create(user=self.user, post=self.post, parent=self.grandchild, content='Deep', is_active=False)
+
+        response = self.client.get(
+            f'/api/blog/post/comments/tree/?slug=post-1&comment_id={self.root.id}&depth=0', HTTP_API_KEY=self.api_key
+        )
+        self.assertEqual(response.json()['results'][0]['replies'], [])
+        self.assertEqual(response.json()['results'][0]['descendants_count'], 2)
+
+    def test_thread_invalidated_on_new_reply(self):
+        self.client.get('/api/blog/post/comments/tree/?slug=post-1', HTTP_API_KEY=self.api_key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user=self.user, post=self.post, parent=self.grandchild, content='Deep')
+
+        response = self.client.get(
+            f'/api/blog/post/comments/tree/?slug=post-1&comment_id={self.grandchild.id}', HTTP_API_KEY=self.api_key
+        )
+        self.assertEqual(response.json()['results'][0]['replies'][0]['content'], 'Deep')
+        self.assertEqual(response.json()['results'][0]['descendants_count'], 1)
+
+
+class ViewEventIngestionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        view_events_redis.delete(VIEW_EVENTS_STREAM)
+        self.client = APIClient()
+
+        self.api_key = settings.VALID_API_KEYS[0]
+
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com',
+            password='password',
+            username='editor',
+            first_name='Test',
+            last_name='Editor',
+        )
+
+        self.category = Category.objects.create(
+            name='Tech',
+            title='Technology',
+            slug='tech'
+        )
+
+        self.post = Post.objects.create(
+            user=self.user,
+            title='Post 1',
+            description='A test post',
+            content='Content for the post',
+            thumbnail=None,
+            keywords='test',
+            slug='post-1',
+            category=self.category,
+            status='published',
+        )
+
+        flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
+
+    def tearDown(self):
+        cache.clear()
+        view_events_redis.delete(VIEW_EVENTS_STREAM)
+        flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
+
+    def test_detail_read_does_not_write(self):
+        with patch('django.db.models.Model.save') as save, patch('django.db.models.QuerySet.bulk_create') as bulk_create:
+            response = self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key)
+
+        self.assertEqual(response.status_code, 200)
+        save.assert_not_called()
+        bulk_create.assert_not_called()
+        self.assertEqual(PostView.objects.count(), 0)
+        self.assertEqual(view_events_redis.xlen(VIEW_EVENTS_STREAM), 1)
+
+    def test_events_are_deduplicated_and_bulk_written(self):
+        for _ in range(3):
+            self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key)
+        self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key, REMOTE_ADDR='10.0.0.2')
+
+        self.assertEqual(ingest_view_events(), 2)
+
+        self.assertEqual(PostView.objects.filter(post=self.post).count(), 2)
+        self.assertEqual(PostInteraction.objects.filter(post=self.post, interaction_type='view').count(), 2)
+        self.assertEqual(view_events_redis.xlen(VIEW_EVENTS_STREAM), 0)
+
+        # A viewer that was already ingested is not counted again
+        self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key)
+        self.assertEqual(ingest_view_events(), 0)
+
+        flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
+        self.assertEqual(PostAnalytics.objects.get(post=self.post).views, 2)
+
+    def test_views_written_meanwhile_are_not_counted(self):
+        # As if another worker wrote this anonymous viewer after the batch was read
+        PostView.objects.create(post=self.post, ip_address='10.0.0.5')
+        now = timezone.now()
+
+        new_views = ingest_events([(self.post.id, None, '10.0.0.5', now), (self.post.id, str(self.user.id), '10.0.0.5', now)])
+
+        self.assertEqual(new_views, 1)
+        self.assertEqual(PostInteraction.objects.filter(post=self.post, interaction_type='view').count(), 1)
+        flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
+        self.assertEqual(PostAnalytics.objects.get(post=self.post).views, 1)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PostView.objects.create(post=self.post, ip_address='10.0.0.5')
+
+    def test_interactions_keep_the_time_of_the_event(self):
+        # An event that waited in the stream for a while
+        viewed_at = timezone.now() - timedelta(hours=5)
+
+        ingest_events([(self.post.id, None, '10.0.0.6', viewed_at)])
+
+        interaction = PostInteraction.objects.get(post=self.post, interaction_type='view')
+        self.assertEqual(interaction.timestamp, viewed_at)
+        self.assertEqual(interaction.hour_of_day, viewed_at.hour)
+        self.assertEqual(interaction.day_of_week, viewed_at.weekday())
+
+
+@patch('apps.blog.unique_views.UNIQUE_VIEWS_MODE', 'hll')
+class HyperLogLogUniqueViewsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self._clear_redis()
+        self.client = APIClient()
+
+        self.api_key = settings.VALID_API_KEYS[0]
+
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com',
+            password='password',
+            username='editor',
+            first_name='Test',
+            last_name='Editor',
+        )
+
+        self.category = Category.objects.create(
+            name='Tech',
+            title='Technology',
+            slug='tech'
+        )
+
+        self.post = Post.objects.create(
+            user=self.user,
+            title='Post 1',
+            description='A test post',
+            content='Content for the post',
+            thumbnail=None,
+            keywords='test',
+            slug='post-1',
+            category=self.category,
+            status='published',
+        )
+
+        flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
+
+    def tearDown(self):
+        cache.clear()
+        self._clear_redis()
+        flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
+
+    def _clear_redis(self):
+        for key in unique_views_redis.scan_iter(match='hll:*'):
+            unique_views_redis.delete(key)
+        view_events_redis.delete(VIEW_EVENTS_STREAM)
+
+    def test_post_views_counted_without_exact_table(self):
+        for ip_address in ['10.0.0.1', '10.0.0.2', '10.0.0.1']:
+            self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key, REMOTE_ADDR=ip_address)
+
+        self.assertEqual(ingest_view_events(), 2)
+        self.assertEqual(PostView.objects.count(), 0)
+        self.assertEqual(count_unique_viewers('post', [self.post.id])[str(self.post.id)], 2)
+
+        # Already in the HyperLogLog
+        self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(ingest_view_events(), 0)
+
+        flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
+        self.assertEqual(PostAnalytics.objects.get(post=self.post).views, 2)
+
+    def test_new_viewers_counted_on_large_estimates(self):
+        add_unique_viewers('post', [(self.post.id, f'|10.1.{i // 256}.{i % 256}') for i in range(20000)])
+        now = timezone.now()
+
+        # Most of these change no register, the estimate still grows by about as many
+        new_views = ingest_events([(self.post.id, None, f'10.2.{i // 256}.{i % 256}', now) for i in range(1000)])
+        self.assertAlmostEqual(new_views, 1000, delta=150)
+
+        # Already counted
+        self.assertEqual(ingest_events([(self.post.id, None, '10.2.0.1', now)]), 0)
+
+    def test_failed_batch_is_counted_on_retry(self):
+        events = [(self.post.id, None, '10.0.0.9', timezone.now())]
+
+        with patch.object(PostInteraction.objects, 'bulk_create', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                ingest_events(events)
+
+        self.assertEqual(count_unique_viewers('post', [self.post.id])[str(self.post.id)], 0)
+        self.assertEqual(ingest_events(events), 1)
+
+    @patch('apps.blog.unique_views.EXACT_VIEWS_AUDIT', True)
+    def test_exact_tables_kept_for_audit(self):
+        self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key)
+        ingest_view_events()
+
+        analytics = CategoryAnalytics.objects.get(category=self.category)
+        analytics.increment_view('10.0.0.1')
+        analytics.increment_view('10.0.0.1')
+
+        self.assertEqual(PostView.objects.count(), 1)
+        self.assertEqual(CategoryView.objects.count(), 1)
+        self.assertEqual(count_unique_viewers('category', [self.category.id])[str(self.category.id)], 1)
+
+    def test_daily_snapshot(self):
+        for ip_address in ['10.0.0.1', '10.0.0.2', '10.0.0.3']:
+            self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key, REMOTE_ADDR=ip_address)
+        ingest_view_events()
+
+        today = timezone.now().date()
+        self.assertEqual(snapshot_unique_views('post', PostUniqueViewSnapshot, 'post', day=today), 1)
+
+        snapshot = PostUniqueViewSnapshot.objects.get(post=self.post, date=today)
+        self.assertEqual(snapshot.count, 3)
+
+        # The registers survive the daily key and can be merged again
+        unique_views_redis.delete(hll_key('post', self.post.id, today))
+        self.assertEqual(merge_snapshots([snapshot]), 3)
+
+
+class PostDetailCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.api_key = settings.VALID_API_KEYS[0]
+
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com',
+            password='password',
+            username='editor',
+            first_name='Test',
+            last_name='Editor',
+        )
+
+        self.category = Category.objects.create(
+            name='Tech',
+            title='Technology',
+            slug='tech'
+        )
+
+        self.post = Post.objects.create(
+            user=self.user,
+            title='Post 1',
+            description='A test post',
+            content='Content for the post',
+            thumbnail=None,
+            keywords='test',
+            slug='post-1',
+            category=self.category,
+            status='published',
+        )
+
+        PostLike.objects.create(post=self.post, user=self.user)
+
+    def tearDown(self):
+        cache.clear()
+
+    def get_post(self):
+        return self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key)
+
+    def test_hit_serves_shared_body(self):
+        self.get_post()
+
+        # Only the live counters
+        with self.assertNumQueries(1):
+            response = self.get_post()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results']['title'], 'Post 1')
+        self.assertFalse(response.json()['results']['has_liked'])
+
+    def test_has_liked_overlay(self):
+        self.get_post()
+        self.client.force_authenticate(self.user)
+
+        # The live counters and the PostLike lookup
+        with self.assertNumQueries(2):
+            response = self.get_post()
+
+        self.assertTrue(response.json()['results']['has_liked'])
+
+    def test_counters_are_live_on_a_cached_body(self):
+        self.assertEqual(self.get_post().json()['results']['view_count'], 0)
+
+        increment_post_counter(self.post.id, 'views', 3)
+        try:
+            self.assertEqual(self.get_post().json()['results']['view_count'], 3)
+
+            # Still 3 once the deltas are flushed into PostAnalytics
+            flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
+            self.assertEqual(self.get_post().json()['results']['view_count'], 3)
+        finally:
+            flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
+
+    def test_missing_post_is_not_found(self):
+        response = self.client.get('/api/blog/post/?slug=missing', HTTP_API_KEY=self.api_key)
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalidated_on_heading_change(self):
+        self.get_post()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Heading.objects.create(post=self.post, title='New heading', level=2, order=1)
+
+        self.assertEqual(self.get_post().json()['results']['headings'][0]['title'], 'New heading')
+
+    def test_stale_entry_refreshed_by_one_worker(self):
+        self.get_post()
+
+        with patch('apps.blog.detail_cache.time.time', return_value=timezone.now().timestamp() + 60 * 10), \
+                patch('apps.blog.views.refresh_post_detail_cache.delay') as refresh:
+            # The live counters of both reads, the stale body is not rebuilt inline
+            with self.assertNumQueries(2):
+                first = self.get_post()
+                self.get_post()
+
+        self.assertEqual(first.json()['results']['title'], 'Post 1')
+        refresh.assert_called_once_with('post-1')
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.api_key = settings.VALID_API_KEYS[0]
+
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com',
+            password='password',
+            username='editor',
+            first_name='Test',
+            last_name='Editor',
+        )
+
+        self.category = Category.objects.create(
+            name='Tech',
+            title='Technology',
+            slug='tech'
+        )
+
+        self.post = Post.objects.create(
+            user=self.user,
+            title='Post 1',
+            description='A test post',
+            content='Content for the post',
+            thumbnail=None,
+            keywords='test',
+            slug='post-1',
+            category=self.category,
+            status='published',
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_listings_return_304_without_sql(self):
+        for url in ['/api/blog/posts/', '/api/blog/categories/', '/api/blog/category/posts/?slug=tech']:
+            response = self.client.get(url, HTTP_API_KEY=self.api_key)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('Last-Modified', response)
+
+            with self.assertNumQueries(0):
+                not_modified = self.client.get(url, HTTP_API_KEY=self.api_key, HTTP_IF_NONE_MATCH=response['ETag'])
+
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(not_modified.content, b'')
+            self.assertEqual(not_modified['ETag'], response['ETag'])
+
+    def test_listing_etag_changes_with_generation(self):
+        etag = self.client.get('/api/blog/posts/', HTTP_API_KEY=self.api_key)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.title = 'Post 1 edited'
+            self.post.save()
+
+        response = self.client.get('/api/blog/posts/', HTTP_API_KEY=self.api_key, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_listing_etag_follows_rebuilt_entry(self):
+        response = self.client.get('/api/blog/posts/', HTTP_API_KEY=self.api_key)
+        self.assertTrue(response['ETag'].startswith('W/'))
+
+        # Pending views change the body without a generation bump, the entry expires and is rebuilt
+        increment_post_counter(self.post.id, 'views', 3)
+        cache.clear()
+
+        try:
+            rebuilt = self.client.get('/api/blog/posts/', HTTP_API_KEY=self.api_key, HTTP_IF_NONE_MATCH=response['ETag'])
+        finally:
+            flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
+
+        self.assertEqual(rebuilt.status_code, 200)
+        self.assertNotEqual(rebuilt['ETag'], response['ETag'])
+        self.assertEqual(rebuilt.json()['results'][0]['view_count'], 3)
+
+    def test_detail_returns_304_until_post_changes(self):
+        etag = self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key)['ETag']
+
+        # Only the live counters the tag covers
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PostLike.objects.create(post=self.post, user=self.user)
+
+        response = self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail_etag_follows_the_counters(self):
+        etag = self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key)['ETag']
+
+        # Views change the body without a version bump
+        increment_post_counter(self.post.id, 'views', 3)
+        try:
+            response = self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key, HTTP_IF_NONE_MATCH=etag)
+        finally:
+            flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results']['view_count'], 3)
+        self.assertNotIn('Last-Modified', response)
+
+    def test_detail_etag_is_per_user(self):
+        etag = self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key)['ETag']
+
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class CategoryTreeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.api_key = settings.VALID_API_KEYS[0]
+
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com',
+            password='password',
+            username='editor',
+            first_name='Test',
+            last_name='Editor',
+        )
+
+        self.tech = Category.objects.create(name='Tech', title='Technology', slug='tech')
+        self.python = Category.objects.create(name='Python', slug='python', parent=self.tech)
+        self.django = Category.objects.create(name='Django', slug='django', parent=self.python)
+        self.news = Category.objects.create(name='News', slug='news')
+
+        for category in [self.tech, self.python, self.django, self.news]:
+            Post.objects.create(
+                user=self.user,
+                title=f'{category.name} post',
+                description='A test post',
+                content='Content for the post',
+                thumbnail=None,
+                keywords='test',
+                slug=f'{category.slug}-post',
+                category=category,
+                status='published',
+            )
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_descendants_in_one_query(self):
+        with self.assertNumQueries(1):
+            descendants = list(self.tech.get_descendants().values_list('slug', flat=True))
+
+        self.assertCountEqual(descendants, ['python', 'django'])
+
+    def test_move_rewrites_subtree(self):
+        self.python.parent = self.news
+        self.python.save()
+
+        self.django.refresh_from_db()
+        self.assertEqual(self.django.path, f'{self.news.id.hex}/{self.python.id.hex}/{self.django.id.hex}/')
+        self.assertEqual(self.django.depth, 2)
+        self.assertCountEqual(self.news.get_descendants().values_list('slug', flat=True), ['python', 'django'])
+        self.assertEqual(self.tech.get_descendants().count(), 0)
+
+    def test_cannot_move_under_own_subtree(self):
+        self.tech.parent = self.django
+        with self.assertRaises(ValueError):
+            self.tech.save()
+
+    def test_category_posts_with_subcategories(self):
+        response = self.client.get('/api/blog/category/posts/?slug=tech&subcategories=true', HTTP_API_KEY=self.api_key)
+        self.assertCountEqual(
+            [post['slug'] for post in response.json()['results']], ['tech-post', 'python-post', 'django-post']
+        )
+
+        response = self.client.get('/api/blog/category/posts/?slug=tech', HTTP_API_KEY=self.api_key)
+        self.assertEqual([post['slug'] for post in response.json()['results']], ['tech-post'])
+
+    def test_tree_cached_until_category_changes(self):
+        response = self.client.get('/api/blog/categories/tree/', HTTP_API_KEY=self.api_key)
+        tree = response.json()['results']
+        self.assertEqual([node['slug'] for node in tree], ['news', 'tech'])
+        self.assertEqual(tree[1]['children'][0]['children'][0]['slug'], 'django')
+
+        with self.assertNumQueries(0):
+            self.client.get('/api/blog/categories/tree/?slug=python', HTTP_API_KEY=self.api_key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Flask', slug='flask', parent=self.python)
+
+        response = self.client.get('/api/blog/categories/tree/?slug=python', HTTP_API_KEY=self.api_key)
+        self.assertEqual([node['slug'] for node in response.json()['results'][0]['children']], ['django', 'flask'])
+
+
+class IndexUsageTest(TestCase):
+    """
+    EXPLAINs every query an endpoint runs with sequential scans disabled, so the
+    planner takes an index whenever one applies however small the test tables are.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.api_key = settings.VALID_API_KEYS[0]
+
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com',
+            password='password',
+            username='editor',
+            first_name='Test',
+            last_name='Editor',
+        )
+
+        self.category = Category.objects.create(
+            name='Tech',
+            title='Technology',
+            slug='tech'
+        )
+
+        for i in range(10):
+            post = Post.objects.create(
+                user=self.user,
+                title=f'Post {i}',
+                description='A test post',
+                content='Content for the post',
+                thumbnail=None,
+                keywords='test',
+                slug=f'post-{i}',
+                category=self.category,
+                status='published',
+            )
+            Heading.objects.create(post=post, title='Heading', level=2, order=0)
+            Comment.objects.create(user=self.user, post=post, content='Nice post')
+
+        self.post = post
+
+        # Plans follow these rows, not whatever autovacuum last saw of the tables or the index
+        # pages earlier tests left behind, which break ties between equally cheap indexes
+        with connection.cursor() as cursor:
+            for table in ('blog_post', 'blog_heading', 'blog_comment', 'blog_category'):
+                cursor.execute(f'REINDEX TABLE {table}')
+            cursor.execute('ANALYZE blog_post, blog_heading, blog_comment, blog_category')
+
+    def tearDown(self):
+        cache.clear()
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}')
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def assertQueriesUseIndex(self, queries, *index_names):
+        plans = [self.explain(query['sql']) for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertTrue(
+            any(index_name in plan for plan in plans for index_name in index_names),
+            f'None of {index_names} in:\n' + '\n\n'.join(plans),
+        )
+
+    def assertEndpointUsesIndex(self, url, *index_names):
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_API_KEY=self.api_key)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertQueriesUseIndex(queries, *index_names)
+
+    def test_post_list_uses_published_index(self):
+        self.assertEndpointUsesIndex('/api/blog/posts/', 'blog_post_published_idx')
+
+    def test_post_detail_uses_slug_index(self):
+        self.assertEndpointUsesIndex('/api/blog/post/?slug=post-3', 'blog_post_published_slug_uniq', 'blog_post_slug_idx')
+
+    def test_post_headings_use_slug_index(self):
+        self.assertEndpointUsesIndex('/api/blog/post/headings/?slug=post-3', 'blog_post_slug_idx')
+
+    def test_category_posts_use_category_slug_index(self):
+        self.assertEndpointUsesIndex('/api/blog/category/posts/?slug=tech', 'blog_category_slug_idx')
+        self.assertEndpointUsesIndex('/api/blog/category/posts/?slug=tech', 'blog_post_published_idx')
+
+    def test_post_comments_use_comment_index(self):
+        self.assertEndpointUsesIndex('/api/blog/post/comments/?slug=post-3', 'blog_comment_post_created_idx')
+
+    def test_anomaly_check_uses_interaction_index(self):
+        # A history of views, only the last minutes of it are read
+        PostInteraction.objects.bulk_create(
+            [PostInteraction(user=self.user, post=self.post, interaction_type='view') for _ in range(200)]
+        )
+        PostInteraction.objects.update(timestamp=timezone.now() - timedelta(days=30))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE blog_postinteraction')
+
+        with CaptureQueriesContext(connection) as queries:
+            PostInteraction.detect_anomalies(self.user, self.post)
+
+        self.assertQueriesUseIndex(queries, 'blog_interaction_user_post_ts')
+
+    def test_published_slug_is_unique(self):
+        response = self.client.get('/api/blog/post/?slug=post-3', HTTP_API_KEY=self.api_key)
+        self.assertEqual(response.status_code, 200)
+
+        # Drafts may share a slug with a published post
+        Post.objects.create(
+            user=self.user, title='Draft', description='A draft', content='Content', thumbnail=None,
+            keywords='test', slug='post-3', category=self.category, status='draft',
+        )
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Post.objects.create(
+                user=self.user, title='Copy', description='A copy', content='Content', thumbnail=None,
+                keywords='test', slug='post-3', category=self.category, status='published',
+            )
+
+
+@patch.dict('apps.blog.anomalies.ANOMALY_THRESHOLDS', {'like': 2, 'view': 3})
+class AnomalyDetectionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self._clear_redis()
+        self.client = APIClient()
+
+        self.api_key = settings.VALID_API_KEYS[0]
+
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com',
+            password='password',
+            username='editor',
+            first_name='Test',
+            last_name='Editor',
+        )
+
+        self.category = Category.objects.create(
+            name='Tech',
+            title='Technology',
+            slug='tech'
+        )
+
+        self.post = Post.objects.create(
+            user=self.user,
+            title='Post 1',
+            description='A test post',
+            content='Content for the post',
+            thumbnail=None,
+            keywords='test',
+            slug='post-1',
+            category=self.category,
+            status='published',
+        )
+
+    def tearDown(self):
+        cache.clear()
+        self._clear_redis()
+
+    def _clear_redis(self):
+        for key in anomalies_redis.scan_iter(match='anomaly:*'):
+            anomalies_redis.delete(key)
+        view_events_redis.delete(VIEW_EVENTS_STREAM)
+
+    def like(self):
+        PostInteraction.objects.create(user=self.user, post=self.post, interaction_type='like', ip_address='10.0.0.1')
+
+    def test_rate_is_tracked_per_actor(self):
+        self.like()
+        self.like()
+
+        self.assertEqual(get_interaction_rate('like', self.post.id, user_id=self.user.id), 2)
+        self.assertEqual(get_interaction_rate('like', self.post.id, ip_address='10.0.0.2'), 0)
+        self.assertFalse(FlaggedInteraction.objects.exists())
+
+    def test_flagged_once_per_window(self):
+        for _ in range(5):
+            self.like()
+
+        flags = FlaggedInteraction.objects.filter(post=self.post, interaction_type='like')
+        self.assertEqual(flags.count(), 2)
+        self.assertEqual(flags.get(user=self.user).count, 3)
+        self.assertEqual(flags.get(ip_address='10.0.0.1').window_seconds, 600)
+
+    def test_repeated_views_flagged_on_ingestion(self):
+        for _ in range(4):
+            self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key)
+
+        self.assertEqual(ingest_view_events(), 1)
+
+        flag = FlaggedInteraction.objects.get(interaction_type='view')
+        self.assertEqual(flag.ip_address, '127.0.0.1')
+        self.assertEqual(flag.count, 4)
+
+    def test_late_events_counted_at_their_own_time(self):
+        now = timezone.now()
+
+        # Read outside the window and only ingested now
+        ingest_events([(self.post.id, None, '10.0.0.3', now - timedelta(seconds=700))] * 4)
+        self.assertEqual(get_interaction_rate('view', self.post.id, ip_address='10.0.0.3'), 0)
+        self.assertFalse(FlaggedInteraction.objects.exists())
+
+        ingest_events([(self.post.id, None, '10.0.0.4', now - timedelta(seconds=300))] * 4)
+        self.assertEqual(get_interaction_rate('view', self.post.id, ip_address='10.0.0.4'), 4)
+        self.assertEqual(FlaggedInteraction.objects.get(interaction_type='view').ip_address, '10.0.0.4')
+
+
+class SeedBlogCommandTest(TestCase):
+
+    def seed(self, **options):
+        call_command('seed_blog', seed=7, users=20, categories=6, posts=30, views=400, stdout=StringIO(), **options)
+
+    def test_seeds_requested_counts(self):
+        self.seed()
+
+        self.assertEqual(UserAccount.objects.filter(username__startswith='seed7-').count(), 20)
+        self.assertEqual(Category.objects.count(), 6)
+        self.assertEqual(Post.objects.count(), 30)
+        self.assertEqual(PostAnalytics.objects.count(), 30)
+        self.assertEqual(Comment.objects.count(), 90)
+        self.assertEqual(PostInteraction.objects.filter(interaction_type='comment').count(), 90)
+        self.assertEqual(PostView.objects.count(), PostAnalytics.objects.aggregate(total=Sum('views'))['total'])
+        self.assertEqual(PostLike.objects.count(), PostAnalytics.objects.aggregate(total=Sum('likes'))['total'])
+        self.assertEqual(
+            Comment.objects.filter(is_active=True).count(), PostAnalytics.objects.aggregate(total=Sum('comments'))['total']
+        )
+
+        # Replies carry the same path and depth the receivers would have given them
+        reply = Comment.objects.filter(parent__isnull=False).select_related('parent').first()
+        self.assertEqual(reply.path, f'{reply.parent.path}{reply.id.hex}/')
+        self.assertEqual(reply.depth, reply.parent.depth + 1)
+
+        self.assertEqual(Post.objects.filter(search_vector__isnull=True).count(), 0)
+
+    def test_events_and_interactions_are_copied_in_chunks(self):
+        self.seed(chunk_size=7)
+
+        self.assertEqual(Comment.objects.count(), 90)
+        for model, interaction_type in ((Comment, 'comment'), (PostLike, 'like'), (PostView, 'view'), (PostShare, 'share')):
+            self.assertEqual(
+                PostInteraction.objects.filter(interaction_type=interaction_type).count(), model.objects.count()
+            )
+
+        # Comment interactions point at their own comment
+        self.assertFalse(
+            PostInteraction.objects.filter(interaction_type='comment').exclude(comment__post=F('post')).exists()
+        )
+
+    def test_callable_defaults_are_called_per_row(self):
+        copy_rows(Category, [{'name': f'Category {i}', 'slug': f'category-{i}'} for i in range(3)], chunk_size=2)
+
+        self.assertEqual(Category.objects.values('id').distinct().count(), 3)
+        self.assertEqual(set(Category.objects.values_list('path', flat=True)), {''})
+
+    def test_popularity_is_skewed(self):
+        self.seed()
+
+        views = list(PostAnalytics.objects.order_by('-views').values_list('views', flat=True))
+        self.assertGreater(sum(views[:3]), sum(views[-10:]))
+
+    def test_same_seed_is_reproducible(self):
+        self.seed()
+        first = list(Post.objects.order_by('slug').values_list('id', 'slug'))
+
+        with self.assertRaises(CommandError):
+            self.seed()
+
+        Post.objects.all().delete()
+        Category.objects.all().delete()
+        UserAccount.objects.filter(username__startswith='seed7-').delete()
+        self.seed()
+
+        self.assertEqual(list(Post.objects.order_by('slug').values_list('id', 'slug')), first)
+
+
+class BenchmarkEndpointsCommandTest(TestCase):
+
+    def setUp(self):
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com', password='password', username='editor',
+            first_name='Test', last_name='Editor', role='editor', is_active=True,
+        )
+        self.category = Category.objects.create(name='Tech', slug='tech')
+        self.post = Post.objects.create(
+            user=self.user, title='Benchmarked Post', description='Description', content='Content',
+            slug='post-1', category=self.category, status='published',
+        )
+        Comment.objects.create(user=self.user, post=self.post, content='First')
+
+    def tearDown(self):
+        cache.clear()
+        view_events_redis.delete(VIEW_EVENTS_STREAM)
+
+    def test_reports_every_route(self):
+        output = StringIO()
+        call_command('benchmark_endpoints', iterations=3, warmup=1, use_configured_database=True, stdout=output, stderr=StringIO())
+
+        report = json.loads(output.getvalue())
+
+        self.assertEqual(report['uncovered'], [])
+        self.assertIn('generate-qr-code', report['skipped'])
+        self.assertEqual(report['meta']['iterations'], 3)
+
+        for name, result in report['endpoints'].items():
+            self.assertTrue(all(status < 400 for status in result['status']), (name, result['status']))
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+        detail = report['endpoints']['posts-detail']
+        self.assertEqual(detail['status'], [200])
+        self.assertGreaterEqual(detail['redis_commands']['p50'], 1)
+        self.assertGreaterEqual(report['endpoints']['my-profile']['queries']['p50'], 2)
+
+        # Requests commit, their Redis side effects stay in the benchmark database and are flushed
+        self.assertGreater(Comment.objects.count(), 1)
+        self.assertEqual(view_events_redis.xlen(VIEW_EVENTS_STREAM), 0)
+        with use_redis_db(15):
+            self.assertEqual(get_redis_client().dbsize(), 0)
+
+    def test_refuses_the_configured_redis_database(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_endpoints', redis_db=0, use_configured_database=True, stdout=StringIO(), stderr=StringIO())
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    pass
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'apps.blog.tests.InstrumentedLocMemCache'}})
+class PerformanceInstrumentationTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.api_key = settings.VALID_API_KEYS[0]
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com', password='password', username='editor',
+            first_name='Test', last_name='Editor',
+        )
+        self.category = Category.objects.create(name='Tech', slug='tech')
+        self.post = Post.objects.create(
+            user=self.user, title='Instrumented Post', description='Description', content='Content',
+            slug='post-1', category=self.category, status='published',
+        )
+
+    def tearDown(self):
+        cache.clear()
+        view_events_redis.delete(VIEW_EVENTS_STREAM)
+
+    def server_timing(self, response):
+        # {'db': (duration, description), ...}
+        timings = {}
+        for entry in response['Server-Timing'].split(', '):
+            name, *params = entry.split(';')
+            params = dict(param.split('=', 1) for param in params)
+            timings[name] = (float(params['dur']), params.get('desc', '').strip('"'))
+        return timings
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key)
+        timings = self.server_timing(response)
+
+        self.assertEqual(set(timings), {'db', 'cache', 'redis', 'serialize', 'total'})
+        self.assertNotEqual(timings['db'][1], '0 queries')
+        self.assertNotIn(' 0 misses', timings['cache'][1])
+        self.assertNotEqual(timings['redis'][1], '0 commands')
+        self.assertGreater(timings['serialize'][0], 0)
+        self.assertGreaterEqual(timings['total'][0], timings['db'][0])
+
+        # The second read is served from the cache, Postgres only gives the live counters
+        timings = self.server_timing(self.client.get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key))
+        self.assertEqual(timings['db'][1], '1 queries')
+        self.assertTrue(timings['cache'][1].endswith(' 0 misses'))
+        # The view event, then the pending views and likes in one pipeline
+        self.assertEqual(timings['redis'][1], '3 commands')
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/blog/posts/', HTTP_API_KEY=self.api_key)
+
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+        response = self.client.get('/metrics/', HTTP_API_KEY=self.api_key)
+        content = response.content.decode()
+
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('# TYPE http_request_duration_seconds histogram', content)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="/api/blog/posts/",le="+Inf"}', content)
+        self.assertIn('http_requests_total{method="GET",route="/api/blog/posts/",status="200"}', content)
+        self.assertIn('http_request_db_queries_count{method="GET",route="/api/blog/posts/"}', content)
+
+
+class SharedRedisPoolTest(TestCase):
+
+    def test_clients_share_one_pool(self):
+        pool = get_redis_pool()
+
+        self.assertIs(impressions_redis.connection_pool, pool)
+        self.assertIs(view_events_redis.connection_pool, pool)
+        self.assertIs(SharedConnectionFactory({}).get_or_create_connection_pool({'url': settings.REDIS_URL}), get_redis_pool(settings.REDIS_URL))
+
+    def test_data_survives_clearing_the_cache(self):
+        # The cache and the data of the project sit in databases of their own
+        self.assertNotEqual(get_redis_pool().connection_kwargs.get('db', 0), get_redis_pool(settings.REDIS_URL).connection_kwargs.get('db', 0))
+
+        key = counter_key('post', 'views')
+        impressions_redis.hset(key, 'survivor', 1)
+        try:
+            get_redis_client(settings.REDIS_URL).flushdb()
+            self.assertEqual(impressions_redis.hget(key, 'survivor'), b'1')
+        finally:
+            impressions_redis.hdel(key, 'survivor')
+
+    def test_saturation_is_counted(self):
+        pool = InstrumentedBlockingConnectionPool.from_url(settings.REDIS_URL, max_connections=1, timeout=0.05)
+        connection = pool.get_connection()
+
+        self.assertEqual(pool.in_use, 1)
+        with self.assertRaises(redis.ConnectionError):
+            pool.get_connection()
+        self.assertEqual(pool.timeouts, 1)
+        self.assertGreaterEqual(pool.wait_seconds, 0.05)
+
+        pool.release(connection)
+        self.assertEqual(pool.in_use, 0)
+        self.assertEqual(pool.acquired, 1)
+        pool.disconnect()
+
+    def test_pool_metrics_are_exposed(self):
+        response = APIClient().get('/metrics/', HTTP_API_KEY=settings.VALID_API_KEYS[0])
+        content = response.content.decode()
+
+        self.assertIn('# TYPE redis_pool_connections_in_use gauge', content)
+        self.assertIn(f'redis_pool_max_connections{{pool="data"}} {get_redis_pool().max_connections}', content)
+        self.assertIn('redis_pool_connections_in_use{pool="cache"}', content)
+        self.assertIn('redis_pool_timeouts_total', content)
+
+
+class AsyncReadViewsTest(TestCase):
+
+    def setUp(self):
+        self.api_key = settings.VALID_API_KEYS[0]
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com', password='password', username='editor',
+            first_name='Test', last_name='Editor', is_active=True,
+        )
+        self.category = Category.objects.create(name='Tech', slug='tech')
+        self.post = Post.objects.create(
+            user=self.user, title='Post 1', description='Description', content='Content',
+            slug='post-1', category=self.category, status='published',
+        )
+        Comment.objects.create(post=self.post, user=self.user, content='A comment')
+
+    def tearDown(self):
+        cache.clear()
+        view_events_redis.delete(VIEW_EVENTS_STREAM)
+        flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
+
+    def test_read_endpoints_are_routed_to_async_views(self):
+        self.assertIs(resolve('/api/blog/posts/').func.cls, AsyncPostListView)
+        self.assertIs(resolve('/api/blog/post/').func.cls, AsyncPostDetailView)
+        self.assertIs(resolve('/api/blog/categories/').func.cls, AsyncCategoryListView)
+        self.assertIs(resolve('/api/blog/post/comments/').func.cls, AsyncListPostCommentsView)
+
+    def test_responses_match_the_sync_views(self):
+        for sync_view, async_view, path in (
+            (PostListView, AsyncPostListView, '/api/blog/posts/?sorting=most_viewed'),
+            (CategoryListView, AsyncCategoryListView, '/api/blog/categories/'),
+            (ListPostCommentsView, AsyncListPostCommentsView, '/api/blog/post/comments/?slug=post-1'),
+        ):
+            cache.clear()
+            sync_response = sync_view.as_view()(APIRequestFactory().get(path, HTTP_API_KEY=self.api_key))
+            if hasattr(sync_response, 'render'):
+                sync_response.render()
+            cache.clear()
+            async_response = async_to_sync(async_view.as_view())(APIRequestFactory().get(path, HTTP_API_KEY=self.api_key))
+
+            self.assertEqual(async_response.status_code, 200)
+            self.assertEqual(json.loads(async_response.content), json.loads(sync_response.content), path)
+
+    def test_detail_authenticates_and_records_the_view(self):
+        token = RefreshToken.for_user(self.user).access_token
+        response = APIClient().get(
+            '/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key, HTTP_AUTHORIZATION=f'JWT {token}',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results']['slug'], 'post-1')
+        self.assertFalse(response.json()['results']['has_liked'])
+
+        [(_, fields)] = view_events_redis.xrange(VIEW_EVENTS_STREAM)
+        self.assertEqual(fields[b'p'].decode(), str(self.post.id))
+        self.assertEqual(fields[b'u'].decode(), str(self.user.id))
+
+        # Same semantics as DRF: bad credentials and missing keys are rejected
+        response = APIClient().get('/api/blog/post/?slug=post-1', HTTP_API_KEY=self.api_key, HTTP_AUTHORIZATION='JWT invalid')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(APIClient().get('/api/blog/post/?slug=post-1').status_code, 401)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'core.cache.InstrumentedRedisCache',
+        'LOCATION': settings.REDIS_URL,
+        'KEY_PREFIX': 'async-cache-test',
+    }})
+    def test_redis_cache_async_calls_share_entries_with_sync_calls(self):
+        redis_cache = caches['default']
+
+        redis_cache.set('listing', {'ids': [1, 2]})
+        self.assertEqual(async_to_sync(redis_cache.aget)('listing'), {'ids': [1, 2]})
+        self.assertFalse(async_to_sync(redis_cache.aadd)('listing', 'other'))
+
+        async_to_sync(redis_cache.aset)('generation', 1, timeout=None)
+        self.assertEqual(redis_cache.incr('generation'), 2)
+        self.assertEqual(async_to_sync(redis_cache.aget)('generation'), 2)
+
+        self.assertTrue(async_to_sync(redis_cache.adelete)('listing'))
+        self.assertIsNone(async_to_sync(redis_cache.aget)('listing'))
+        redis_cache.delete('generation')
+
+
+class WebsocketClient(ApplicationCommunicator):
+    # channels.testing imports daphne, which is not a dependency, so this is the part of its
+    # WebsocketCommunicator these tests need
+
+    def __init__(self, application, path, headers=()):
+        super().__init__(application, {'type': 'websocket', 'path': path, 'query_string': b'', 'headers': list(headers), 'subprotocols': []})
+
+    async def connect(self):
+        await self.send_input({'type': 'websocket.connect'})
+        response = await self.receive_output()
+        return response['type'] == 'websocket.accept', response.get('code')
+
+    async def receive_json_from(self):
+        response = await self.receive_output()
+        return json.loads(response['text'])
+
+    async def disconnect(self):
+        await self.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await self.wait()
+
+
+# A TransactionTestCase: database_sync_to_async closes old connections, TestCase's transaction with them
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class LiveCountersTest(TransactionTestCase):
+
+    def setUp(self):
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com', password='password', username='editor',
+            first_name='Test', last_name='Editor',
+        )
+        self.category = Category.objects.create(name='Tech', slug='tech')
+        self.post = Post.objects.create(
+            user=self.user, title='Post 1', description='Description', content='Content',
+            slug='post-1', category=self.category, status='published',
+        )
+        self.post_id = str(self.post.id)
+
+    def tearDown(self):
+        cache.clear()
+        live_redis.delete(watchers_key(self.post_id), throttle_key(self.post_id))
+        flush_counters('post', PostAnalytics, 'post', POST_COUNTERS)
+
+    def communicator(self, slug='post-1', origin=b'http://localhost:3000'):
+        from core.asgi import application
+
+        return WebsocketClient(application, f'/ws/blog/post/{slug}/', headers=[(b'origin', origin)])
+
+    async def test_watchers_get_one_update_per_interval(self):
+        communicator = self.communicator()
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        self.assertEqual(await communicator.receive_json_from(), {
+            'post': self.post_id,
+            'counters': {'views': 0, 'likes': 0, 'comments': 0, 'shares': 0},
+        })
+
+        with patch('apps.blog.tasks.broadcast_post_counters.apply_async') as apply_async:
+            for _ in range(3):
+                await sync_to_async(increment_post_counter)(self.post.id, 'likes')
+            await sync_to_async(increment_post_counter)(self.post.id, 'clicks')
+
+        # Three likes, one scheduled broadcast, clicks are not pushed
+        apply_async.assert_called_once_with(args=[self.post_id], countdown=LIVE_COUNTERS_INTERVAL)
+
+        await sync_to_async(broadcast_counters)(self.post_id)
+        message = await communicator.receive_json_from()
+        self.assertEqual(message['counters']['likes'], 3)
+        self.assertTrue(await communicator.receive_nothing())
+
+        await communicator.disconnect()
+        self.assertFalse(await sync_to_async(live_redis.exists)(watchers_key(self.post_id)))
+
+    async def test_open_sockets_keep_their_watcher_entry_alive(self):
+        with patch('apps.blog.consumers.WATCHERS_HEARTBEAT', 0.05):
+            communicator = self.communicator()
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.receive_json_from()
+
+            await sync_to_async(live_redis.expire)(watchers_key(self.post_id), 1)
+            await asyncio.sleep(0.2)
+            self.assertEqual(await sync_to_async(live_redis.ttl)(watchers_key(self.post_id)), WATCHERS_TTL)
+
+            # A lost key is back by the next heartbeat, so changes are broadcast again
+            await sync_to_async(live_redis.delete)(watchers_key(self.post_id))
+            await asyncio.sleep(0.2)
+            self.assertEqual(await sync_to_async(live_redis.zcard)(watchers_key(self.post_id)), 1)
+
+            await communicator.disconnect()
+            await asyncio.sleep(0.1)
+            self.assertFalse(await sync_to_async(live_redis.exists)(watchers_key(self.post_id)))
+
+    async def test_unwatched_posts_schedule_nothing(self):
+        with patch('apps.blog.tasks.broadcast_post_counters.apply_async') as apply_async:
+            await sync_to_async(increment_post_counter)(self.post.id, 'likes')
+
+        apply_async.assert_not_called()
+
+    async def test_unknown_posts_and_origins_are_refused(self):
+        connected, code = await self.communicator(slug='missing').connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4404)
+
+        connected, _ = await self.communicator(origin=b'http://evil.example.com').connect()
+        self.assertFalse(connected)
+
+
+class TrendingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        trending_redis.delete(TRENDING_KEY)
+        self.client = APIClient()
+
+        self.api_key = settings.VALID_API_KEYS[0]
+
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com',
+            password='password',
+            username='editor',
+            first_name='Test',
+            last_name='Editor',
+        )
+
+        self.category = Category.objects.create(
+            name='Tech',
+            title='Technology',
+            slug='tech'
+        )
+
+        self.posts = [
+            Post.objects.create(
+                user=self.user,
+                title=f'Post {i}',
+                description='A test post',
+                content='Content for the post',
+                thumbnail=None,
+                keywords='test',
+                slug=f'post-{i}',
+                category=self.category,
+                status='published',
+            )
+            for i in range(3)
+        ]
+
+    def tearDown(self):
+        cache.clear()
+        trending_redis.delete(TRENDING_KEY)
+
+    def score(self, post):
+        return decayed_score(trending_redis.zscore(TRENDING_KEY, str(post.id)))
+
+    def test_scores_add_up_and_decay(self):
+        now = timezone.now()
+        old = now - timedelta(seconds=TRENDING_HALF_LIFE * 4)
+
+        record_trending([(self.posts[0].id, 'view', 1.0, now), (self.posts[0].id, 'view', 1.0, now)])
+        record_trending([(self.posts[0].id, 'like', 1.0, now)])
+        record_trending([(self.posts[1].id, 'share', 1.0, old)])
+
+        self.assertAlmostEqual(self.score(self.posts[0]), 5, places=3)
+        # Four half lives, 8 / 16
+        self.assertAlmostEqual(self.score(self.posts[1]), 0.5, places=3)
+        self.assertEqual(get_trending_post_ids(), [self.posts[0].id, self.posts[1].id])
+
+    def test_interactions_update_scores(self):
+        PostInteraction.objects.create(user=self.user, post=self.posts[2], interaction_type='comment')
+
+        self.assertAlmostEqual(self.score(self.posts[2]), 5, places=2)
+
+    def test_trending_sorting(self):
+        now = timezone.now()
+        record_trending([
+            (self.posts[1].id, 'share', 1.0, now),
+            (self.posts[2].id, 'like', 1.0, now),
+        ])
+
+        response = self.client.get(f"{reverse('posts-list')}?sorting=trending", HTTP_API_KEY=self.api_key)
+        data = response.json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([post['title'] for post in data['results']], ['Post 1', 'Post 2'])
+
+    def test_trending_listing_expires_quickly(self):
+        record_trending([(self.posts[1].id, 'share', 1.0, timezone.now())])
+        url = f"{reverse('posts-list')}?sorting=trending"
+
+        with patch('apps.blog.async_views.acache_listing', wraps=acache_listing) as cache_async, \
+                patch('apps.blog.views.cache_listing', wraps=cache_listing) as cache_sync:
+            response = self.client.get(url, HTTP_API_KEY=self.api_key)
+
+        stored, = cache_async.call_args_list + cache_sync.call_args_list
+        self.assertEqual(stored.kwargs['timeout'], TRENDING_CACHE_TIMEOUT)
+
+        # Once the entry is rebuilt with the new ranking, revalidation gets it
+        record_trending([(self.posts[2].id, 'share', 2.0, timezone.now())])
+        cache.clear()
+
+        # Only the cached listing goes, the scores live in the data database
+        self.assertEqual(trending_redis.zcard(TRENDING_KEY), 2)
+
+        rebuilt = self.client.get(url, HTTP_API_KEY=self.api_key, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(rebuilt.status_code, 200)
+        self.assertEqual([post['title'] for post in rebuilt.json()['results']], ['Post 2', 'Post 1'])
+
+    def test_snapshot_restores_lost_scores(self):
+        record_trending([(self.posts[0].id, 'like', 1.0, timezone.now())])
+        stored = trending_redis.zscore(TRENDING_KEY, str(self.posts[0].id))
+
+        self.assertEqual(snapshot_trending(), 1)
+        snapshot = PostTrendingSnapshot.objects.get()
+        self.assertEqual(snapshot.rank, 1)
+        self.assertAlmostEqual(snapshot.score, 3, places=2)
+
+        trending_redis.delete(TRENDING_KEY)
+
+        self.assertEqual(get_trending_post_ids(), [self.posts[0].id])
+        self.assertEqual(trending_redis.zscore(TRENDING_KEY, str(self.posts[0].id)), stored)
+
+
+class RelatedPostsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.api_key = settings.VALID_API_KEYS[0]
+
+        self.user = UserAccount.objects.create_user(
+            email='editor@example.com',
+            password='password',
+            username='editor',
+            first_name='Test',
+            last_name='Editor',
+        )
+
+        tech = Category.objects.create(name='Tech', title='Technology', slug='tech')
+        food = Category.objects.create(name='Food', title='Cooking', slug='food')
+
+        self.posts = [
+            self.create_post(0, 'Caching Django views', 'django,cache,redis', tech, '<p>Cache views in Redis.</p>'),
+            self.create_post(1, 'Redis for Django', 'redis,django', tech, '<p>Redis as the Django cache.</p>'),
+            self.create_post(2, 'Sourdough bread', 'bread,baking', food, '<p>Bake a sourdough loaf.</p>'),
+            self.create_post(3, 'Baking bread at home', 'bread,baking,yeast', food, '<p>Yeast and bread.</p>'),
+        ]
+
+    def tearDown(self):
+        cache.clear()
+
+    def create_post(self, i, title, keywords, category, content):
+        return Post.objects.create(
+            user=self.user,
+            title=title,
+            description='A test post',
+            content=content,
+            thumbnail=None,
+            keywords=keywords,
+            slug=f'post-{i}',
+            category=category,
+            status='published',
+        )
+
+    def neighbours(self, post):
+        return [post_id for post_id, _ in RelatedPosts.objects.get(post=post).neighbours]
+
+    def test_blocks_match_full_matrix(self):
+        rng = random.Random(7)
+        words = ['django', 'redis', 'cache', 'bread', 'yeast', 'oven', 'query', 'index']
+        matrix = tfidf_matrix([Counter(rng.choices(words, k=6)) for _ in range(40)])
+        similarities = (matrix @ matrix.T).toarray()
+
+        for row, neighbours in top_neighbours(matrix, list(range(40)), k=3, block_size=7):
+            expected = sorted((value for column, value in enumerate(similarities[row]) if column != row), reverse=True)
+            self.assertEqual(len(neighbours), 3)
+            for (_, value), best in zip(neighbours, expected):
+                self.assertAlmostEqual(value, best, places=5)
+
+    def test_pairs_in_blocks(self):
+        matrix = tfidf_matrix([Counter(['django', 'redis']), Counter(['django']), Counter(['bread'])])
+        pairs = sorted((row, column) for row, column, _ in similar_pairs(matrix, [0, 1, 2], block_size=2))
+
+        self.assertEqual(pairs, [(0, 1), (1, 0)])
+
+    def test_neighbours_are_most_similar(self):
+        # Every post is new, nothing is left to merge into
+        with patch('apps.blog.related.similar_pairs') as pairs:
+            self.assertEqual(update_related_posts(), 4)
+        pairs.assert_not_called()
+        self.assertEqual(update_related_posts(), 0)
+
+        self.assertEqual(self.neighbours(self.posts[0])[0], str(self.posts[1].id))
+        self.assertEqual(self.neighbours(self.posts[2])[0], str(self.posts[3].id))
+
+    def test_detail_serves_related_from_cache(self):
+        update_related_posts()
+        self.client.get('/api/blog/post/?slug=post-0', HTTP_API_KEY=self.api_key)
+
+        # Only the live counters
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/blog/post/?slug=post-0', HTTP_API_KEY=self.api_key)
+
+        related = response.json()['results']['related']
+        self.assertEqual(related[0]['slug'], 'post-1')
+        self.assertEqual(related[0]['title'], 'Redis for Django')
+
+    def test_only_changed_posts_are_rescored(self):
+        update_related_posts()
+
+        self.posts[3].title = 'Caching Django with Redis'
+        self.posts[3].keywords = 'django,cache,redis'
+        self.posts[3].category = self.posts[0].category
+        self.posts[3].content = '<p>Cache views in Redis.</p>'
+        self.posts[3].save()
+
+        self.assertEqual(update_related_posts(), 1)
+        # Rescored, and placed in the list of the post it is now closest to
+        self.assertEqual(self.neighbours(self.posts[3])[0], str(self.posts[0].id))
+        self.assertEqual(self.neighbours(self.posts[0])[0], str(self.posts[3].id))
+        self.assertEqual(self.neighbours(self.posts[2])[-1], str(self.posts[3].id))
+
+        self.posts[1].status = 'draft'
+        self.posts[1].save()
+
+        self.assertEqual(update_related_posts(), 0)
+        self.assertFalse(RelatedPosts.objects.filter(post=self.posts[1]).exists())
+        self.assertNotIn(str(self.posts[1].id), self.neighbours(self.posts[0]))
+
+    @patch('apps.blog.related.RELATED_POSTS_COUNT', 1)
+    def test_lists_losing_a_neighbour_are_backfilled(self):
+        update_related_posts()
+        self.assertEqual(self.neighbours(self.posts[0]), [str(self.posts[1].id)])
+
+        self.posts[1].status = 'draft'
+        self.posts[1].save()
+
+        # Post 0 had a full list, it is rescored rather than left empty
+        self.assertEqual(update_related_posts(), 1)
+        self.assertEqual(len(self.neighbours(self.posts[0])), 1)
+        self.assertNotIn(str(self.posts[1].id), self.neighbours(self.posts[0]))
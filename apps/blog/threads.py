@@ -0,0 +1,110 @@
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Left, Length
+
+
+COMMENT_TREE_TIMEOUT = 60 * 5
+
+
+def comment_tree_cache_key(post_slug):
+    return f'comment_tree:{post_slug}'
+
+
+def visible_comments(comments):
+    # A comment is shown while neither it nor any comment above it is deactivated, those are
+    # the inactive comments of the post whose path is a prefix of its own
+    from .models import Comment
+
+    hidden_by = Comment.objects.filter(
+        post=OuterRef('post'), is_active=False, path=Left(OuterRef('path'), Length('path')),
+    )
+    return comments.filter(is_active=True).filter(~Exists(hidden_by))
+
+
+def _nest(comments, root_depth, max_depth=None):
+    from .serializers import CommentTreeSerializer
+
+    # Parents sort before their replies (depth first), siblings stay newest first
+    comments = list(comments)
+
+    # Every visible comment of the subtree is loaded, so its paths give the active descendants
+    descendants = defaultdict(int)
+    for comment in comments:
+        for ancestor_id in comment.get_ancestor_ids():
+            descendants[ancestor_id] += 1
+
+    if max_depth is not None:
+        comments = [comment for comment in comments if comment.depth <= root_depth + max_depth]
+
+    nodes = {}
+    roots = []
+
+    for comment, data in zip(comments, CommentTreeSerializer(comments, many=True).data):
+        node = {**data, 'descendants_count': descendants[comment.id.hex], 'replies': []}
+        nodes[comment.id] = node
+
+        if comment.depth == root_depth:
+            roots.append(node)
+        else:
+            nodes[comment.parent_id]['replies'].append(node)
+
+    return roots
+
+
+def build_comment_tree(post_slug):
+    from .models import Comment
+
+    comments = (
+        visible_comments(Comment.objects.filter(post__slug=post_slug))
+        .select_related('user')
+        .order_by('depth', '-created_at')
+    )
+    return _nest(comments, 0)
+
+
+def build_comment_subtree(comment, max_depth=None):
+    comments = visible_comments(type(comment).objects.filter(path__startswith=comment.path)).select_related('user')
+    return _nest(comments.order_by('depth', '-created_at'), comment.depth, max_depth)
+
+
+def get_comment_tree(post_slug):
+    """
+    The whole active thread of a post, nested, cached as one object per post.
+    """
+    cache_key = comment_tree_cache_key(post_slug)
+    tree = cache.get(cache_key)
+
+    if tree is None:
+        tree = build_comment_tree(post_slug)
+        cache.set(cache_key, tree, timeout=COMMENT_TREE_TIMEOUT)
+
+    return tree
+
+
+def get_cached_comment_tree(post_slug):
+    return cache.get(comment_tree_cache_key(post_slug))
+
+
+def invalidate_comment_tree(post_slug):
+    cache.delete(comment_tree_cache_key(post_slug))
+
+
+def find_subtree(nodes, comment_id):
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if node['id'] == comment_id:
+            return node
+        stack.extend(node['replies'])
+    return None
+
+
+def prune_tree(nodes, max_depth):
+    if max_depth is None:
+        return nodes
+    return [
+        {**node, 'replies': prune_tree(node['replies'], max_depth - 1) if max_depth > 0 else []}
+        for node in nodes
+    ]
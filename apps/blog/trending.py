@@ -0,0 +1,171 @@
+import math
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from core.redis_pool import get_redis_client
+
+from .search import ranked_position
+
+
+redis_client = get_redis_client()
+
+# Every post has one score in a sorted set, kept in log space against a fixed epoch:
+#   score = log(sum(weight_i * 2 ** ((t_i - TRENDING_EPOCH) / TRENDING_HALF_LIFE)))
+# Instead of decaying every score as time passes, newer interactions weigh exponentially more.
+# Each score would be multiplied by the same factor 2 ** (-(now - epoch) / half life), so the
+# order stays right without any recompute pass, only the interactions of a post ever touch it.
+# The log keeps the growing weights in range, adding one is a log-sum-exp done in Lua.
+TRENDING_KEY = 'trending:posts'
+TRENDING_EPOCH = 1704067200  # 2024-01-01 UTC
+TRENDING_HALF_LIFE = getattr(settings, 'BLOG_TRENDING_HALF_LIFE', 60 * 60 * 12)
+
+# Multiplied by PostInteraction.weight
+TRENDING_WEIGHTS = {
+    'view': 1,
+    'like': 3,
+    'comment': 5,
+    'share': 8,
+    **getattr(settings, 'BLOG_TRENDING_WEIGHTS', {}),
+}
+
+# Posts the listing ranks, and the size the sorted set is trimmed to on each snapshot
+TRENDING_LIMIT = getattr(settings, 'BLOG_TRENDING_LIMIT', 500)
+# The ranking moves with every interaction and no write bumps the listing generation for it,
+# so trending listings are cached this long instead of LISTING_CACHE_TIMEOUT
+TRENDING_CACHE_TIMEOUT = getattr(settings, 'BLOG_TRENDING_CACHE_TIMEOUT', 30)
+TRENDING_MAX_POSTS = 10000
+SNAPSHOT_RETENTION = timedelta(days=7)
+
+_add_scores = redis_client.register_script("""
+for i = 1, #ARGV, 2 do
+    local score = tonumber(ARGV[i + 1])
+    local current = redis.call('ZSCORE', KEYS[1], ARGV[i])
+    if current then
+        current = tonumber(current)
+        local high = math.max(current, score)
+        score = high + math.log(1 + math.exp(math.min(current, score) - high))
+    end
+    redis.call('ZADD', KEYS[1], score, ARGV[i])
+end
+return #ARGV / 2
+""")
+
+
+def _log_add(a, b):
+    # log(e^a + e^b) without overflow
+    high = max(a, b)
+    return high + math.log1p(math.exp(min(a, b) - high))
+
+
+def _age(at):
+    # Half lives since the epoch
+    return (at - TRENDING_EPOCH) / TRENDING_HALF_LIFE
+
+
+def log_score(weight, timestamp):
+    return math.log(weight) + _age(timestamp.timestamp()) * math.log(2)
+
+
+def decayed_score(score, at=None):
+    """
+    The plain score of a stored log score at `at` (now by default): the
+    weighted interactions, each halved every TRENDING_HALF_LIFE seconds.
+    """
+    at = time.time() if at is None else at.timestamp()
+    return math.exp(score - _age(at) * math.log(2))
+
+
+def record_trending(interactions):
+    """
+    Adds interactions, given as [(post_id, interaction_type, weight, timestamp)],
+    to the scores of their posts in one round trip.
+    """
+    scores = {}
+
+    for post_id, interaction_type, weight, timestamp in interactions:
+        weight = TRENDING_WEIGHTS.get(interaction_type, 0) * (weight if weight is not None else 1)
+        if weight <= 0:
+            continue
+
+        score = log_score(weight, timestamp)
+        current = scores.get(str(post_id))
+        scores[str(post_id)] = score if current is None else _log_add(current, score)
+
+    if scores:
+        _add_scores(keys=[TRENDING_KEY], args=[value for item in scores.items() for value in item])
+
+
+def get_trending_post_ids(limit=TRENDING_LIMIT):
+    # ZREVRANGE is O(log n + limit), whatever the number of posts
+    post_ids = redis_client.zrevrange(TRENDING_KEY, 0, limit - 1)
+
+    if not post_ids and restore_trending():
+        post_ids = redis_client.zrevrange(TRENDING_KEY, 0, limit - 1)
+
+    return [uuid.UUID(post_id.decode('utf-8')) for post_id in post_ids]
+
+
+def trending_posts(queryset):
+    """
+    Restricts `queryset` to the trending posts and annotates
+    `trending_position`, the 1-based rank of each post.
+    """
+    post_ids = get_trending_post_ids()
+
+    return queryset.filter(id__in=post_ids).annotate(trending_position=ranked_position(post_ids))
+
+
+def snapshot_trending(limit=TRENDING_LIMIT):
+    """
+    Writes the top `limit` posts with their scores to PostTrendingSnapshot,
+    drops snapshots older than SNAPSHOT_RETENTION and trims the sorted set
+    to TRENDING_MAX_POSTS. Returns the number of posts written.
+    """
+    from .models import Post, PostTrendingSnapshot
+
+    now = timezone.now()
+    ranked = [
+        (uuid.UUID(post_id.decode('utf-8')), score)
+        for post_id, score in redis_client.zrevrange(TRENDING_KEY, 0, limit - 1, withscores=True)
+    ]
+    existing = set(Post.objects.filter(id__in=[post_id for post_id, _ in ranked]).values_list('id', flat=True))
+    ranked = [(post_id, score) for post_id, score in ranked if post_id in existing]
+
+    PostTrendingSnapshot.objects.bulk_create([
+        PostTrendingSnapshot(
+            post_id=post_id, taken_at=now, rank=rank, log_score=score, score=decayed_score(score, now),
+        )
+        for rank, (post_id, score) in enumerate(ranked, start=1)
+    ])
+    PostTrendingSnapshot.objects.filter(taken_at__lt=now - SNAPSHOT_RETENTION).delete()
+
+    redis_client.zremrangebyrank(TRENDING_KEY, 0, -(TRENDING_MAX_POSTS + 1))
+
+    return len(ranked)
+
+
+def restore_trending():
+    """
+    Loads the latest snapshot back into an empty or lost sorted set. Log
+    scores do not depend on when they are read, so they go back as they are.
+    Returns the number of posts restored.
+    """
+    from .models import PostTrendingSnapshot
+
+    latest = PostTrendingSnapshot.objects.order_by('-taken_at').values_list('taken_at', flat=True).first()
+
+    if latest is None:
+        return 0
+
+    scores = {
+        str(post_id): score
+        for post_id, score in PostTrendingSnapshot.objects.filter(taken_at=latest).values_list('post_id', 'log_score')
+    }
+
+    # GT keeps the scores interactions recorded since the loss have already raised
+    redis_client.zadd(TRENDING_KEY, scores, gt=True)
+
+    return len(scores)
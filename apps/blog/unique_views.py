@@ -0,0 +1,183 @@
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from core.redis_pool import get_redis_client
+
+
+redis_client = get_redis_client()
+
+# 'exact' checks and stores every viewer in PostView/CategoryView.
+# 'hll' estimates unique viewers with one HyperLogLog per entity (~12KB at most, ±0.81%):
+#   hll:<kind>:<id>         all time
+#   hll:<kind>:<id>:<day>   per UTC day, persisted by snapshot_unique_views
+# View counters grow by the growth of the all time estimate, never per PFADD result.
+UNIQUE_VIEWS_MODE = getattr(settings, 'BLOG_UNIQUE_VIEWS_MODE', 'exact')
+# Keeps writing the exact tables in 'hll' mode, for audit
+EXACT_VIEWS_AUDIT = getattr(settings, 'BLOG_EXACT_VIEWS_AUDIT', False)
+
+DAILY_KEY_TTL = 60 * 60 * 24 * 3
+SNAPSHOT_SCAN_COUNT = 500
+
+
+def hll_enabled():
+    return UNIQUE_VIEWS_MODE == 'hll'
+
+
+def exact_views_enabled():
+    return not hll_enabled() or EXACT_VIEWS_AUDIT
+
+
+def hll_key(kind, id, day=None):
+    if day is None:
+        return f'hll:{kind}:{id}'
+    return f'hll:{kind}:{id}:{day:%Y%m%d}'
+
+
+def viewer_token(ip_address, user_id=None):
+    # Same identity as the exact tables: (user, ip)
+    return f'{user_id or ""}|{ip_address}'
+
+
+def _group_tokens(viewers):
+    tokens = {}
+    for id, token in viewers:
+        tokens.setdefault(str(id), []).append(token)
+    return tokens
+
+
+def unique_viewer_increments(kind, viewers):
+    """
+    viewers is [(id, token)]. Returns {id: n}, how much the estimate of each id
+    would grow if they were added, without adding them: PFCOUNT of the union
+    with a scratch HyperLogLog of the tokens minus PFCOUNT of the key alone.
+
+    PFADD reporting a changed register is no signal of a new viewer, once an
+    entity has a few thousand of them most new ones change no register at all.
+    """
+    tokens = _group_tokens(viewers)
+
+    if not tokens:
+        return {}
+
+    pipe = redis_client.pipeline(transaction=False)
+    for id, id_tokens in tokens.items():
+        scratch = f'hll:scratch:{kind}:{id}:{uuid.uuid4().hex}'
+        pipe.pfadd(scratch, *id_tokens)
+        pipe.pfcount(hll_key(kind, id))
+        pipe.pfcount(hll_key(kind, id), scratch)
+        pipe.delete(scratch)
+    results = pipe.execute()
+
+    return {
+        id: max(union - before, 0)
+        for id, before, union in zip(tokens, results[1::4], results[2::4])
+    }
+
+
+def add_unique_viewers(kind, viewers):
+    """
+    viewers is [(id, token)]. Adds them all in one round trip, to the all time
+    and today's HyperLogLogs, and returns {id: n}, how much the all time
+    estimate grew. The counts are taken around the adds in one MULTI, so
+    concurrent callers never credit the same growth twice.
+    """
+    tokens = _group_tokens(viewers)
+
+    if not tokens:
+        return {}
+
+    today = timezone.now().date()
+    pipe = redis_client.pipeline(transaction=True)
+
+    for id in tokens:
+        pipe.pfcount(hll_key(kind, id))
+    for id, id_tokens in tokens.items():
+        pipe.pfadd(hll_key(kind, id), *id_tokens)
+        daily_key = hll_key(kind, id, today)
+        pipe.pfadd(daily_key, *id_tokens)
+        pipe.expire(daily_key, DAILY_KEY_TTL)
+    for id in tokens:
+        pipe.pfcount(hll_key(kind, id))
+
+    results = pipe.execute()
+    before, after = results[:len(tokens)], results[-len(tokens):]
+
+    return {id: max(count - previous, 0) for id, previous, count in zip(tokens, before, after)}
+
+
+def count_unique_viewers(kind, ids, day=None):
+    ids = list(ids)
+
+    if not ids:
+        return {}
+
+    pipe = redis_client.pipeline(transaction=False)
+    for id in ids:
+        pipe.pfcount(hll_key(kind, id, day))
+
+    return {str(id): count for id, count in zip(ids, pipe.execute())}
+
+
+def snapshot_unique_views(kind, snapshot_model, related_field, day=None):
+    """
+    Persists the daily HyperLogLogs of `day` (yesterday by default) with their
+    estimate. The raw registers are kept, so several days can be merged again
+    with PFMERGE later. Returns the number of snapshots written.
+    """
+    day = day or (timezone.now().date() - timedelta(days=1))
+    suffix = f':{day:%Y%m%d}'
+    prefix = f'hll:{kind}:'
+
+    keys = [
+        key.decode('utf-8') for key in
+        redis_client.scan_iter(match=f'{prefix}*{suffix}', count=SNAPSHOT_SCAN_COUNT)
+    ]
+
+    if not keys:
+        return 0
+
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.get(key)
+        pipe.pfcount(key)
+    results = pipe.execute()
+
+    related_model = snapshot_model._meta.get_field(related_field).related_model
+    ids = [key[len(prefix):-len(suffix)] for key in keys]
+    existing = {str(id) for id in related_model.objects.filter(id__in=ids).values_list('id', flat=True)}
+
+    snapshots = [
+        snapshot_model(**{f'{related_field}_id': id}, date=day, registers=registers, count=count)
+        for id, registers, count in zip(ids, results[::2], results[1::2])
+        if id in existing and registers is not None
+    ]
+
+    snapshot_model.objects.bulk_create(
+        snapshots,
+        update_conflicts=True,
+        unique_fields=[related_field, 'date'],
+        update_fields=['registers', 'count'],
+    )
+
+    return len(snapshots)
+
+
+def merge_snapshots(snapshots):
+    """
+    Unique viewers over several snapshots of one entity, e.g. a week of daily ones.
+    """
+    snapshots = [snapshot for snapshot in snapshots if snapshot.registers]
+
+    if not snapshots:
+        return 0
+
+    keys = [f'hll:merge:{snapshot.id}' for snapshot in snapshots]
+    pipe = redis_client.pipeline(transaction=False)
+    for key, snapshot in zip(keys, snapshots):
+        pipe.set(key, bytes(snapshot.registers), ex=60)
+    pipe.pfcount(*keys)
+    pipe.delete(*keys)
+
+    return pipe.execute()[-2]
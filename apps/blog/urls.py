@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 
 from .views import (
@@ -7,34 +8,47 @@ from .views import (
     IncrementPostClickView,
     CategoryListView,
     CategoryDetailView,
+    CategoryTreeView,
     IncrementCategoryClickView,
     GenerateFakeAnalyticsView,
     GenerateFakePostsView,
     PostCommentViews,
     ListPostCommentsView,
     ListCommentRepliesView,
+    CommentThreadView,
     CommentReplyViews,
     PostLikeViews,
     PostShareView,
-    PostAuthorViews
+    PostAuthorViews,
+    PostInteractionStatsView,
+    CategoryInteractionStatsView,
 )
+from .async_views import AsyncPostListView, AsyncPostDetailView, AsyncCategoryListView, AsyncListPostCommentsView
 
 
+# Coroutine read endpoints for ASGI. Under WSGI each one would run on an event loop of its own,
+# BLOG_ASYNC_VIEWS=False routes them to the sync views instead.
+ASYNC_VIEWS = getattr(settings, 'BLOG_ASYNC_VIEWS', True)
+
 urlpatterns = [
     path('generate_posts/', GenerateFakePostsView.as_view(), name='generate-fake-posts'),
     path('generate_analytics/', GenerateFakeAnalyticsView.as_view(), name='generate-fake-analytics'),
-    path('posts/', PostListView.as_view(), name='posts-list'),
-    path('post/', PostDetailView.as_view(), name='posts-detail'),
+    path('posts/', (AsyncPostListView if ASYNC_VIEWS else PostListView).as_view(), name='posts-list'),
+    path('post/', (AsyncPostDetailView if ASYNC_VIEWS else PostDetailView).as_view(), name='posts-detail'),
     path('post/headings/', PostHeadingView.as_view(), name='post-headings'),
     path('post/increment_click/', IncrementPostClickView.as_view(), name='increment-post-clicks'),
-    path('categories/', CategoryListView.as_view(), name='category-list'),
+    path('categories/', (AsyncCategoryListView if ASYNC_VIEWS else CategoryListView).as_view(), name='category-list'),
+    path('categories/tree/', CategoryTreeView.as_view(), name='category-tree'),
     path('category/posts/', CategoryDetailView.as_view(), name='category-posts'),
     path('category/increment_click/', IncrementCategoryClickView.as_view(), name='increment-category-clicks'),
     path('post/comment/', PostCommentViews.as_view()),
-    path('post/comments/', ListPostCommentsView.as_view()),
+    path('post/comments/', (AsyncListPostCommentsView if ASYNC_VIEWS else ListPostCommentsView).as_view()),
     path('post/comment/replies/', ListCommentRepliesView.as_view()),
+    path('post/comments/tree/', CommentThreadView.as_view(), name='post-comment-tree'),
     path('post/comment/reply/', CommentReplyViews.as_view()),
     path('post/like/', PostLikeViews.as_view()),
     path('post/share/', PostShareView.as_view()),
     path('post/author/', PostAuthorViews.as_view()),
+    path('post/interactions/', PostInteractionStatsView.as_view(), name='post-interaction-stats'),
+    path('category/interactions/', CategoryInteractionStatsView.as_view(), name='category-interaction-stats'),
 ]
\ No newline at end of file
@@ -0,0 +1,227 @@
+import ipaddress
+import uuid
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+import redis
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from core.redis_pool import get_redis_client, get_async_redis_client
+
+from .anomalies import track_interactions
+from .counters import increment_counters
+from .trending import record_trending
+from .unique_views import hll_enabled, exact_views_enabled, add_unique_viewers, unique_viewer_increments, viewer_token
+
+
+redis_client = get_redis_client()
+
+# Detail reads append one compact entry to a stream: {p: post id, u: user id or '', i: ip, t: epoch}.
+# ingest_view_events reads it through a consumer group, so several workers can share the load
+# and entries a dead worker read but never acknowledged are claimed again after CLAIM_IDLE_MS.
+VIEW_EVENTS_STREAM = 'blog:view_events'
+VIEW_EVENTS_GROUP = 'view_ingest'
+VIEW_EVENTS_MAXLEN = getattr(settings, 'BLOG_VIEW_EVENTS_MAXLEN', 1000000)
+
+INGEST_BATCH_SIZE = 1000
+CLAIM_IDLE_MS = 1000 * 60 * 5
+
+
+def _view_event(post_id, ip_address, user_id=None):
+    return {'p': str(post_id), 'u': str(user_id) if user_id else '', 'i': ip_address or '', 't': int(timezone.now().timestamp())}
+
+
+def emit_view_event(post_id, ip_address, user_id=None):
+    redis_client.xadd(VIEW_EVENTS_STREAM, _view_event(post_id, ip_address, user_id), maxlen=VIEW_EVENTS_MAXLEN, approximate=True)
+
+
+async def aemit_view_event(post_id, ip_address, user_id=None):
+    await get_async_redis_client().xadd(
+        VIEW_EVENTS_STREAM, _view_event(post_id, ip_address, user_id), maxlen=VIEW_EVENTS_MAXLEN, approximate=True,
+    )
+
+
+def ensure_consumer_group():
+    try:
+        redis_client.xgroup_create(VIEW_EVENTS_STREAM, VIEW_EVENTS_GROUP, id='0', mkstream=True)
+    except redis.ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def _parse_events(entries):
+    events = []
+
+    for _, fields in entries:
+        fields = {key.decode('utf-8'): value.decode('utf-8') for key, value in fields.items()}
+        try:
+            post_id = uuid.UUID(fields['p'])
+            user_id = fields.get('u') or None
+            timestamp = datetime.fromtimestamp(int(fields['t']), tz=dt_timezone.utc)
+            # In the form Postgres hands it back, see _insert_post_views
+            ip_address = str(ipaddress.ip_address(fields['i']))
+        except (KeyError, ValueError):
+            continue
+        events.append((post_id, user_id, ip_address, timestamp))
+
+    return events
+
+
+def _insert_post_views(views):
+    """
+    Inserts {(post, user, ip): timestamp} with INSERT ... ON CONFLICT DO NOTHING
+    RETURNING and returns the subset that was actually inserted, so viewers
+    written by a concurrent batch (anonymous ones included, see
+    blog_postview_anonymous_uniq) are not counted twice.
+    """
+    from .models import PostView
+
+    if not views:
+        return {}
+
+    quote = connection.ops.quote_name
+    values = ', '.join(['(gen_random_uuid(), %s::uuid, %s::uuid, %s::inet, %s)'] * len(views))
+    params = [
+        value
+        for (post_id, user_id, ip_address), timestamp in views.items()
+        for value in (str(post_id), user_id, ip_address, timestamp)
+    ]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {quote(PostView._meta.db_table)} (id, post_id, user_id, ip_address, timestamp)
+            VALUES {values}
+            ON CONFLICT DO NOTHING
+            RETURNING post_id, user_id, host(ip_address)
+            """,
+            params,
+        )
+        inserted = cursor.fetchall()
+
+    return {
+        key: views[key]
+        for key in ((post_id, str(user_id) if user_id else None, ip_address) for post_id, user_id, ip_address in inserted)
+    }
+
+
+def ingest_events(events):
+    """
+    Writes a batch of view events: one PostView and one 'view' PostInteraction per
+    (post, user, ip) not seen before, then the view deltas per post. In 'hll'
+    mode the number of new viewers per post is the growth of its HyperLogLog
+    estimate, added to only after the rows are written, and PostView is only
+    written when BLOG_EXACT_VIEWS_AUDIT is on.
+    Returns the number of new views.
+    """
+    from .models import Post, PostInteraction
+
+    # First occurrence wins, later duplicates of the same viewer in the batch are dropped
+    unique = {}
+    for post_id, user_id, ip_address, timestamp in events:
+        unique.setdefault((post_id, user_id, ip_address), timestamp)
+
+    if not unique:
+        return 0
+
+    post_ids = {post_id for post_id, _, _ in unique}
+    existing_posts = set(Post.objects.filter(id__in=post_ids).values_list('id', flat=True))
+
+    # Rates are tracked on the raw events, repeated reads are exactly what they look for
+    track_interactions('view', [
+        (post_id, user_id, ip_address, timestamp) for post_id, user_id, ip_address, timestamp in events if post_id in existing_posts
+    ])
+
+    viewers = {key: unique[key] for key in unique if key[0] in existing_posts}
+
+    if hll_enabled():
+        tokens = [(post_id, viewer_token(ip_address, user_id)) for post_id, user_id, ip_address in viewers]
+        # Only how many of the viewers of a post are new is known, the earliest ones take the views
+        increments = unique_viewer_increments('post', tokens)
+        new_views = {}
+        for key in sorted(viewers, key=viewers.get):
+            if increments.get(str(key[0])):
+                increments[str(key[0])] -= 1
+                new_views[key] = viewers[key]
+
+        if not new_views:
+            add_unique_viewers('post', tokens)
+            return 0
+
+    with transaction.atomic():
+        if not hll_enabled():
+            # The rows that really went in are the new views, whatever another worker wrote meanwhile
+            new_views = _insert_post_views(viewers)
+        elif exact_views_enabled():
+            _insert_post_views(new_views)
+
+        # bulk_create skips PostInteraction.save(), so the derived fields are set here, all from
+        # the time of the event so they agree however far behind the stream is
+        PostInteraction.objects.bulk_create(
+            [
+                PostInteraction(
+                    post_id=post_id,
+                    user_id=user_id,
+                    ip_address=ip_address,
+                    interaction_type='view',
+                    interaction_category='passive',
+                    timestamp=timestamp,
+                    hour_of_day=timestamp.hour,
+                    day_of_week=timestamp.weekday(),
+                )
+                for (post_id, user_id, ip_address), timestamp in new_views.items()
+            ],
+            ignore_conflicts=True,
+        )
+
+    # Only once the rows are in, a batch that fails above is retried and counted again
+    if hll_enabled():
+        add_unique_viewers('post', tokens)
+
+    if not new_views:
+        return 0
+
+    increment_counters('post', 'views', Counter(post_id for post_id, _, _ in new_views))
+    record_trending([(post_id, 'view', 1.0, timestamp) for (post_id, _, _), timestamp in new_views.items()])
+
+    return len(new_views)
+
+
+def ingest_view_events(consumer='worker', max_batches=None):
+    """
+    Drains the stream in batches of INGEST_BATCH_SIZE, acknowledging each
+    batch once it is written. Returns the number of new views.
+    """
+    ensure_consumer_group()
+
+    ingested = 0
+    batches = 0
+
+    # Entries delivered to a worker that died before acknowledging them
+    _, claimed, *_ = redis_client.xautoclaim(
+        VIEW_EVENTS_STREAM, VIEW_EVENTS_GROUP, consumer,
+        min_idle_time=CLAIM_IDLE_MS, start_id='0-0', count=INGEST_BATCH_SIZE,
+    )
+    pending = [entry for entry in claimed if entry[1]]
+
+    while max_batches is None or batches < max_batches:
+        if not pending:
+            response = redis_client.xreadgroup(
+                VIEW_EVENTS_GROUP, consumer, {VIEW_EVENTS_STREAM: '>'}, count=INGEST_BATCH_SIZE,
+            )
+            pending = response[0][1] if response else []
+
+        if not pending:
+            break
+
+        ingested += ingest_events(_parse_events(pending))
+
+        entry_ids = [entry_id for entry_id, _ in pending]
+        redis_client.xack(VIEW_EVENTS_STREAM, VIEW_EVENTS_GROUP, *entry_ids)
+        redis_client.xdel(VIEW_EVENTS_STREAM, *entry_ids)
+
+        pending = []
+        batches += 1
+
+    return ingested
@@ -4,18 +4,35 @@ from rest_framework_api.views import StandardAPIView
 from rest_framework import permissions
 from rest_framework.response import Response
 from rest_framework.exceptions import NotFound, APIException, ValidationError
-import redis
-from django.conf import settings
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
 from django.core.cache import cache
-from django.db.models import Q, F, Prefetch
+from django.db.models import Q, F, Value
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
 
-from .models import Post, Heading, PostAnalytics, Category, CategoryAnalytics, PostView, PostInteraction, Comment, PostLike, PostShare
-from .serializers import PostListSerializer, PostSerializer, HeadingSerializer, CategoryListSerializer, CommentSerializer
+from .models import Post, Heading, PostAnalytics, Category, CategoryAnalytics, PostInteraction, Comment, PostLike, PostShare
+from .serializers import PostListSerializer, HeadingSerializer, CategoryListSerializer, CommentSerializer, comment_list_queryset
 from .utils import get_client_ip
-from .tasks import increment_post_views_tasks
+from .pagination import KeysetPaginationMixin
+from .search import search_posts
+from .trending import trending_posts, TRENDING_CACHE_TIMEOUT
+from .impressions import record_post_impressions, record_category_impressions
+from .counters import (
+    increment_post_counter,
+    increment_category_counter,
+    get_pending_post_counters,
+    get_pending_category_counters,
+    reset_counter,
+)
+from .listing_cache import listing_cache_key, get_cached_listing, cache_listing, listing_response, LISTING_CACHE_TIMEOUT
+from .conditional import make_etag, set_validators, conditional_response
+from .tasks import increment_post_views_tasks, refresh_post_detail_cache
+from .view_events import emit_view_event
+from .category_tree import get_category_tree, find_category
+from .detail_cache import get_post_detail_version, get_cached_post_detail, refresh_post_detail, claim_post_detail_refresh, get_post_detail_counters, post_detail_overlay
+from .rollups import GRANULARITIES, get_post_series, get_category_series
+from .threads import get_comment_tree, get_cached_comment_tree, build_comment_subtree, visible_comments, find_subtree, prune_tree
 from apps.authentication.models import UserAccount
 from utils.string_utils import sanitize_string, sanitize_html
 
@@ -23,13 +40,27 @@ from faker import Faker
 import random
 import uuid
 from django.utils.text import slugify
+from django.utils import timezone
+from datetime import timedelta
 
 from core.permissions import HasValidAPIKey
 
-redis_client = redis.StrictRedis(host=settings.REDIS_HOST, port=6379, db=0)
-
-
-class PostAuthorViews(StandardAPIView):
+# Keyset orderings, the last field must be unique so every row has a distinct position.
+POST_LIST_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'recently_updated': ('-updated_at', '-id'),
+    'most_viewed': ('-popularity', '-id'),
+    'trending': ('trending_position', 'id'),
+    'az': ('title', 'id'),
+    'za': ('-title', '-id'),
+    'relevance': ('-search_rank', 'id'),
+}
+AUTHOR_POSTS_ORDERING = ('status', '-created_at', '-id')
+COMMENTS_ORDERING = ('-created_at', '-id')
+STATS_MAX_DAYS = 365
+
+
+class PostAuthorViews(KeysetPaginationMixin, StandardAPIView):
     permission_classes = [HasValidAPIKey, permissions.IsAuthenticated]
 
     def get(self, request):
@@ -38,14 +69,14 @@ class PostAuthorViews(StandardAPIView):
         if user.role == 'customer':
             return self.error('You do not have permissions to edit this post')
 
-        posts = Post.objects.filter(user=user)
+        posts = Post.objects.filter(user=user).select_related('category', 'post_analytics')
             
         if not posts.exists():
             raise NotFound(detail='No posts found.')
 
-        serialized_posts = PostListSerializer(posts, many=True).data
+        page = self.keyset_paginate(request, posts, PostListSerializer, AUTHOR_POSTS_ORDERING)
 
-        return self.paginate(request, serialized_posts)
+        return self.paginated_response(page)
 
     def post(self, request):
 
@@ -138,6 +169,11 @@ class PostAuthorViews(StandardAPIView):
                     f"Category '{category_slug}' does not exist.", status=400
                 )
 
+        if post_status == 'published' and Post.postobjects.filter(slug=post.slug).exclude(id=post.id).exists():
+            return self.response_error(
+                f"A published post with slug '{post.slug}' already exists.", status=400
+            )
+
         if title:
             post.title = title
 
@@ -189,7 +225,47 @@ class PostAuthorViews(StandardAPIView):
         return self.response(f"Post {post.title} successfully deleted.")
 
 
-class PostListView(StandardAPIView):
+def filter_post_list(posts, author=None, categories=()):
+    if author:
+        posts = posts.filter(user__username=author)
+
+    if categories:
+        category_queries = Q()
+        for category in categories:
+            try:
+                uuid.UUID(category)
+                uuid_query = (
+                    Q(category__id=category)
+                )
+                category_queries |= uuid_query
+            except:
+                slug_query = (
+                    Q(category__slug=category)
+                )
+                category_queries |= slug_query
+        
+        posts = posts.filter(category_queries)
+
+    return posts
+
+
+def order_post_list(posts, search, sorting, ordering):
+    # Returns the queryset (annotated when the ordering needs it) and its keyset ordering
+    keyset_ordering = POST_LIST_ORDERINGS['relevance' if search else 'newest']
+
+    if sorting in ('newest', 'recently_updated', 'most_viewed', 'trending'):
+        keyset_ordering = POST_LIST_ORDERINGS[sorting]
+
+    if ordering in ('az', 'za'):
+        keyset_ordering = POST_LIST_ORDERINGS[ordering]
+
+    if keyset_ordering == POST_LIST_ORDERINGS['most_viewed']:
+        posts = posts.annotate(popularity=Coalesce(F("post_analytics__views"), Value(0)))
+
+    return posts, keyset_ordering
+
+
+class PostListView(KeysetPaginationMixin, StandardAPIView):
     permission_classes = [HasValidAPIKey]
 
     def get(self, request, *args, **kwargs):
@@ -199,78 +275,45 @@ class PostListView(StandardAPIView):
             ordering = request.query_params.get("ordering", None)
             author = request.query_params.get("author", None)
             categories = request.query_params.getlist("category", [])
-            page = request.query_params.getlist("p", "1")
 
-            cache_key = f'post_list:{search}:{sorting}:{ordering}:{author}:{categories}:{page}'
-            cached_posts = cache.get(cache_key)
+            cache_key = listing_cache_key('post_list', request)
+            cached_listing = get_cached_listing(cache_key)
             
-            if cached_posts:
-                serialized_posts = PostListSerializer(cached_posts, many=True).data
-
-                for post in cached_posts:
-                    redis_client.incr(f'post:impressions:{post["id"]}')
-                return self.paginate(request, serialized_posts)
+            if cached_listing:
+                content, post_ids, built_at = cached_listing
+                record_post_impressions(post_ids)
+                return listing_response(request, content, built_at)
             
-            posts = Post.postobjects.all().select_related("category").prefetch_related(
-                Prefetch("post_analytics", to_attr="analytics_cache")
-            )
+            posts = Post.postobjects.all().select_related("category", "post_analytics")
             
             if not posts.exists():
                 raise NotFound(detail='No posts found.')
 
             if search != "":
-                posts = Post.postobjects.filter(
-                    Q(title__icontains=search) |
-                    Q(description__icontains=search) |
-                    Q(content__icontains=search) |
-                    Q(keywords__icontains=search)
-                )
+                posts = search_posts(posts, search)
+
+            if sorting == 'trending':
+                posts = trending_posts(posts)
             
-            if author:
-                posts = posts.filter(user__username=author)
-
-            if categories:
-                category_queries = Q()
-                for category in categories:
-                    try:
-                        uuid.UUID(category)
-                        uuid_query = (
-                            Q(category__id=category)
-                        )
-                        category_queries |= uuid_query
-                    except:
-                        slug_query = (
-                            Q(category__slug=category)
-                        )
-                        category_queries |= slug_query
-                
-                posts = posts.filter(category_queries)
-
-            if sorting:
-                if sorting == 'newest':
-                    posts = posts.order_by("-created_at")
-                elif sorting == 'recently_updated':
-                    posts = posts.order_by('-updated_at')
-                elif sorting == 'most_viewed':
-                    posts = posts.annotate(popularity=F("analytics_cache__views")).order_by('-popularity')
-
-            if ordering:
-                if ordering == 'az':
-                    posts = posts.order_by("title")
-                elif ordering == 'za':
-                    posts = posts.order_by('-title')
-
-            cache.set(cache_key, posts, timeout=60*5)
-
-            serialized_posts = PostListSerializer(posts, many=True).data
-
-            for post in posts:
-                redis_client.incr(f'post:impressions:{post.id}')
+            posts = filter_post_list(posts, author, categories)
+            posts, keyset_ordering = order_post_list(posts, search, sorting, ordering)
+
+            page = self.keyset_paginate(request, posts, PostListSerializer, keyset_ordering)
+            post_ids = [post['id'] for post in page['results']]
+
+            content, _, built_at = cache_listing(
+                cache_key, self.paginated_response(page).data, post_ids,
+                timeout=TRENDING_CACHE_TIMEOUT if sorting == 'trending' else LISTING_CACHE_TIMEOUT,
+            )
+
+            record_post_impressions(post_ids)
     
-            return self.paginate(request, serialized_posts)
+            return listing_response(request, content, built_at)
 
         except Post.DoesNotExist:
             raise NotFound(detail='No posts found.')
+        except NotFound:
+            raise
         except Exception as e:
             raise APIException(detail=f'An unexpected error ocurreed: {str(e)}')
             
@@ -286,49 +329,43 @@ class PostDetailView(StandardAPIView):
         if not slug:
             raise NotFound(detail='A valid slug muest be provided.')
         
-        try:            
-            cache_key = f'post_detail:{slug}'
-            cached_serialized_post = cache.get(cache_key)
-            
-            if cached_serialized_post:
-                serialized_post = PostSerializer(cached_serialized_post, context={'request': request}).data
-                self._register_view_interaction(cached_serialized_post, ip_address, user)
-                return self.response(serialized_post)
-            
-            try:
-                post = Post.postobjects.get(slug=slug)
-            except Post.DoesNotExist:
+        try:
+            version = get_post_detail_version(slug)
+            post_data, is_stale = get_cached_post_detail(slug)
+
+            if post_data is None:
+                post_data = refresh_post_detail(slug)
+            elif is_stale and claim_post_detail_refresh(slug):
+                # Everyone else keeps getting the stale body until the refresh lands
+                refresh_post_detail_cache.delay(slug)
+
+            if post_data is None:
                 raise NotFound(f"Post {slug} does not exist.")
 
-            serialized_post = PostSerializer(post, context={'request': request}).data
+            # has_liked is per user and the counters move without a version bump, the tag covers
+            # both. There is no Last-Modified, the version alone would not see the counters change
+            counters = get_post_detail_counters(post_data['id'])
+            etag = make_etag('post_detail', slug, version, user.id if user else '', *counters.values())
 
-            cache.set(cache_key, serialized_post, timeout=60*5)
-            cache.delete(cache_key)
+            # The client still shows the post even when it is not sent again, so the view counts
+            self._register_view_interaction(post_data['id'], ip_address, user)
 
-            self._register_view_interaction(post, ip_address, user)
+            not_modified = conditional_response(request, etag)
+            if not_modified:
+                return not_modified
+
+            serialized_post = post_detail_overlay(post_data, request, user, counters)
             
-        except Post.DoesNotExist:
-            raise NotFound(detail='The requested post does not exist.')
+        except NotFound:
+            raise
         except Exception as e:
             raise APIException(detail=f'An unexpected error ocurreed: {str(e)}')
 
-        return self.response(serialized_post)
+        return set_validators(self.response(serialized_post), etag)
     
-    def _register_view_interaction(self, post, ip_address, user):
-        # Register view type interaction, increments unique and total views and updates PostAnalytics
-
-        if not PostView.objects.filter(post=post, ip_address=ip_address, user=user).exists():
-            PostView.objects.create(post=post, ip_address=ip_address, user=user)
-
-            PostInteraction.objects.create(
-                user=user,
-                post=post,
-                interaction_type='view',
-                ip_address=ip_address,
-            )
-
-            analytics, _ = PostAnalytics.objects.get_or_create(post=post)
-            analytics.increment_metric('views')
+    def _register_view_interaction(self, post_id, ip_address, user):
+        # Only emits the event, PostView, PostInteraction and the view counter are written by ingest_post_view_events
+        emit_view_event(post_id, ip_address, user.id if user else None)
 
 
 class PostHeadingView(StandardAPIView):
@@ -354,16 +391,41 @@ class IncrementPostClickView(StandardAPIView):
         
         try:
             post_analytics, created = PostAnalytics.objects.get_or_create(post=post)
-            post_analytics.increment_click()
+            increment_post_counter(post.id, 'clicks')
+            pending = get_pending_post_counters([post.id]).get(str(post.id), {})
         except Exception as e:
             raise APIException(detail=f'An unexpected error ocurreed: {str(e)}')
         
         return self.response({
             'message': 'Click incremented successfully',
-            'clicks': post_analytics.clicks
+            'clicks': post_analytics.clicks + pending.get('clicks', 0)
         })
 
 
+def order_category_list(categories, search, sorting, ordering):
+    if search != "":
+        categories = categories.filter(
+            Q(name__icontains=search) |
+            Q(slug__icontains=search) |
+            Q(title__icontains=search) |
+            Q(description__icontains=search)
+        )
+
+    if sorting:
+        if sorting == 'most_viewed':
+            categories = categories.annotate(
+                popularity=Coalesce(F("category_analytics__views"), Value(0))
+            ).order_by('-popularity')
+
+    if ordering:
+        if ordering == 'az':
+            categories = categories.order_by("name")
+        elif ordering == 'za':
+            categories = categories.order_by('-name')
+
+    return categories
+
+
 class CategoryListView(StandardAPIView):
     def get(self, request):
         try:
@@ -371,60 +433,37 @@ class CategoryListView(StandardAPIView):
             search = request.query_params.get("search", "").strip()
             ordering = request.query_params.get("ordering", None)
             sorting = request.query_params.get("sorting", None)
-            page = request.query_params.get("p", "1")
 
-            cache_key = f'category_list:{page}:{ordering}:{sorting}:{search}:{parent_slug}'
-            cached_categories = cache.get(cache_key)
+            cache_key = listing_cache_key('category_list', request)
+            cached_listing = get_cached_listing(cache_key)
             
-            if cached_categories:
-                serialized_categories = CategoryListSerializer(categories, many=True).data
-
-                for category in cached_categories:
-                    redis_client.incr(f'category:impressions:{category["id"]}')
-                return self.paginate(request, serialized_categories)
+            if cached_listing:
+                content, category_ids, built_at = cached_listing
+                record_category_impressions(category_ids)
+                return listing_response(request, content, built_at)
 
             if parent_slug:
-                categories = Category.objects.filter(parent__slug=parent_slug).prefetch_related(
-                    Prefetch("category_analytics", to_attr="analytics_cache")
-                )
+                categories = Category.objects.filter(parent__slug=parent_slug)
             else:
-                categories = Category.objects.filter(parent__isnull=True).prefetch_related(
-                    Prefetch("category_analytics", to_attr="analytics_cache")
-                )
+                categories = Category.objects.filter(parent__isnull=True)
 
             if not categories.exists():
                 raise NotFound(detail="No categories found.")
             
-            if search != "":
-                categories = Category.objects.filter(
-                    Q(name__icontains=search) |
-                    Q(slug__icontains=search) |
-                    Q(title__icontains=search) |
-                    Q(description__icontains=search)
-                )
+            categories = list(order_category_list(categories, search, sorting, ordering))
+            category_ids = [str(category.id) for category in categories]
 
-            if sorting:
-                if sorting == 'newest':
-                    categories = categories.order_by("-created_at")
-                elif sorting == 'recently_updated':
-                    categories = categories.order_by('-updated_at')
-                elif sorting == 'most_viewed':
-                    categories = categories.annotate(popularity=F("analytics_cache__views")).order_by('-popularity')
+            serialized_categories = CategoryListSerializer(categories, many=True).data
 
-            if ordering:
-                if ordering == 'az':
-                    categories = categories.order_by("name")
-                elif ordering == 'za':
-                    categories = categories.order_by('-name')
+            response = self.paginate(request, serialized_categories)
+            if response.status_code != 200:
+                return response
 
-            cache.set(cache_key, categories, timeout=60*5)
+            content, _, built_at = cache_listing(cache_key, response.data, category_ids)
 
-            serialized_categories = CategoryListSerializer(categories, many=True).data
-
-            for category in categories:
-                redis_client.incr(f'category:impressions:{category.id}')
+            record_category_impressions(category_ids)
             
-            return self.paginate(request, serialized_categories)
+            return listing_response(request, content, built_at)
         
         except Category.DoesNotExist:
             raise NotFound(detail='No categories found.')
@@ -432,51 +471,79 @@ class CategoryListView(StandardAPIView):
             raise APIException(detail=f'An unexpected error ocurreed: {str(e)}')
 
 
-class CategoryDetailView(StandardAPIView):
+class CategoryDetailView(KeysetPaginationMixin, StandardAPIView):
     permissions_classes = [HasValidAPIKey]
 
     def get(self, request):
         try:
             slug = request.query_params.get('slug', None)
-            page = request.query_params.get('p', '1')
 
             if not slug:
                 return self.error("Missing slug parameter")
             
-            cache_key = f"category_posts:{slug}:{page}"
-            cached_data = cache.get(cache_key)
+            cache_key = listing_cache_key('category_posts', request)
+            cached_listing = get_cached_listing(cache_key)
             
-            if cached_data:
-                return self.paginate(request, cached_data)
+            if cached_listing:
+                content, post_ids, built_at = cached_listing
+                record_post_impressions(post_ids)
+                return listing_response(request, content, built_at)
             
+            include_subcategories = request.query_params.get('subcategories', '').lower() in ('1', 'true')
+
             category = get_object_or_404(Category, slug=slug)
 
-            posts = Post.postobjects.filter(category=category).select_related('category').prefetch_related(
-                Prefetch("post_analytics", to_attr="analytics_cache")
-            )
+            if include_subcategories:
+                # One join on the materialized path, however deep the subtree is
+                posts = Post.postobjects.filter(category__path__startswith=category.path)
+            else:
+                posts = Post.postobjects.filter(category=category)
+
+            posts = posts.select_related('category', 'post_analytics')
 
             if not posts.exists():
                 raise NotFound(detail=f"No posts found for category '{category.name}'.")
             
-            serialized_posts = PostListSerializer(posts, many=True).data
-            
-            cache.set(cache_key, serialized_posts, timeout=60*5)
+            page = self.keyset_paginate(request, posts, PostListSerializer, POST_LIST_ORDERINGS['newest'])
+            post_ids = [post['id'] for post in page['results']]
 
-            for post in posts:
-                redis_client.incr(f'post:impressions:{post.id}')
+            content, _, built_at = cache_listing(cache_key, self.paginated_response(page).data, post_ids)
 
-            return self.paginate(request, serialized_posts)
+            record_post_impressions(post_ids)
+
+            return listing_response(request, content, built_at)
         
         except Category.DoesNotExist:
             raise NotFound(detail='No categories found.')
+        except NotFound:
+            raise
         except Exception as e:
             raise APIException(detail=f'An unexpected error occurred: {str(e)}')
         
 
+class CategoryTreeView(StandardAPIView):
+    permission_classes = [HasValidAPIKey]
+
+    def get(self, request):
+        """
+        The whole category tree, or the subtree under slug, cached until a category changes.
+        """
+        slug = request.query_params.get('slug', None)
+        tree = get_category_tree()
+
+        if slug:
+            node = find_category(tree, slug)
+            if node is None:
+                raise NotFound(detail=f"Category: {slug} does not exist")
+            tree = [node]
+
+        return self.response(tree)
+
+
 class IncrementCategoryClickView(StandardAPIView):
     permission_classes = [HasValidAPIKey]
 
-    def category(self, request):
+    def post(self, request):
         data = request.data
 
         try:
@@ -486,41 +553,43 @@ class IncrementCategoryClickView(StandardAPIView):
         
         try:
             category_analytics, created = CategoryAnalytics.objects.get_or_create(category=category)
-            category_analytics.increment_click()
+            increment_category_counter(category.id, 'clicks')
+            pending = get_pending_category_counters([category.id]).get(str(category.id), {})
         except Exception as e:
             raise APIException(detail=f'An unexpected error ocurreed: {str(e)}')
         
         return self.response({
             'message': 'Click incremented successfully',
-            'clicks': category_analytics.clicks
+            'clicks': category_analytics.clicks + pending.get('clicks', 0)
         })
 
 
-class ListPostCommentsView(StandardAPIView):
+class ListPostCommentsView(KeysetPaginationMixin, StandardAPIView):
     permission_classes = [HasValidAPIKey]
 
     def get(self, request):
         """ List comments of a post """
 
         post_slug = request.query_params.get('slug', None)
-        page = request.query_params.get("p", "1")
+        cursor = request.query_params.get("cursor", None)
+        page_size = request.query_params.get("page_size", None)
 
         if not post_slug:
             raise NotFound(detail='A valid post slug must be provided.')
 
-        cache_key = f"post_comment:{post_slug}:{page}"
-        cached_comments = cache.get(cache_key)
+        cache_key = f"post_comment:{post_slug}:{cursor}:{page_size}"
+        cached_page = cache.get(cache_key)
 
-        if cached_comments:
-            return self.paginate(request, cached_comments)
+        if cached_page:
+            return self.paginated_response(cached_page)
 
         try:
-            post = Post.objects.get(slug=post_slug)
+            post = Post.objects.only('id').get(slug=post_slug)
         except Post.DoesNotExist:
             raise ValueError(f"Post: {post_slug} does not exist")
         
-        comments = Comment.objects.filter(post=post)
-        serialized_comments = CommentSerializer(comments, many=True).data
+        comments = comment_list_queryset().filter(post=post)
+        page = self.keyset_paginate(request, comments, CommentSerializer, COMMENTS_ORDERING)
 
         cache_index_key = f"post_comments_cache_keys:{post_slug}"
         cache_keys = cache.get(cache_index_key, [])
@@ -528,9 +597,9 @@ class ListPostCommentsView(StandardAPIView):
 
         cache.set(cache_index_key, cache_keys, timeout=60*5)
 
-        cache.set(cache_key, serialized_comments, timeout=60*5)
+        cache.set(cache_key, page, timeout=60*5)
 
-        return self.paginate(request, serialized_comments)
+        return self.paginated_response(page)
 
 
 class PostCommentViews(StandardAPIView):
@@ -582,7 +651,7 @@ class PostCommentViews(StandardAPIView):
 
         self._invalidate_post_comments_cache(comment.post.slug)
 
-        if comment.parent and comment.parent.replies.exist():
+        if comment.parent and comment.parent.replies.exists():
             self._invalidate_comment_replies_cache(comment.parent.id)
 
         return self.response('Comment content updated successfully.')
@@ -600,17 +669,15 @@ class PostCommentViews(StandardAPIView):
             raise NotFound(detail=f"Comment with id: {comment_id} does not exist")
 
         post = comment.post
-        post_analytics, _ = PostAnalytics.objects.get_or_create(post=post)
 
-        if comment.parent and comment.parent.replies.exist():
+        if comment.parent and comment.parent.replies.exists():
             self._invalidate_comment_replies_cache(comment.parent.id)
 
         comment.delete()
 
         comments_count = Comment.objects.filter(post=post, is_active=True).count()
 
-        post_analytics.comments = comments_count
-        post_analytics.save()
+        reset_counter(PostAnalytics, 'post', 'post', post.id, 'comments', comments_count)
 
         self._invalidate_post_comments_cache(post.slug)
 
@@ -627,8 +694,7 @@ class PostCommentViews(StandardAPIView):
             ip_address=ip_address,
         )
 
-        analytics, _ = PostAnalytics.objects.get_or_create(post=post)
-        analytics.increment_metric('comments')
+        increment_post_counter(post.id, 'comments')
 
     def _invalidate_post_comments_cache(self, post_slug):
         cache_index_key = f"post_comments_cache_keys:{post_slug}"
@@ -649,37 +715,38 @@ class PostCommentViews(StandardAPIView):
         cache.delete(cache_index_key)
 
 
-class ListCommentRepliesView(StandardAPIView):
+class ListCommentRepliesView(KeysetPaginationMixin, StandardAPIView):
     permission_classes = [HasValidAPIKey]
 
     def get(self, request):
 
         comment_id = request.query_params.get("comment_id", None)
-        page = request.query_params.get("p", 1)
+        cursor = request.query_params.get("cursor", None)
+        page_size = request.query_params.get("page_size", None)
 
         if not comment_id:
             raise NotFound(detail='A valid comment id must be provided.')
         
-        cache_key = f"comment_replies:{comment_id}:{page}"
-        cached_replies = cache.get(cache_key)
+        cache_key = f"comment_replies:{comment_id}:{cursor}:{page_size}"
+        cached_page = cache.get(cache_key)
 
-        if cached_replies:
-            return self.paginate(request, cached_replies)
+        if cached_page:
+            return self.paginated_response(cached_page)
         
         try:
-            parent_comment = Comment.objects.get(id=comment_id)
+            parent_comment = Comment.objects.only('id').get(id=comment_id)
         except Comment.DoesNotExist:
             raise NotFound(detail=f"Comment with id: {comment_id} does not exist")
         
-        replies = parent_comment.replies.filter(is_active=True).order_by("-created_at")
+        replies = comment_list_queryset().filter(parent=parent_comment, is_active=True)
 
-        serialized_replies = CommentSerializer(replies, many=True).data
+        page = self.keyset_paginate(request, replies, CommentSerializer, COMMENTS_ORDERING)
 
         self._register_comment_reply_cache_key(comment_id, cache_key)
 
-        cache.set(cache_key, serialized_replies, timeout=60*5)
+        cache.set(cache_key, page, timeout=60*5)
 
-        return self.paginate(request, serialized_replies)
+        return self.paginated_response(page)
     
     def _register_comment_reply_cache_key(self, comment_id, cache_key):
         cache_index_key = f"comment_replies_cache_keys:{comment_id}"
@@ -691,6 +758,56 @@ class ListCommentRepliesView(StandardAPIView):
         cache.set(cache_index_key, cache_keys, timeout=60*5)
 
 
+class CommentThreadView(StandardAPIView):
+    permission_classes = [HasValidAPIKey]
+
+    def get(self, request):
+        """
+        The nested thread of a post. With comment_id only that subtree is returned,
+        depth limits how many levels of replies are included.
+        """
+
+        post_slug = request.query_params.get("slug", None)
+        comment_id = request.query_params.get("comment_id", None)
+        depth = request.query_params.get("depth", None)
+
+        if not post_slug:
+            raise NotFound(detail='A valid post slug must be provided.')
+
+        if depth is not None:
+            try:
+                depth = int(depth)
+            except ValueError:
+                raise ValidationError(detail='depth must be an integer.')
+            if depth < 0:
+                raise ValidationError(detail='depth must be zero or greater.')
+
+        if not comment_id:
+            if not Post.objects.filter(slug=post_slug).exists():
+                raise NotFound(detail=f"Post: {post_slug} does not exist")
+            return self.response(prune_tree(get_comment_tree(post_slug), depth))
+
+        try:
+            comment_id = str(uuid.UUID(comment_id))
+        except ValueError:
+            raise NotFound(detail=f"Comment with id: {comment_id} does not exist")
+
+        # Served from the cached thread when there is one, else one path__startswith query
+        cached_tree = get_cached_comment_tree(post_slug)
+        if cached_tree is not None:
+            node = find_subtree(cached_tree, comment_id)
+            if node is None:
+                raise NotFound(detail=f"Comment with id: {comment_id} does not exist")
+            return self.response(prune_tree([node], depth))
+
+        try:
+            comment = visible_comments(Comment.objects.filter(post__slug=post_slug)).get(id=comment_id)
+        except Comment.DoesNotExist:
+            raise NotFound(detail=f"Comment with id: {comment_id} does not exist")
+
+        return self.response(build_comment_subtree(comment, depth))
+
+
 class CommentReplyViews(StandardAPIView):
     permission_classes = [HasValidAPIKey, permissions.IsAuthenticated]
     
@@ -742,8 +859,7 @@ class CommentReplyViews(StandardAPIView):
             ip_address=ip_address,
         )
 
-        analytics, _ = PostAnalytics.objects.get_or_create(post=post)
-        analytics.increment_metric('comments')
+        increment_post_counter(post.id, 'comments')
 
 
 class PostLikeViews(StandardAPIView):
@@ -776,8 +892,7 @@ class PostLikeViews(StandardAPIView):
             ip_address=ip_address,
         )
 
-        analytics, _ = PostAnalytics.objects.get_or_create(post=post)
-        analytics.increment_metric("likes")
+        increment_post_counter(post.id, 'likes')
 
 
         return self.response(f"You have liked the post: {post.title}")
@@ -802,9 +917,9 @@ class PostLikeViews(StandardAPIView):
         
         like.delete()
 
-        analytics, _ = PostAnalytics.objects.get_or_create(post=post)
-        analytics.likes = PostLike.objects.filter(post=post).count()
-        analytics.save()
+        likes_count = PostLike.objects.filter(post=post).count()
+
+        reset_counter(PostAnalytics, 'post', 'post', post.id, 'likes', likes_count)
 
         return self.response(f"You have unliked the post: {post.title}")
 
@@ -845,12 +960,82 @@ class PostShareView(StandardAPIView):
             ip_address=ip_address
         )
         
-        analytics, _ = PostAnalytics.objects.get_or_create(post=post)
-        analytics.increment_metric('shares')
+        increment_post_counter(post.id, 'shares')
 
         return self.response(f'Post {post.title} shared successfully on {platform.capitalize()}')
 
 
+def parse_stats_days(request):
+    try:
+        days = int(request.query_params.get('days', 30))
+    except ValueError:
+        raise ValidationError(detail='days must be an integer.')
+
+    if not 1 <= days <= STATS_MAX_DAYS:
+        raise ValidationError(detail=f'days must be between 1 and {STATS_MAX_DAYS}.')
+
+    return days
+
+
+class PostInteractionStatsView(StandardAPIView):
+    permission_classes = [HasValidAPIKey, permissions.IsAuthenticated]
+
+    def get(self, request):
+        """ Interaction time series of one of the user's posts, read from the rollup tables """
+
+        user = request.user
+
+        if user.role == 'customer':
+            return self.error('You do not have permissions to view these analytics')
+
+        post_slug = request.query_params.get('slug', None)
+        granularity = request.query_params.get('granularity', 'daily')
+
+        if not post_slug:
+            raise NotFound(detail='A valid post slug must be provided.')
+
+        if granularity not in GRANULARITIES:
+            raise ValidationError(detail=f"Invalid granularity. Valid options are: {', '.join(GRANULARITIES)}")
+
+        days = parse_stats_days(request)
+
+        try:
+            post = Post.objects.get(slug=post_slug, user=user)
+        except Post.DoesNotExist:
+            raise NotFound(detail=f"Post: {post_slug} does not exist")
+
+        series = get_post_series(post, granularity, since=timezone.now() - timedelta(days=days))
+
+        return self.response({'granularity': granularity, 'series': series})
+
+
+class CategoryInteractionStatsView(StandardAPIView):
+    permission_classes = [HasValidAPIKey, permissions.IsAuthenticated]
+
+    def get(self, request):
+        """ Interaction time series of a category, read from the rollup tables """
+
+        if request.user.role == 'customer':
+            return self.error('You do not have permissions to view these analytics')
+
+        slug = request.query_params.get('slug', None)
+        granularity = request.query_params.get('granularity', 'daily')
+
+        if not slug:
+            raise NotFound(detail='A valid category slug must be provided.')
+
+        if granularity not in GRANULARITIES:
+            raise ValidationError(detail=f"Invalid granularity. Valid options are: {', '.join(GRANULARITIES)}")
+
+        days = parse_stats_days(request)
+
+        category = get_object_or_404(Category, slug=slug)
+
+        series = get_category_series(category, granularity, since=timezone.now() - timedelta(days=days))
+
+        return self.response({'granularity': granularity, 'series': series})
+
+
 class GenerateFakePostsView(StandardAPIView):
 
     def get(self, request):
@@ -15,10 +15,15 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 django_asgi_app = get_asgi_application()
 
-from channels.routing import ProtocolTypeRouter
+from django.conf import settings
+from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.security.websocket import OriginValidator
+
+from apps.blog.routing import websocket_urlpatterns
 
 application = ProtocolTypeRouter(
     {
-        'http': django_asgi_app
+        'http': django_asgi_app,
+        'websocket': OriginValidator(URLRouter(websocket_urlpatterns), settings.CHANNELS_ALLOWED_ORIGINS),
     }
-)
\ No newline at end of file
+)
@@ -0,0 +1,130 @@
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django_redis.cache import RedisCache
+
+from .metrics import cache_call
+from .redis_pool import get_async_redis_client
+
+
+_MISSING = object()
+
+
+class InstrumentedCacheMixin:
+    """
+    Records the time of every cache call and the hits and misses of reads on the
+    metrics of the current request, see core.metrics.
+    """
+
+    def get(self, key, default=None, version=None, **kwargs):
+        with cache_call() as metrics:
+            value = super().get(key, _MISSING, version=version, **kwargs)
+            if metrics is not None:
+                if value is _MISSING:
+                    metrics.cache_misses += 1
+                else:
+                    metrics.cache_hits += 1
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, *args, **kwargs):
+        keys = list(keys)
+        with cache_call() as metrics:
+            values = super().get_many(keys, *args, **kwargs)
+            if metrics is not None:
+                metrics.cache_hits += len(values)
+                metrics.cache_misses += len(keys) - len(values)
+        return values
+
+    def set(self, *args, **kwargs):
+        with cache_call():
+            return super().set(*args, **kwargs)
+
+    def add(self, *args, **kwargs):
+        with cache_call():
+            return super().add(*args, **kwargs)
+
+    def set_many(self, *args, **kwargs):
+        with cache_call():
+            return super().set_many(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with cache_call():
+            return super().delete(*args, **kwargs)
+
+    def delete_many(self, *args, **kwargs):
+        with cache_call():
+            return super().delete_many(*args, **kwargs)
+
+    def incr(self, *args, **kwargs):
+        with cache_call():
+            return super().incr(*args, **kwargs)
+
+
+class AsyncRedisCacheMixin:
+    """
+    aget, aadd, aset and adelete on the asyncio Redis client instead of Django's
+    default of running the sync call on a thread. Keys and values are encoded by
+    django-redis itself, so sync and async callers share the same entries.
+    """
+
+    def _async_client(self):
+        # The asyncio client only knows REDIS_URL, any other location keeps the default
+        if self._server != settings.REDIS_URL:
+            return None
+        return get_async_redis_client(settings.REDIS_URL)
+
+    def _timeout_ms(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return None if timeout is None else int(timeout * 1000)
+
+    async def aget(self, key, default=None, version=None):
+        client = self._async_client()
+        if client is None:
+            return await super().aget(key, default, version)
+
+        with cache_call() as metrics:
+            value = await client.get(self.client.make_key(key, version=version))
+            if metrics is not None:
+                if value is None:
+                    metrics.cache_misses += 1
+                else:
+                    metrics.cache_hits += 1
+
+        return default if value is None else self.client.decode(value)
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return await self._aset(key, value, timeout, version, nx=False)
+
+    async def aadd(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return await self._aset(key, value, timeout, version, nx=True)
+
+    async def _aset(self, key, value, timeout, version, nx):
+        client = self._async_client()
+        if client is None:
+            if nx:
+                return await super().aadd(key, value, timeout, version)
+            return await super().aset(key, value, timeout, version)
+
+        key = self.client.make_key(key, version=version)
+        timeout = self._timeout_ms(timeout)
+
+        with cache_call():
+            # Same as django-redis: a timeout of 0 or less expires the key right away
+            if timeout is not None and timeout <= 0:
+                if nx:
+                    return not await client.exists(key)
+                return bool(await client.delete(key))
+
+            return bool(await client.set(key, self.client.encode(value), nx=nx, px=timeout))
+
+    async def adelete(self, key, version=None):
+        client = self._async_client()
+        if client is None:
+            return await super().adelete(key, version)
+
+        with cache_call():
+            return bool(await client.delete(self.client.make_key(key, version=version)))
+
+
+class InstrumentedRedisCache(AsyncRedisCacheMixin, InstrumentedCacheMixin, RedisCache):
+    pass
@@ -0,0 +1,331 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import redis
+import redis.asyncio
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework import serializers
+
+
+# Histograms live in process memory, every uvicorn worker exposes its own on /metrics/
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+_current = ContextVar('request_metrics', default=None)
+# Set while inside a cache call, so the Redis commands it runs are not counted twice. A context
+# variable rather than a flag on the metrics: tasks gathered by an async view each get their own.
+_in_cache = ContextVar('in_cache_call', default=False)
+
+
+class RequestMetrics:
+    """
+    What one request spent in Postgres, the cache, direct Redis commands and
+    serializers. Times are in seconds.
+    """
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_time = 0.0
+        self.redis_commands = 0
+        self.redis_time = 0.0
+        self.serialize_time = 0.0
+        # Set while inside a serializer, so nested serializers are not counted twice
+        self.serializing = False
+
+    def server_timing(self, total):
+        # Server-Timing durations are in milliseconds
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.db_queries} queries"',
+            f'cache;dur={self.cache_time * 1000:.2f};desc="{self.cache_hits} hits {self.cache_misses} misses"',
+            f'redis;dur={self.redis_time * 1000:.2f};desc="{self.redis_commands} commands"',
+            f'serialize;dur={self.serialize_time * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
+
+
+def start_request_metrics():
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def stop_request_metrics(token):
+    _current.reset(token)
+
+
+def current_request_metrics():
+    return _current.get()
+
+
+@contextmanager
+def cache_call():
+    # Times a cache operation, yields the metrics (or None outside a request) to record hits on
+    metrics = _current.get()
+
+    if metrics is None or _in_cache.get():
+        yield None
+        return
+
+    token = _in_cache.set(True)
+    started = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        metrics.cache_time += time.perf_counter() - started
+        _in_cache.reset(token)
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    metrics = _current.get()
+
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+def _add_db_wrapper(connection, **kwargs):
+    # Installed for the life of the connection, connection.execute_wrapper() only lasts a block
+    # and would miss the queries async views run on sync_to_async threads
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+def _timed_redis(method, count):
+    def wrapper(client, *args, **kwargs):
+        metrics = _current.get()
+
+        if metrics is None or _in_cache.get():
+            return method(client, *args, **kwargs)
+
+        commands = count(client)
+        started = time.perf_counter()
+        try:
+            return method(client, *args, **kwargs)
+        finally:
+            metrics.redis_commands += commands
+            metrics.redis_time += time.perf_counter() - started
+
+    return wrapper
+
+
+def _timed_async_redis(method, count):
+    async def wrapper(client, *args, **kwargs):
+        metrics = _current.get()
+
+        if metrics is None or _in_cache.get():
+            return await method(client, *args, **kwargs)
+
+        commands = count(client)
+        started = time.perf_counter()
+        try:
+            return await method(client, *args, **kwargs)
+        finally:
+            metrics.redis_commands += commands
+            metrics.redis_time += time.perf_counter() - started
+
+    return wrapper
+
+
+def _timed_data(data):
+    def wrapper(serializer):
+        metrics = _current.get()
+
+        if metrics is None or metrics.serializing:
+            return data.fget(serializer)
+
+        metrics.serializing = True
+        started = time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            metrics.serialize_time += time.perf_counter() - started
+            metrics.serializing = False
+
+    return property(wrapper)
+
+
+_installed = False
+_install_lock = threading.Lock()
+
+
+def install_instrumentation():
+    """
+    Hooks the database connections, redis-py clients and DRF serializers once per
+    process. The hooks only record while a request is being measured.
+    """
+    global _installed
+
+    with _install_lock:
+        if _installed:
+            return
+
+        connection_created.connect(_add_db_wrapper, dispatch_uid='core.metrics.db_wrapper')
+        for connection in connections.all(initialized_only=True):
+            _add_db_wrapper(connection)
+
+        redis.Redis.execute_command = _timed_redis(redis.Redis.execute_command, lambda client: 1)
+        redis.client.Pipeline.execute = _timed_redis(redis.client.Pipeline.execute, lambda pipe: len(pipe.command_stack))
+        redis.asyncio.Redis.execute_command = _timed_async_redis(redis.asyncio.Redis.execute_command, lambda client: 1)
+        redis.asyncio.client.Pipeline.execute = _timed_async_redis(
+            redis.asyncio.client.Pipeline.execute, lambda pipe: len(pipe.command_stack)
+        )
+
+        serializers.Serializer.data = _timed_data(serializers.Serializer.data)
+        serializers.ListSerializer.data = _timed_data(serializers.ListSerializer.data)
+
+        _installed = True
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        # labels -> [count per bucket..., +Inf count, sum]
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.setdefault(labels, [0] * (len(self.buckets) + 1) + [0.0])
+
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+
+        for labels, series in sorted(self.series.items()):
+            label_text = _labels(labels)
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {series[-2]}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {series[-1]}')
+            lines.append(f'{self.name}_count{{{label_text}}} {series[-2]}')
+
+        return lines
+
+
+class Counter:
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.series = {}
+
+    def inc(self, labels, amount=1):
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        lines.extend(f'{self.name}{{{_labels(labels)}}} {value}' for labels, value in sorted(self.series.items()))
+        return lines
+
+
+def _labels(labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels)
+
+
+_metrics_lock = threading.Lock()
+
+REQUESTS = Counter('http_requests_total', 'Requests by endpoint and status.')
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Time to respond, by endpoint.', DURATION_BUCKETS)
+DB_DURATION = Histogram('http_request_db_seconds', 'Time spent in SQL queries per request.', DURATION_BUCKETS)
+DB_QUERIES = Histogram('http_request_db_queries', 'SQL queries per request.', COUNT_BUCKETS)
+CACHE_DURATION = Histogram('http_request_cache_seconds', 'Time spent in cache calls per request.', DURATION_BUCKETS)
+CACHE_HITS = Counter('http_request_cache_hits_total', 'Cache reads that found a value.')
+CACHE_MISSES = Counter('http_request_cache_misses_total', 'Cache reads that found nothing.')
+REDIS_DURATION = Histogram('http_request_redis_seconds', 'Time spent in direct Redis commands per request.', DURATION_BUCKETS)
+REDIS_COMMANDS = Histogram('http_request_redis_commands', 'Direct Redis commands per request.', COUNT_BUCKETS)
+SERIALIZE_DURATION = Histogram('http_request_serialize_seconds', 'Time spent in DRF serializers per request.', DURATION_BUCKETS)
+
+REGISTRY = [
+    REQUESTS, REQUEST_DURATION, DB_DURATION, DB_QUERIES, CACHE_DURATION, CACHE_HITS, CACHE_MISSES,
+    REDIS_DURATION, REDIS_COMMANDS, SERIALIZE_DURATION,
+]
+
+
+def observe_request(method, route, status, metrics, duration):
+    labels = (('method', method), ('route', route))
+
+    with _metrics_lock:
+        REQUESTS.inc(labels + (('status', str(status)),))
+        REQUEST_DURATION.observe(labels, duration)
+        DB_DURATION.observe(labels, metrics.db_time)
+        DB_QUERIES.observe(labels, metrics.db_queries)
+        CACHE_DURATION.observe(labels, metrics.cache_time)
+        CACHE_HITS.inc(labels, metrics.cache_hits)
+        CACHE_MISSES.inc(labels, metrics.cache_misses)
+        REDIS_DURATION.observe(labels, metrics.redis_time)
+        REDIS_COMMANDS.observe(labels, metrics.redis_commands)
+        SERIALIZE_DURATION.observe(labels, metrics.serialize_time)
+
+
+def _samples(name, documentation, metric_type, samples):
+    # samples: [(labels, value)], read at scrape time
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {metric_type}']
+    lines.extend(f'{name}{{{_labels(labels)}}} {value}' if labels else f'{name} {value}' for labels, value in samples)
+    return lines
+
+
+def pool_metrics():
+    """
+    Saturation of the shared Redis pools, labelled cache or data, and of the
+    psycopg pools, when DATABASES sets OPTIONS['pool'].
+    """
+    from .redis_pool import redis_pool_stats
+
+    redis_stats = [((('pool', name),), stats) for name, stats in redis_pool_stats().items()]
+    lines = []
+
+    for name, key, documentation, metric_type in (
+        ('redis_pool_max_connections', 'max_connections', 'Size of the shared Redis pool.', 'gauge'),
+        ('redis_pool_connections_in_use', 'in_use', 'Redis connections checked out.', 'gauge'),
+        ('redis_pool_acquired_total', 'acquired', 'Redis connections handed out.', 'counter'),
+        ('redis_pool_wait_seconds_total', 'wait_seconds', 'Time spent waiting for a free Redis connection.', 'counter'),
+        ('redis_pool_timeouts_total', 'timeouts', 'Waits for a Redis connection that timed out.', 'counter'),
+    ):
+        lines.extend(_samples(name, documentation, metric_type, [(labels, stats[key]) for labels, stats in redis_stats]))
+
+    db_stats = [
+        ((('alias', connection.alias),), connection.pool.get_stats())
+        for connection in connections.all()
+        if getattr(connection, 'pool', None) is not None
+    ]
+
+    for name, key, documentation, metric_type, scale in (
+        ('db_pool_max_connections', 'pool_max', 'Size of the psycopg pool.', 'gauge', 1),
+        ('db_pool_connections', 'pool_size', 'Connections open in the psycopg pool.', 'gauge', 1),
+        ('db_pool_available_connections', 'pool_available', 'Idle connections in the psycopg pool.', 'gauge', 1),
+        ('db_pool_requests_waiting', 'requests_waiting', 'Callers waiting for a database connection.', 'gauge', 1),
+        ('db_pool_requests_total', 'requests_num', 'Database connections requested from the pool.', 'counter', 1),
+        ('db_pool_requests_wait_seconds_total', 'requests_wait_ms', 'Time spent waiting for a database connection.', 'counter', 0.001),
+        ('db_pool_requests_errors_total', 'requests_errors', 'Database connection requests that failed or timed out.', 'counter', 1),
+    ):
+        if db_stats:
+            lines.extend(_samples(name, documentation, metric_type, [(labels, stats.get(key, 0) * scale) for labels, stats in db_stats]))
+
+    return lines
+
+
+def render_metrics():
+    # Prometheus text exposition format, version 0.0.4
+    with _metrics_lock:
+        lines = [line for metric in REGISTRY for line in metric.render()]
+
+    lines.extend(pool_metrics())
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,60 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import install_instrumentation, start_request_metrics, stop_request_metrics, observe_request
+
+
+class PerformanceMiddleware:
+    """
+    Measures every request: SQL queries, cache hits and misses, direct Redis
+    commands and serializer time. Adds them as a Server-Timing header and
+    records them on the per endpoint histograms served by /metrics/.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'PERFORMANCE_SERVER_TIMING', True)
+        install_instrumentation()
+
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        metrics, token = start_request_metrics()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_request_metrics(token)
+
+        return self.finish(request, response, metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        metrics, token = start_request_metrics()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_request_metrics(token)
+
+        return self.finish(request, response, metrics, time.perf_counter() - started)
+
+    def finish(self, request, response, metrics, duration):
+        # The route pattern, not the path, so every post shares one series
+        match = getattr(request, 'resolver_match', None)
+        route = f'/{match.route}' if match else 'unmatched'
+
+        observe_request(request.method, route, response.status_code, metrics, duration)
+
+        if self.server_timing:
+            response['Server-Timing'] = metrics.server_timing(duration)
+
+        return response
@@ -0,0 +1,188 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+import time
+import weakref
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from django_redis.pool import ConnectionFactory
+
+
+class InstrumentedBlockingConnectionPool(redis.BlockingConnectionPool):
+    """
+    A BlockingConnectionPool that keeps saturation numbers: connections in use,
+    time spent waiting for a free one and waits that timed out.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.in_use = 0
+        self.acquired = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+
+    def get_connection(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            connection = super().get_connection(*args, **kwargs)
+        except redis.ConnectionError:
+            with self._stats_lock:
+                self.timeouts += 1
+                self.wait_seconds += time.perf_counter() - started
+            raise
+
+        with self._stats_lock:
+            self.in_use += 1
+            self.acquired += 1
+            self.wait_seconds += time.perf_counter() - started
+
+        return connection
+
+    def release(self, connection):
+        if self.owns_connection(connection):
+            with self._stats_lock:
+                self.in_use = max(self.in_use - 1, 0)
+        super().release(connection)
+
+    def reset(self):
+        super().reset()
+        # Also runs from BlockingConnectionPool.__init__, before the counters exist
+        if hasattr(self, '_stats_lock'):
+            with self._stats_lock:
+                self.in_use = 0
+
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+
+def get_redis_pool(url=None):
+    """
+    The process wide pool for a Redis URL, REDIS_DATA_URL by default, which
+    the counters, streams and other data of the project live in. The cache
+    gets the one of REDIS_URL through SharedConnectionFactory. Sized by
+    REDIS_POOL_MAX_CONNECTIONS, a caller waits up to REDIS_POOL_TIMEOUT
+    seconds for a free connection before failing.
+    """
+    url = url or settings.REDIS_DATA_URL
+    pool = _pools.get(url)
+
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(url)
+            if pool is None:
+                pool = _pools[url] = InstrumentedBlockingConnectionPool.from_url(
+                    url,
+                    max_connections=getattr(settings, 'REDIS_POOL_MAX_CONNECTIONS', 50),
+                    timeout=getattr(settings, 'REDIS_POOL_TIMEOUT', 5),
+                    socket_timeout=getattr(settings, 'REDIS_SOCKET_TIMEOUT', 5),
+                    socket_connect_timeout=getattr(settings, 'REDIS_SOCKET_TIMEOUT', 5),
+                    health_check_interval=30,
+                )
+
+    return pool
+
+
+def get_redis_client(url=None):
+    return redis.Redis(connection_pool=get_redis_pool(url))
+
+
+# asyncio connections belong to the event loop that opened them, so there is one client per loop and URL.
+# Under uvicorn that is one per worker, WSGI runs every async view on a loop of its own.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis_client(url=None):
+    """
+    The asyncio client of the running loop for url, REDIS_DATA_URL by
+    default, sized like the shared pools.
+    """
+    url = url or settings.REDIS_DATA_URL
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(url)
+
+    if client is None:
+        pool = redis.asyncio.BlockingConnectionPool.from_url(
+            url,
+            max_connections=getattr(settings, 'REDIS_POOL_MAX_CONNECTIONS', 50),
+            timeout=getattr(settings, 'REDIS_POOL_TIMEOUT', 5),
+            socket_timeout=getattr(settings, 'REDIS_SOCKET_TIMEOUT', 5),
+            socket_connect_timeout=getattr(settings, 'REDIS_SOCKET_TIMEOUT', 5),
+            health_check_interval=30,
+        )
+        # On the database of the shared pool, see use_redis_db
+        pool.connection_kwargs['db'] = get_redis_pool(url).connection_kwargs.get('db', 0)
+        client = clients[url] = redis.asyncio.Redis(connection_pool=pool)
+
+    return client
+
+
+@contextmanager
+def use_redis_db(db):
+    """
+    Points the shared pools, of the cache and of the data alike, at another
+    database of the same server while active, and with them every client of
+    the project. For tools like benchmark_endpoints that must not touch what
+    REDIS_URL and REDIS_DATA_URL hold.
+    """
+    pools = [get_redis_pool(), get_redis_pool(settings.REDIS_URL)]
+    originals = [pool.connection_kwargs.get('db', 0) for pool in pools]
+
+    def switch(dbs):
+        for pool, to in zip(pools, dbs):
+            pool.disconnect()
+            pool.connection_kwargs['db'] = to
+            pool.reset()
+        _async_clients.clear()
+
+    switch([db] * len(pools))
+    try:
+        yield
+    finally:
+        switch(originals)
+
+
+def configured_redis_dbs():
+    # The databases the cache and the data live in outside use_redis_db
+    return {
+        redis.connection.parse_url(url).get('db', 0)
+        for url in (settings.REDIS_URL, settings.REDIS_DATA_URL)
+    }
+
+
+class SharedConnectionFactory(ConnectionFactory):
+    """
+    Makes django-redis use the shared pool for REDIS_URL or REDIS_DATA_URL
+    instead of one of its own. Set as DJANGO_REDIS_CONNECTION_FACTORY.
+    """
+
+    def get_or_create_connection_pool(self, params):
+        if params['url'] in (settings.REDIS_URL, settings.REDIS_DATA_URL):
+            return get_redis_pool(params['url'])
+        return super().get_or_create_connection_pool(params)
+
+
+def redis_pool_stats():
+    """
+    {'cache': stats, 'data': stats} of the shared pools, one entry when both
+    URLs are the same.
+    """
+    pools = {'cache': get_redis_pool(settings.REDIS_URL)}
+    if settings.REDIS_DATA_URL != settings.REDIS_URL:
+        pools['data'] = get_redis_pool()
+
+    stats = {}
+    for name, pool in pools.items():
+        with pool._stats_lock:
+            stats[name] = {
+                'max_connections': pool.max_connections,
+                'in_use': pool.in_use,
+                'acquired': pool.acquired,
+                'wait_seconds': pool.wait_seconds,
+                'timeouts': pool.timeouts,
+            }
+
+    return stats
@@ -14,6 +14,7 @@ import os
 import environ
 from pathlib import Path
 from datetime import timedelta
+from urllib.parse import urlsplit, urlunsplit
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -44,6 +45,7 @@ DJANGO_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 PROJECTS_APPS = [
@@ -77,6 +79,7 @@ AXES_COOLOFF_TIME = lambda request: timedelta(minutes=5)
 AXES_LOCK_OUT_AT_FAILURE = True
 
 MIDDLEWARE = [
+    'core.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -120,10 +123,26 @@ DATABASES = {
         'USER': env("DATABASE_USER"),
         'PASSWORD': env("DATABASE_PASSWORD"),
         'HOST': env("DATABASE_HOST"),
-        'PORT': 5432
+        'PORT': 5432,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Under ASGI every request runs its sync code on a new thread, so persistent connections would
+# pile up, connections come from a psycopg pool instead. Without the pool (DATABASE_POOL=False)
+# connections are kept for DATABASE_CONN_MAX_AGE seconds, which suits WSGI and Celery workers.
+if env.bool('DATABASE_POOL', default=True):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': env.int('DATABASE_POOL_MIN_SIZE', default=2),
+            'max_size': env.int('DATABASE_POOL_MAX_SIZE', default=10),
+            'timeout': env.int('DATABASE_POOL_TIMEOUT', default=10),
+        }
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = env.int('DATABASE_CONN_MAX_AGE', default=60)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -231,7 +250,7 @@ DJOSER = {
     }
 }
 
-CHANNELS_LAYERS = {
+CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
@@ -241,10 +260,26 @@ CHANNELS_LAYERS = {
 }
 
 REDIS_HOST = env('REDIS_HOST')
+REDIS_URL = env('REDIS_URL')
+
+# Pending counters, view events, HLLs, live watchers and trending scores must survive cache.clear()
+# and eviction, so they live apart from the cache: in the next database of the REDIS_URL server
+# unless REDIS_DATA_URL says otherwise
+_redis_url = urlsplit(REDIS_URL)
+REDIS_DATA_URL = env(
+    'REDIS_DATA_URL',
+    default=urlunsplit(_redis_url._replace(path=f'/{int(_redis_url.path.strip("/") or 0) + 1}')),
+)
+
+# One pool per process and URL for the cache and every redis client, see core.redis_pool
+REDIS_POOL_MAX_CONNECTIONS = env.int('REDIS_POOL_MAX_CONNECTIONS', default=50)
+REDIS_POOL_TIMEOUT = env.int('REDIS_POOL_TIMEOUT', default=5)
+REDIS_SOCKET_TIMEOUT = env.int('REDIS_SOCKET_TIMEOUT', default=5)
+DJANGO_REDIS_CONNECTION_FACTORY = 'core.redis_pool.SharedConnectionFactory'
 
 CACHES = {
     'default': {
-        'BACKEND': 'django_redis.cache.RedisCache',
+        'BACKEND': 'core.cache.InstrumentedRedisCache',
         'LOCATION': env('REDIS_URL'),
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient'
@@ -253,7 +288,8 @@ CACHES = {
 }
 
 
-CHANNELS_ALLOWED_ORIGINS = 'http://localhost:3000'
+# Origins allowed to open websockets, see core.asgi
+CHANNELS_ALLOWED_ORIGINS = env.list('CHANNELS_ALLOWED_ORIGINS', default=['http://localhost:3000'])
 
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
@@ -19,6 +19,8 @@ from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
 
+from .views import metrics_view
+
 urlpatterns = [
     path('api/blog/', include('apps.blog.urls')),
     path('api/authentication/', include('apps.authentication.urls')),
@@ -27,4 +29,5 @@ urlpatterns = [
     path('auth/', include('djoser.urls.jwt')),
     # path('auth/', include('djoser.social.urls')),
     path('admin/', admin.site.urls),
+    path('metrics/', metrics_view, name='metrics'),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
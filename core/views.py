@@ -0,0 +1,61 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework_api.views import StandardAPIView
+
+from .metrics import render_metrics
+from .permissions import HasValidAPIKey
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of the request histograms of this process.
+    """
+    if getattr(settings, 'METRICS_REQUIRE_API_KEY', True) and not HasValidAPIKey().has_permission(request, None):
+        return HttpResponseForbidden()
+
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class AsyncStandardAPIView(StandardAPIView):
+    """
+    A StandardAPIView whose handlers are coroutines. Authentication, permissions,
+    exception handling and the response helpers are DRF's, but the request stays
+    on the event loop instead of taking a thread for its whole duration.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authenticators only touch the database when the request carries credentials
+            if 'HTTP_AUTHORIZATION' in request.META:
+                await sync_to_async(self.perform_authentication)(request)
+
+            self.initial(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+
+        # Rendered here, Django would otherwise render it on a thread
+        if hasattr(self.response, 'render') and not self.response.is_rendered:
+            self.response.render()
+
+        return self.response